@@ -0,0 +1,26 @@
+"""add created_at indexes to orders
+
+Revision ID: add_order_created_at_index
+Revises: add_outbox_events
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_created_at_index'
+down_revision = 'add_outbox_events'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Analytics time series and report exports filter orders by creation time
+    op.create_index('ix_taxi_orders_created_at', 'taxi_orders', ['created_at'])
+    op.create_index('ix_delivery_orders_created_at', 'delivery_orders', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_delivery_orders_created_at', table_name='delivery_orders')
+    op.drop_index('ix_taxi_orders_created_at', table_name='taxi_orders')
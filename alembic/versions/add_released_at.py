@@ -0,0 +1,37 @@
+"""add released_at to orders
+
+Revision ID: add_released_at
+Revises: change_coordinates_to_string
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_released_at'
+down_revision = 'change_coordinates_to_string'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add released_at column to taxi_orders and delivery_orders
+    op.add_column('taxi_orders', sa.Column('released_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('delivery_orders', sa.Column('released_at', sa.DateTime(timezone=True), nullable=True))
+    
+    # Existing orders were all offered to drivers when they were created
+    op.execute("UPDATE taxi_orders SET released_at = created_at")
+    op.execute("UPDATE delivery_orders SET released_at = created_at")
+    
+    # The driver feed and release queue look up pending orders by release state
+    op.create_index('ix_taxi_orders_status_released_at', 'taxi_orders', ['status', 'released_at'])
+    op.create_index('ix_delivery_orders_status_released_at', 'delivery_orders', ['status', 'released_at'])
+
+
+def downgrade():
+    op.drop_index('ix_delivery_orders_status_released_at', table_name='delivery_orders')
+    op.drop_index('ix_taxi_orders_status_released_at', table_name='taxi_orders')
+    op.drop_column('delivery_orders', 'released_at')
+    op.drop_column('taxi_orders', 'released_at')
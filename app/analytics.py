@@ -0,0 +1,237 @@
+"""
+Order analytics
+Time series of order counts and money per hour, day or week, computed with one
+grouped query per order table over a created_at range (indexed). Buckets old
+enough that their orders can no longer change are cached (Redis, or process
+memory in standalone mode), so a dashboard re-reading a long range only sends
+the newest buckets to the database.
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional
+import json
+from sqlalchemy import case, func, literal_column, select
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.dispatch import ORDER_MODELS
+from app.models import OrderStatus
+from app.utils import as_utc
+
+BUCKETS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+MAX_BUCKETS = 2000
+
+Counters = Dict[str, object]  # see _empty_counters
+
+
+def _empty_counters() -> Counters:
+    return {
+        "taxi_orders": 0,
+        "delivery_orders": 0,
+        "completed": 0,
+        "cancelled": 0,
+        "revenue": Decimal("0"),
+        "service_fee": Decimal("0"),
+    }
+
+
+def bucket_start(value: datetime, bucket: str) -> datetime:
+    """Start (UTC) of the bucket containing `value`; weeks start on Monday like date_trunc"""
+    value = as_utc(value)
+    if bucket == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def bucket_count(start: datetime, end: datetime, bucket: str) -> int:
+    """Number of buckets overlapping [start, end), without building them"""
+    first = bucket_start(start, bucket)
+    if first >= end:
+        return 0
+    return -(-(end - first) // BUCKETS[bucket])
+
+
+def bucket_range(start: datetime, end: datetime, bucket: str) -> List[datetime]:
+    """Starts of every bucket overlapping [start, end)"""
+    step = BUCKETS[bucket]
+    current = bucket_start(start, bucket)
+    starts = []
+    while current < end:
+        starts.append(current)
+        current += step
+    return starts
+
+
+def _bucket_column(model, bucket: str, dialect: str):
+    if dialect == "postgresql":
+        # Literals rather than bind parameters so GROUP BY matches the select expression
+        return func.date_trunc(literal_column(f"'{bucket}'"), func.timezone(literal_column("'UTC'"), model.created_at))
+    # SQLite keeps UTC timestamps as text
+    if bucket == "hour":
+        return func.strftime("%Y-%m-%d %H:00:00", model.created_at)
+    if bucket == "week":
+        return func.strftime("%Y-%m-%d 00:00:00", model.created_at, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-%d 00:00:00", model.created_at)
+
+
+def _parse_bucket(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return as_utc(value)
+
+
+def _query_buckets(bucket: str, start: datetime, end: datetime, region_id: Optional[int]) -> Dict[datetime, Counters]:
+    """Aggregate orders created in [start, end) per bucket, one grouped query per order table"""
+    db = SessionLocal()
+    try:
+        dialect = db.get_bind().dialect.name
+        results: Dict[datetime, Counters] = {}
+        for order_type, model in ORDER_MODELS.items():
+            completed = model.status == OrderStatus.COMPLETED
+            bucket_column = _bucket_column(model, bucket, dialect).label("bucket")
+            stmt = select(
+                bucket_column,
+                func.count(model.id),
+                func.count(case((completed, 1))),
+                func.count(case((model.status == OrderStatus.CANCELLED, 1))),
+                func.coalesce(func.sum(case((completed, model.price))), 0),
+                func.coalesce(func.sum(case((completed, model.service_fee))), 0),
+            ).where(
+                model.created_at >= start,
+                model.created_at < end
+            ).group_by("bucket")
+            if region_id:
+                stmt = stmt.where(model.from_region_id == region_id)
+
+            for key, orders, completed_count, cancelled, revenue, service_fee in db.execute(stmt):
+                counters = results.setdefault(_parse_bucket(key), _empty_counters())
+                counters[f"{order_type}_orders"] += orders
+                counters["completed"] += completed_count
+                counters["cancelled"] += cancelled
+                counters["revenue"] += Decimal(str(revenue))
+                counters["service_fee"] += Decimal(str(service_fee))
+        return results
+    finally:
+        db.close()
+
+
+class TimeseriesCache:
+    """Aggregates of settled buckets, keyed by (bucket size, region)"""
+
+    TTL = 30 * 86400
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.local: Dict[str, Dict[str, str]] = {}  # standalone mode
+
+    @property
+    def redis_pool(self):
+        return self.manager.redis_pool
+
+    @staticmethod
+    def key(bucket: str, region_id: Optional[int]) -> str:
+        return f"analytics:{bucket}:{region_id or 'all'}"
+
+    async def get_many(self, key: str, starts: List[datetime]) -> Dict[datetime, Counters]:
+        if not starts:
+            return {}
+        fields = [start.isoformat() for start in starts]
+        values = None
+        if self.redis_pool:
+            try:
+                values = await self.redis_pool.hmget(key, fields)
+            except Exception as e:
+                print(f"Redis analytics cache error: {e}")
+        if values is None:
+            values = [self.local.get(key, {}).get(field) for field in fields]
+        return {start: _decode(value) for start, value in zip(starts, values) if value is not None}
+
+    async def set_many(self, key: str, values: Dict[datetime, Counters]):
+        if not values:
+            return
+        mapping = {start.isoformat(): _encode(counters) for start, counters in values.items()}
+        if self.redis_pool:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=False)
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, self.TTL)
+                await pipe.execute()
+                return
+            except Exception as e:
+                print(f"Redis analytics cache error: {e}")
+        self.local.setdefault(key, {}).update(mapping)
+
+
+def _encode(counters: Counters) -> str:
+    return json.dumps({k: str(v) if isinstance(v, Decimal) else v for k, v in counters.items()})
+
+
+def _decode(value: str) -> Counters:
+    counters = json.loads(value)
+    counters["revenue"] = Decimal(counters["revenue"])
+    counters["service_fee"] = Decimal(counters["service_fee"])
+    return counters
+
+
+def _present(start: datetime, counters: Counters) -> dict:
+    orders = counters["taxi_orders"] + counters["delivery_orders"]
+    return {
+        "bucket_start": start.isoformat(),
+        "orders": orders,
+        "taxi_orders": counters["taxi_orders"],
+        "delivery_orders": counters["delivery_orders"],
+        "completed": counters["completed"],
+        "cancelled": counters["cancelled"],
+        "cancellation_rate": round(counters["cancelled"] / orders, 4) if orders else 0.0,
+        "revenue": str(counters["revenue"]),
+        "service_fee": str(counters["service_fee"]),
+    }
+
+
+async def order_timeseries(
+    bucket: str,
+    start: datetime,
+    end: datetime,
+    region_id: Optional[int] = None,
+    now: Optional[datetime] = None
+) -> List[dict]:
+    """
+    Per-bucket order statistics for [start, end). Revenue and service fee count
+    completed orders only. Buckets that ended more than ANALYTICS_SETTLE_TIME
+    ago come from the cache when possible.
+    """
+    now = now or datetime.now(timezone.utc)
+    step = BUCKETS[bucket]
+    starts = bucket_range(start, end, bucket)
+    settled_before = now - timedelta(seconds=settings.ANALYTICS_SETTLE_TIME)
+    settled = [s for s in starts if s + step <= settled_before]
+
+    key = analytics_cache.key(bucket, region_id)
+    cached = await analytics_cache.get_many(key, settled)
+    missing = [s for s in starts if s not in cached]
+
+    computed: Dict[datetime, Counters] = {}
+    if missing:
+        # Cached buckets are the oldest ones, so what's left is mostly one contiguous range
+        rows = await run_in_threadpool(_query_buckets, bucket, missing[0], missing[-1] + step, region_id)
+        computed = {s: rows.get(s) or _empty_counters() for s in missing}
+        settled_set = set(settled)
+        await analytics_cache.set_many(key, {s: c for s, c in computed.items() if s in settled_set})
+
+    return [_present(s, cached.get(s) or computed[s]) for s in starts]
+
+
+def _create_cache() -> TimeseriesCache:
+    from app.websocket import manager
+    return TimeseriesCache(manager)
+
+
+# Global analytics cache
+analytics_cache = _create_cache()
@@ -2,6 +2,7 @@ from pydantic_settings import BaseSettings
 from functools import lru_cache
 import os
 from pathlib import Path
+from typing import List
 
 
 class Settings(BaseSettings):
@@ -17,14 +18,69 @@ class Settings(BaseSettings):
     USER_BOT_TOKEN: str
     ADMIN_BOT_TOKEN: str
     TELEGRAM_ADMIN_CHAT_ID: str
+    BOT_CONCURRENT_UPDATES: int = 64  # updates a bot handles at once (per-chat order is kept)
+    BOT_DB_POOL_SIZE: int = 10  # async database connections per bot process
+    BOT_WEBHOOK_MODE: bool = False  # run both bots inside the API process on webhooks instead of polling (single worker only)
+    BOT_WEBHOOK_URL: str = ""  # public base URL of the API, e.g. https://api.example.com
+    BOT_WEBHOOK_SECRET: str = ""  # required in webhook mode; Telegram sends it with every update
+    TELEGRAM_API_BASE_URL: str = "https://api.telegram.org/bot"  # e.g. a local Bot API server, or a fake one in tests
+    TELEGRAM_GLOBAL_RATE: float = 30  # messages per second per bot
+    TELEGRAM_CHAT_INTERVAL: float = 1.0  # seconds between messages to the same chat
+    TELEGRAM_SEND_CONCURRENCY: int = 30  # Bot API requests in flight per bot
     
     # File Upload
     UPLOAD_DIR: str = os.path.join(os.getcwd(), "uploads")
     MAX_UPLOAD_SIZE: int = 5242880  # 5MB
+    IMAGE_MAX_PIXELS: int = 40000000  # reject larger images before decoding them
+    IMAGE_WORKERS: int = 0  # processes for decoding/resizing uploads (0 = one per CPU)
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # Celery
+    CELERY_BROKER_URL: str = ""  # defaults to REDIS_URL
+    CELERY_TASK_ALWAYS_EAGER: bool = False  # run tasks inline (tests, local development)
+    
+    # WebSocket
+    WS_HEARTBEAT_INTERVAL: int = 25  # seconds between server heartbeats
+    WS_IDLE_TIMEOUT: int = 75  # close connections that answer heartbeats but went silent for longer than this
+    WS_PRESENCE_TTL: int = 60  # presence entries older than this are stale
+    WS_REPLAY_BUFFER_SIZE: int = 1000  # events kept per stream for reconnect replay
+    WS_REPLAY_RETENTION: int = 86400  # seconds to keep per-recipient streams
+    
+    # Driver locations
+    LOCATION_MIN_INTERVAL: float = 1.0  # seconds between accepted updates per driver
+    LOCATION_MAX_SPEED_KMH: int = 250  # reject jumps faster than this
+    LOCATION_TTL: int = 120  # positions older than this are ignored
+    ACTIVE_ORDER_RECHECK: int = 30  # seconds between DB lookups for drivers with no cached order
+    
+    # Driver matching
+    MATCH_MAX_RADIUS_KM: float = 50.0  # default search radius for nearest drivers
+    MAX_ACTIVE_ORDERS_PER_DRIVER: int = 4  # drivers at this many accepted orders are skipped
+    
+    # Dispatch waves: the n-th wave offers an order to up to DISPATCH_WAVE_SIZES[n] drivers
+    # within DISPATCH_WAVE_RADII_KM[n], then everyone gets it once the waves run out
+    DISPATCH_WAVE_SIZES: List[int] = [5, 15, 40]
+    DISPATCH_WAVE_RADII_KM: List[float] = [3.0, 10.0, 30.0]
+    DISPATCH_WAVE_TIMEOUT: int = 20  # seconds before moving on to the next wave
+    
+    # Outbox relay
+    OUTBOX_BATCH_SIZE: int = 200  # events published per batch
+    OUTBOX_POLL_INTERVAL: float = 1.0  # seconds between polls when nobody wakes the relay
+    OUTBOX_RETENTION: int = 86400  # published events are deleted after this many seconds
+    
+    # Order expiry and scheduled order release
+    ORDER_TIMER_SWEEP_INTERVAL: int = 60  # seconds between database sweeps for overdue orders
+    ORDER_TIMER_BATCH_SIZE: int = 500  # max orders expired/released per UPDATE
+    SCHEDULED_ORDER_LEAD_TIME: int = 3600  # seconds before scheduled_datetime an order goes to drivers
+    
+    # Metrics (/metrics; set PROMETHEUS_MULTIPROC_DIR in the environment when running several workers)
+    METRICS_ENABLED: bool = True
+    METRICS_SAMPLE_INTERVAL: float = 1.0  # seconds between samples of pool, threadpool and connection gauges
+    
+    # Analytics
+    ANALYTICS_SETTLE_TIME: int = 172800  # buckets that ended longer ago than this are cached (their orders have settled)
+    
     # App
     APP_NAME: str = "Taxi Service"
     APP_VERSION: str = "1.0.0"
@@ -0,0 +1,314 @@
+"""
+Wave-based order dispatch
+Offers a new order to the nearest available drivers first and widens the
+circle after each wave timeout, instead of broadcasting it to every driver
+at once. A wave that finds nobody new is skipped without waiting. After the
+configured waves (or at once when nobody is near the pickup) the order is
+broadcast to all drivers until someone accepts or the acceptance window closes.
+
+The first announcement (wave 1, or the broadcast when nobody is near) is
+written to the outbox in the transaction that creates or releases the order;
+the engine only sends the later waves and the fallback broadcast.
+"""
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import asyncio
+import statistics
+import time
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.matching import order_pickup_point
+from app.models import TaxiOrder, DeliveryOrder, OrderStatus
+from app.outbox import add_event
+from app.utils import ORDER_ACCEPT_WINDOW, as_utc, build_order_event_payload
+
+OrderKey = Tuple[str, int]  # (order_type, order_id)
+
+ORDER_MODELS = {"taxi": TaxiOrder, "delivery": DeliveryOrder}
+
+
+def _order_is_pending(order_type: str, order_id: int) -> bool:
+    model = ORDER_MODELS[order_type]
+    db = SessionLocal()
+    try:
+        status = db.query(model.status).filter(model.id == order_id).scalar()
+        return status == OrderStatus.PENDING
+    finally:
+        db.close()
+
+
+def add_announcement(db: Session, payload: dict, first_wave: Sequence[int]):
+    """Queue an order's new_order event in the caller's transaction: to the first wave, or to everyone"""
+    if first_wave:
+        for driver_id in first_wave:
+            add_event(db, f"driver:{driver_id}", {"type": "new_order", "order": payload, "wave": 1})
+    else:
+        add_event(db, "drivers", {"type": "new_order", "order": payload, "wave": 0})
+
+
+def _offers_ttl() -> int:
+    """
+    How long an offer list outlives its waves. If the node running them dies,
+    the order opens to every driver once the waves would have ended.
+    """
+    return int(settings.DISPATCH_WAVE_TIMEOUT * len(settings.DISPATCH_WAVE_SIZES)) + 1
+
+
+class _Dispatch:
+    """State of one order being dispatched"""
+
+    def __init__(self, payload: dict, deadline: float):
+        self.payload = payload
+        self.deadline = deadline  # monotonic
+        self.started_at = time.monotonic()
+        self.wave = 0
+        self.offered: Set[int] = set()
+        self.broadcast = False
+        self.closed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class DispatchEngine:
+    """Runs offer waves for pending orders and records how they went"""
+
+    def __init__(self, manager, matcher):
+        self.manager = manager
+        self.matcher = matcher
+        self.active: Dict[OrderKey, _Dispatch] = {}
+
+        # Observability
+        self.counters = {
+            "dispatched": 0,
+            "accepted": 0,
+            "unaccepted": 0,
+            "waves_sent": 0,
+            "offers_sent": 0,
+        }
+        self.accepted_in_wave: Dict[int, int] = {}  # {wave number (0 = broadcast): count}
+        self.acceptance_latencies: Deque[float] = deque(maxlen=1000)  # seconds from dispatch to accept
+
+    @property
+    def redis_pool(self):
+        return self.manager.redis_pool
+
+    @staticmethod
+    def _offers_key(key: OrderKey) -> str:
+        return f"dispatch_offers:{key[0]}:{key[1]}"
+
+    async def first_wave(self, pickup: Optional[Tuple[float, float]]) -> List[int]:
+        """Drivers the first wave goes to; empty when the order should be broadcast at once"""
+        if not pickup or not settings.DISPATCH_WAVE_SIZES:
+            return []
+        candidates = await self.matcher.find_nearest(
+            pickup[0], pickup[1], k=settings.DISPATCH_WAVE_SIZES[0], radius_km=settings.DISPATCH_WAVE_RADII_KM[0]
+        )
+        return [driver_id for driver_id, _ in candidates]
+
+    async def announce(self, db: Session, order_type: str, order) -> List[int]:
+        """
+        Queue a just-released order's first announcement in the caller's transaction.
+        Pass the returned first wave to start() once the transaction is committed.
+        """
+        db.flush()
+        first_wave = await self.first_wave(order_pickup_point(order))
+        add_announcement(db, build_order_event_payload(order, order_type), first_wave)
+        return first_wave
+
+    async def start(self, order_type: str, order_id: int, payload: dict,
+                    pickup: Optional[Tuple[float, float]], created_at: Optional[datetime] = None,
+                    first_wave: Sequence[int] = ()):
+        """
+        Take over an order whose first announcement went out through the outbox
+        (see announce / add_announcement) and run the remaining waves.
+        An empty first wave means the order was broadcast to everyone.
+        """
+        key = (order_type, order_id)
+        if key in self.active:
+            return
+
+        created_at = as_utc(created_at) or datetime.now(timezone.utc)
+        remaining = (created_at + ORDER_ACCEPT_WINDOW - datetime.now(timezone.utc)).total_seconds()
+        if remaining <= 0:
+            return
+
+        dispatch = _Dispatch(payload, time.monotonic() + remaining)
+        self.active[key] = dispatch
+        self.counters["dispatched"] += 1
+        self.counters["waves_sent"] += 1
+        if first_wave:
+            dispatch.wave = 1
+            dispatch.offered.update(first_wave)
+            self.counters["offers_sent"] += len(dispatch.offered)
+        else:
+            dispatch.broadcast = True
+        dispatch.task = asyncio.create_task(self._run(key, dispatch, pickup))
+
+    async def _run(self, key: OrderKey, dispatch: _Dispatch, pickup: Optional[Tuple[float, float]]):
+        try:
+            if not dispatch.broadcast:
+                await self._record_offers(key, dispatch.offered)
+                print(f"📣 Dispatch {key[0]} #{key[1]}: wave 1 offered to {len(dispatch.offered)} driver(s) "
+                      f"within {settings.DISPATCH_WAVE_RADII_KM[0]} km")
+                if await self._wait(dispatch, settings.DISPATCH_WAVE_TIMEOUT):
+                    return
+
+                waves = list(zip(settings.DISPATCH_WAVE_SIZES, settings.DISPATCH_WAVE_RADII_KM))
+                for wave, (size, radius_km) in enumerate(waves[1:], start=2):
+                    if not await run_in_threadpool(_order_is_pending, *key):
+                        return  # accepted or cancelled on another node
+                    candidates = await self.matcher.find_nearest(
+                        pickup[0], pickup[1], k=size, radius_km=radius_km, exclude=dispatch.offered
+                    )
+                    if not candidates:
+                        continue  # nobody new in this circle: widen without waiting
+                    dispatch.wave = wave
+                    await self._offer(key, dispatch, [driver_id for driver_id, _ in candidates])
+                    print(f"📣 Dispatch {key[0]} #{key[1]}: wave {dispatch.wave} offered to "
+                          f"{len(candidates)} driver(s) within {radius_km} km")
+                    if await self._wait(dispatch, settings.DISPATCH_WAVE_TIMEOUT):
+                        return
+
+                if not await run_in_threadpool(_order_is_pending, *key):
+                    return
+                # Out of waves: fall back to every driver until the window closes
+                dispatch.broadcast = True
+                await self._open_to_all(key)
+                self.counters["waves_sent"] += 1
+                await self.manager.broadcast_to_all_drivers({
+                    "type": "new_order",
+                    "order": dispatch.payload,
+                    "wave": 0
+                })
+                print(f"📣 Dispatch {key[0]} #{key[1]}: broadcast to all drivers after {dispatch.wave} wave(s)")
+            if not await self._wait(dispatch, dispatch.deadline - time.monotonic()):
+                self.counters["unaccepted"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Dispatch error for {key[0]} #{key[1]}: {e}")
+        finally:
+            self.active.pop(key, None)
+
+    async def _offer(self, key: OrderKey, dispatch: _Dispatch, driver_ids):
+        self.counters["waves_sent"] += 1
+        dispatch.offered.update(driver_ids)
+        self.counters["offers_sent"] += len(driver_ids)
+        await self._record_offers(key, driver_ids)
+        message = {"type": "new_order", "order": dispatch.payload, "wave": dispatch.wave}
+        await asyncio.gather(*(self.manager.send_to_driver(d, message) for d in driver_ids))
+
+    async def _record_offers(self, key: OrderKey, driver_ids):
+        """Add drivers to the order's offer list in Redis so every node enforces it"""
+        if self.redis_pool:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=False)
+                pipe.sadd(self._offers_key(key), *[str(d) for d in driver_ids])
+                pipe.expire(self._offers_key(key), _offers_ttl())
+                await pipe.execute()
+            except Exception as e:
+                print(f"Redis dispatch error: {e}")
+
+    async def _open_to_all(self, key: OrderKey):
+        """Drop the offer list so every node lets any driver take the order"""
+        if self.redis_pool:
+            try:
+                await self.redis_pool.delete(self._offers_key(key))
+            except Exception as e:
+                print(f"Redis dispatch error: {e}")
+
+    @staticmethod
+    async def _wait(dispatch: _Dispatch, timeout: float) -> bool:
+        """Wait for the order to close; True if it did"""
+        timeout = min(timeout, dispatch.deadline - time.monotonic())
+        if timeout <= 0:
+            return dispatch.closed.is_set()
+        try:
+            await asyncio.wait_for(dispatch.closed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def may_lock(self, order_type: Optional[str], order_id: int, driver_id: int) -> bool:
+        """
+        Whether a driver may request the accept lock for (or accept) an order.
+        During the targeted waves only drivers the order was offered to may;
+        once the order is broadcast (or was never dispatched) anyone may.
+        """
+        candidate_types = [order_type] if order_type in ORDER_MODELS else list(ORDER_MODELS)
+        return bool(await self.lockable_orders(driver_id, [(t, order_id) for t in candidate_types]))
+
+    async def lockable_orders(self, driver_id: int, keys: Iterable[OrderKey]) -> Set[OrderKey]:
+        """The subset of orders a driver may take under may_lock's rule, with one Redis round trip"""
+        allowed: Set[OrderKey] = set()
+        remote = []
+        for key in keys:
+            dispatch = self.active.get(key)
+            if dispatch is None:
+                remote.append(key)
+            elif dispatch.broadcast or driver_id in dispatch.offered:
+                allowed.add(key)
+        if remote and self.redis_pool:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=False)
+                for key in remote:
+                    pipe.exists(self._offers_key(key))
+                    pipe.sismember(self._offers_key(key), str(driver_id))
+                replies = await pipe.execute()
+                allowed.update(
+                    key for key, exists, offered in zip(remote, replies[::2], replies[1::2])
+                    if not exists or offered
+                )
+                return allowed
+            except Exception as e:
+                print(f"Redis dispatch error: {e}")
+        allowed.update(remote)
+        return allowed
+
+    def close(self, order_type: str, order_id: int, accepted_by: Optional[int] = None):
+        """Stop dispatching an order (accepted, cancelled or expired)"""
+        dispatch = self.active.get((order_type, order_id))
+        if dispatch is None:
+            return
+        if accepted_by is not None:
+            self.counters["accepted"] += 1
+            wave = 0 if dispatch.broadcast else dispatch.wave
+            self.accepted_in_wave[wave] = self.accepted_in_wave.get(wave, 0) + 1
+            latency = time.monotonic() - dispatch.started_at
+            self.acceptance_latencies.append(latency)
+            print(f"✅ Dispatch {order_type} #{order_id}: accepted by driver {accepted_by} "
+                  f"in wave {wave or 'broadcast'} after {latency:.1f}s")
+        else:
+            self.counters["unaccepted"] += 1
+        dispatch.closed.set()
+
+    def get_stats(self) -> dict:
+        latencies = sorted(self.acceptance_latencies)
+        return {
+            **self.counters,
+            "in_progress": len(self.active),
+            "accepted_in_wave": {("broadcast" if w == 0 else str(w)): n for w, n in sorted(self.accepted_in_wave.items())},
+            "acceptance_latency_seconds": {
+                "p50": round(statistics.median(latencies), 3) if latencies else None,
+                "p95": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+                "max": round(latencies[-1], 3) if latencies else None,
+            }
+        }
+
+    async def shutdown(self):
+        for dispatch in list(self.active.values()):
+            if dispatch.task:
+                dispatch.task.cancel()
+        self.active.clear()
+
+
+def _create_dispatcher() -> DispatchEngine:
+    from app.websocket import manager
+    from app.matching import matcher
+    return DispatchEngine(manager, matcher)
+
+
+# Global dispatch engine
+dispatcher = _create_dispatcher()
@@ -0,0 +1,150 @@
+"""
+Replayable event log for WebSocket delivery
+Stamps durable events with per-stream sequence numbers so reconnecting
+clients can resume from where they left off instead of reloading everything
+"""
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import json
+import redis.asyncio as redis
+from app.config import settings
+
+
+# Event types worth replaying after a reconnect. Ephemeral events such as
+# viewer counts, heartbeats and locations are delivered live only.
+REPLAYABLE_EVENTS = {
+    "new_order",
+    "order_accepted",
+    "order_cancelled",
+    "order_completed",
+    "order_expired",
+}
+
+
+def parse_seq(seq: str) -> Optional[Tuple[int, int]]:
+    """Parse a sequence number ("<ms>-<n>", same format as Redis stream IDs)"""
+    try:
+        left, _, right = str(seq).partition("-")
+        return int(left), int(right or 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class EventLog:
+    """
+    Per-stream append-only log backed by Redis Streams, or by in-memory ring
+    buffers when running in standalone mode.
+
+    Stream names: "drivers" (broadcasts to all drivers), "driver:{id}",
+    "users" (broadcasts to all users) and "user:{id}".
+    """
+
+    def __init__(self, maxlen: int = None):
+        self.maxlen = maxlen or settings.WS_REPLAY_BUFFER_SIZE
+        self.redis_pool: Optional[redis.Redis] = None
+
+        # Standalone mode: {stream: deque([(seq, message), ...])}
+        self._buffers: Dict[str, Deque[Tuple[Tuple[int, int], dict]]] = {}
+        self._counters: Dict[str, int] = {}
+
+    @staticmethod
+    def _key(stream: str) -> str:
+        return f"ws_events:{stream}"
+
+    async def append(self, stream: str, message: dict) -> dict:
+        """Append a message to a stream and return it stamped with its sequence number"""
+        if self.redis_pool:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=False)
+                pipe.xadd(
+                    self._key(stream),
+                    {"data": json.dumps(message)},
+                    maxlen=self.maxlen,
+                    approximate=True
+                )
+                if ":" in stream:
+                    # Personal streams of clients that never come back expire
+                    pipe.expire(self._key(stream), settings.WS_REPLAY_RETENTION)
+                seq = (await pipe.execute())[0]
+                return {**message, "stream": stream, "seq": seq}
+            except Exception as e:
+                print(f"Redis event log error: {e}")
+
+        n = self._counters.get(stream, 0) + 1
+        self._counters[stream] = n
+        if stream not in self._buffers:
+            self._buffers[stream] = deque(maxlen=self.maxlen)
+        stamped = {**message, "stream": stream, "seq": f"{n}-0"}
+        self._buffers[stream].append(((n, 0), stamped))
+        return stamped
+
+    async def append_many(self, entries: List[Tuple[str, dict]]) -> List[dict]:
+        """Append several (stream, message) pairs in one round trip; returns the stamped messages"""
+        if self.redis_pool and entries:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=False)
+                for stream, message in entries:
+                    pipe.xadd(self._key(stream), {"data": json.dumps(message)}, maxlen=self.maxlen, approximate=True)
+                    if ":" in stream:
+                        pipe.expire(self._key(stream), settings.WS_REPLAY_RETENTION)
+                results = iter(await pipe.execute())
+                stamped = []
+                for stream, message in entries:
+                    seq = next(results)
+                    if ":" in stream:
+                        next(results)
+                    stamped.append({**message, "stream": stream, "seq": seq})
+                return stamped
+            except Exception as e:
+                print(f"Redis event log error: {e}")
+
+        return [await self.append(stream, message) for stream, message in entries]
+
+    async def head(self, stream: str) -> Optional[str]:
+        """Latest sequence number of a stream (None if empty)"""
+        if self.redis_pool:
+            try:
+                last = await self.redis_pool.xrevrange(self._key(stream), count=1)
+                return last[0][0] if last else None
+            except Exception as e:
+                print(f"Redis event log error: {e}")
+
+        n = self._counters.get(stream)
+        return f"{n}-0" if n else None
+
+    async def read_since(self, stream: str, seq: str) -> Optional[List[dict]]:
+        """
+        Return every message after `seq`, oldest first.
+        Returns None when the cursor can't be served (trimmed or unknown),
+        in which case the caller should send a snapshot instead.
+        """
+        cursor = parse_seq(seq)
+        if cursor is None:
+            return None
+
+        if self.redis_pool:
+            try:
+                first = await self.redis_pool.xrange(self._key(stream), count=1)
+                last = await self.redis_pool.xrevrange(self._key(stream), count=1)
+                if not last:
+                    return None
+                if cursor > parse_seq(last[0][0]) or cursor < parse_seq(first[0][0]):
+                    # Cursor from before a trim or from a reset stream
+                    return None
+                entries = await self.redis_pool.xrange(
+                    self._key(stream), min=f"({seq}", max="+", count=self.maxlen
+                )
+                return [
+                    {**json.loads(fields["data"]), "stream": stream, "seq": entry_id}
+                    for entry_id, fields in entries
+                ]
+            except Exception as e:
+                print(f"Redis event log error: {e}")
+                return None
+
+        buffer = self._buffers.get(stream)
+        if not buffer or cursor > (self._counters[stream], 0):
+            return None
+        if buffer[0][0][0] > cursor[0] + 1:
+            return None
+        return [message for entry_seq, message in buffer if entry_seq > cursor]
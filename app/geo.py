@@ -0,0 +1,142 @@
+"""
+Geographic helpers and in-memory spatial index for driver positions
+"""
+from math import asin, cos, isfinite, radians, sin, sqrt
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import heapq
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+# Grid cell size in degrees (~1.1 km of latitude)
+DEFAULT_CELL_SIZE = 0.01
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    lat1, lng1, lat2, lng2 = map(radians, (lat1, lng1, lat2, lng2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+def parse_coordinates(latitude, longitude) -> Optional[Tuple[float, float]]:
+    """
+    Parse a latitude/longitude pair (numbers or the strings stored on orders)
+    Returns None if missing or out of range
+    """
+    try:
+        lat = float(latitude)
+        lng = float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (isfinite(lat) and isfinite(lng)):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None
+    return lat, lng
+
+
+class GridIndex:
+    """
+    Uniform lat/lng grid: each driver lives in exactly one cell bucket,
+    so moving a driver is O(1) and area lookups only touch nearby cells.
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        self.positions: Dict[int, Tuple[float, float, float]] = {}  # {driver_id: (lat, lng, timestamp)}
+        self._cell_of: Dict[int, Tuple[int, int]] = {}
+
+    def cell_for(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(lat // self.cell_size), int(lng // self.cell_size)
+
+    def upsert(self, driver_id: int, lat: float, lng: float, timestamp: float):
+        """Insert or move a driver"""
+        cell = self.cell_for(lat, lng)
+        old_cell = self._cell_of.get(driver_id)
+        if old_cell != cell:
+            if old_cell is not None:
+                bucket = self.cells[old_cell]
+                bucket.discard(driver_id)
+                if not bucket:
+                    del self.cells[old_cell]
+            self.cells.setdefault(cell, set()).add(driver_id)
+            self._cell_of[driver_id] = cell
+        self.positions[driver_id] = (lat, lng, timestamp)
+
+    def remove(self, driver_id: int):
+        cell = self._cell_of.pop(driver_id, None)
+        if cell is not None:
+            bucket = self.cells[cell]
+            bucket.discard(driver_id)
+            if not bucket:
+                del self.cells[cell]
+        self.positions.pop(driver_id, None)
+
+    def get(self, driver_id: int) -> Optional[Tuple[float, float, float]]:
+        return self.positions.get(driver_id)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        max_km: Optional[float] = None,
+        accept: Optional[Callable[[int, float], bool]] = None
+    ) -> List[Tuple[float, int]]:
+        """
+        K nearest drivers to a point as [(distance_km, driver_id), ...], closest first.
+
+        Scans rings of cells outwards from the point's cell and stops once no
+        unvisited cell can hold anything closer than the current k-th result.
+        `accept(driver_id, timestamp)` filters out unavailable drivers.
+        """
+        if k <= 0 or not self.positions:
+            return []
+
+        center_x, center_y = self.cell_for(lat, lng)
+        # Smallest side of a cell in km (longitude cells shrink towards the poles)
+        cell_km = self.cell_size * KM_PER_DEGREE * max(cos(radians(min(abs(lat) + self.cell_size, 89.9))), 1e-6)
+
+        best: List[Tuple[float, int]] = []  # max-heap of the k best as (-distance, driver_id)
+        visited = 0
+        ring = 0
+        while True:
+            if ring == 0:
+                ring_cells = [(center_x, center_y)]
+            else:
+                ring_cells = [(center_x + dx, center_y + dy) for dx in (-ring, ring) for dy in range(-ring, ring + 1)]
+                ring_cells += [(center_x + dx, center_y + dy) for dy in (-ring, ring) for dx in range(-ring + 1, ring)]
+
+            for cell in ring_cells:
+                bucket = self.cells.get(cell)
+                if not bucket:
+                    continue
+                visited += len(bucket)
+                for driver_id in bucket:
+                    d_lat, d_lng, timestamp = self.positions[driver_id]
+                    if accept is not None and not accept(driver_id, timestamp):
+                        continue
+                    distance = haversine_km(lat, lng, d_lat, d_lng)
+                    if max_km is not None and distance > max_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, driver_id))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, driver_id))
+
+            # Everything in ring r+1 is at least r cells away
+            reach = ring * cell_km
+            if len(best) == k and reach >= -best[0][0]:
+                break
+            if max_km is not None and reach > max_km:
+                break
+            if visited == len(self.positions):
+                break
+            ring += 1
+
+        return sorted((-neg_distance, driver_id) for neg_distance, driver_id in best)
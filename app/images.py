@@ -0,0 +1,148 @@
+"""
+Image upload processing
+Uploaded photos are decoded, checked and re-encoded in a process pool so the
+CPU work stays off the event loop (and off the GIL). Each upload is stored as
+a re-encoded original (metadata such as GPS EXIF is dropped) plus WebP size
+variants, so clients can fetch an avatar-sized file instead of the full photo.
+Files are named by the SHA-256 of the uploaded bytes, so an image uploaded
+again is neither processed nor stored twice.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, NamedTuple, Optional
+import asyncio
+import multiprocessing
+import os
+from fastapi import UploadFile
+from PIL import Image, ImageOps
+from app.config import settings
+from app.storage import storage
+
+# Longest edge in pixels, largest first (each variant is resized from the previous one)
+IMAGE_VARIANTS = {
+    "medium": 1024,
+    "small": 320,
+    "thumb": 128,
+}
+
+ALLOWED_FORMATS = {"JPEG": "jpg", "PNG": "png"}
+
+
+class InvalidImageError(ValueError):
+    """The upload is not an image we accept"""
+
+
+class ProcessedImage(NamedTuple):
+    extension: str  # of the original
+    original: bytes
+    variants: Dict[str, bytes]  # {variant name: WebP bytes}
+    width: int
+    height: int
+
+
+def process_image(data: bytes, max_pixels: int) -> ProcessedImage:
+    """Decode, validate and re-encode an upload (runs in a worker process)"""
+    try:
+        image = Image.open(BytesIO(data))
+    except Exception:
+        raise InvalidImageError("File is not a valid image")
+    if image.format not in ALLOWED_FORMATS:
+        raise InvalidImageError("Only JPEG and PNG images are allowed")
+    # Checked from the header, before the pixels are decoded
+    if image.width * image.height > max_pixels:
+        raise InvalidImageError(f"Image is too large ({image.width}x{image.height})")
+
+    image_format = image.format
+    try:
+        image.load()
+    except Exception:
+        raise InvalidImageError("Image data is corrupt or truncated")
+    image = ImageOps.exif_transpose(image)
+
+    if image_format == "JPEG":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        original = _encode(image, "JPEG", quality=90)
+    else:
+        original = _encode(image, "PNG")
+
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    variants = {}
+    source = image
+    for name, edge in IMAGE_VARIANTS.items():
+        variant = source.copy()
+        variant.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=2.0)
+        variants[name] = _encode(variant, "WEBP", quality=80, method=4)
+        source = variant
+
+    return ProcessedImage(ALLOWED_FORMATS[image_format], original, variants, image.width, image.height)
+
+
+def _encode(image: Image.Image, image_format: str, **options) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def variant_path(path: str, variant: str) -> str:
+    """Path of a size variant next to the stored original, e.g. uploads/profiles/<sha256>_thumb.webp"""
+    stem = path.rsplit(".", 1)[0]
+    return f"{stem}_{variant}.webp"
+
+
+class ImageProcessor:
+    """Process pool for upload processing, started on first use"""
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def process(self, data: bytes) -> ProcessedImage:
+        """Process an upload in the pool; raises InvalidImageError for bad images"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_pool(), process_image, data, settings.IMAGE_MAX_PIXELS)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next upload
+            print("⚠️ Image worker pool broke, restarting it")
+            self._pool = None
+            raise
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+# Global image processor
+image_processor = ImageProcessor(settings.IMAGE_WORKERS)
+
+
+async def store_uploaded_image(file: UploadFile, kind: str) -> str:
+    """
+    Stream an uploaded image into storage, process it and store the original and
+    its variants under UPLOAD_DIR/<kind>/. Returns the original's relative path.
+    Raises UploadTooLargeError or InvalidImageError.
+    """
+    upload = await storage.receive(file, settings.MAX_UPLOAD_SIZE)
+    try:
+        names = [f"{upload.sha256}.{extension}" for extension in ALLOWED_FORMATS.values()]
+        existing = await storage.find(kind, names)
+        if existing:
+            return existing
+
+        processed = await image_processor.process(await storage.read(upload))
+        for variant, data in processed.variants.items():
+            await storage.write(kind, f"{upload.sha256}_{variant}.webp", data)
+        # Original last: once it exists, so do its variants
+        return await storage.write(kind, f"{upload.sha256}.{processed.extension}", processed.original)
+    finally:
+        await storage.discard(upload)
@@ -0,0 +1,163 @@
+"""
+Driver live-location store
+Latest positions go to a Redis GEO set (or an in-memory grid in standalone mode),
+together with the accepted orders each driver is serving so location updates
+can be forwarded to the right customers only.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import time
+import redis.asyncio as redis
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.geo import GridIndex, haversine_km, parse_coordinates
+
+GEO_KEY = "driver_locations"
+SEEN_KEY = "driver_locations:seen"  # sorted set {driver_id: last update (unix time)}
+
+
+class LocationRejected(ValueError):
+    """Raised when a location update fails validation"""
+
+
+class DriverLocationStore:
+    """Latest driver positions plus the driver -> active orders mapping"""
+
+    def __init__(self):
+        self.redis_pool: Optional[redis.Redis] = None
+
+        # Standalone mode positions
+        self.grid = GridIndex()
+
+        # Last accepted update per driver on this node: {driver_id: (lat, lng, monotonic)}
+        self._last_accepted: Dict[int, Tuple[float, float, float]] = {}
+
+        # Standalone mode: {driver_id: {"taxi:12": user_id, ...}}
+        self.active_orders: Dict[int, Dict[str, int]] = {}
+        # When the DB was last consulted for a driver with no cached orders
+        self._active_checked_at: Dict[int, float] = {}
+
+    async def update(self, driver_id: int, latitude, longitude) -> Optional[Tuple[float, float]]:
+        """
+        Validate and store a driver position.
+        Returns the parsed (lat, lng), None if the update was throttled,
+        and raises LocationRejected if it is invalid.
+        """
+        point = parse_coordinates(latitude, longitude)
+        if point is None:
+            raise LocationRejected("Invalid coordinates")
+        lat, lng = point
+
+        now = time.monotonic()
+        previous = self._last_accepted.get(driver_id)
+        if previous:
+            prev_lat, prev_lng, prev_time = previous
+            elapsed = now - prev_time
+            if elapsed < settings.LOCATION_MIN_INTERVAL:
+                return None
+            speed_kmh = haversine_km(prev_lat, prev_lng, lat, lng) / (elapsed / 3600)
+            if speed_kmh > settings.LOCATION_MAX_SPEED_KMH:
+                raise LocationRejected("Implausible jump from previous position")
+        self._last_accepted[driver_id] = (lat, lng, now)
+
+        if self.redis_pool:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=False)
+                pipe.geoadd(GEO_KEY, (lng, lat, str(driver_id)))
+                pipe.zadd(SEEN_KEY, {str(driver_id): time.time()})
+                await pipe.execute()
+                return point
+            except Exception as e:
+                print(f"Redis location error: {e}")
+
+        self.grid.upsert(driver_id, lat, lng, time.time())
+        return point
+
+    async def get(self, driver_id: int) -> Optional[Tuple[float, float]]:
+        """Latest known (lat, lng) of a driver, None if unknown or stale"""
+        if self.redis_pool:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=False)
+                pipe.geopos(GEO_KEY, str(driver_id))
+                pipe.zscore(SEEN_KEY, str(driver_id))
+                (position,), seen = await pipe.execute()
+                if position is None or seen is None or time.time() - seen > settings.LOCATION_TTL:
+                    return None
+                return position[1], position[0]
+            except Exception as e:
+                print(f"Redis location error: {e}")
+
+        entry = self.grid.get(driver_id)
+        if entry is None or time.time() - entry[2] > settings.LOCATION_TTL:
+            return None
+        return entry[0], entry[1]
+
+    def forget_driver(self, driver_id: int):
+        """Drop per-node throttle state once a driver has no connections left"""
+        self._last_accepted.pop(driver_id, None)
+
+    # ---- driver -> active orders ----
+
+    @staticmethod
+    def orders_key(driver_id: int) -> str:
+        return f"driver_active_orders:{driver_id}"
+
+    async def set_active_order(self, driver_id: int, order_type: str, order_id: int, user_id: int):
+        """Remember that a driver is serving an order for a user"""
+        field = f"{order_type}:{order_id}"
+        if self.redis_pool:
+            try:
+                await self.redis_pool.hset(self.orders_key(driver_id), field, str(user_id))
+                return
+            except Exception as e:
+                print(f"Redis location error: {e}")
+        self.active_orders.setdefault(driver_id, {})[field] = user_id
+
+    async def clear_active_order(self, driver_id: int, order_type: str, order_id: int):
+        """Forget an order once it is completed or cancelled"""
+        field = f"{order_type}:{order_id}"
+        if self.redis_pool:
+            try:
+                await self.redis_pool.hdel(self.orders_key(driver_id), field)
+                return
+            except Exception as e:
+                print(f"Redis location error: {e}")
+        orders = self.active_orders.get(driver_id)
+        if orders:
+            orders.pop(field, None)
+            if not orders:
+                del self.active_orders[driver_id]
+
+    async def get_active_orders(
+        self,
+        driver_id: int,
+        loader: Optional[Callable[[int], List[Tuple[str, int, int]]]] = None
+    ) -> List[Tuple[str, int, int]]:
+        """
+        Accepted orders a driver is serving: [(order_type, order_id, user_id), ...]
+        On a cache miss `loader` (a blocking DB lookup) is run in the threadpool,
+        at most once every ACTIVE_ORDER_RECHECK seconds per driver.
+        """
+        cached: Dict[str, int] = {}
+        if self.redis_pool:
+            try:
+                cached = {k: int(v) for k, v in (await self.redis_pool.hgetall(self.orders_key(driver_id))).items()}
+            except Exception as e:
+                print(f"Redis location error: {e}")
+                cached = self.active_orders.get(driver_id, {})
+        else:
+            cached = self.active_orders.get(driver_id, {})
+
+        if not cached and loader is not None:
+            now = time.monotonic()
+            if now - self._active_checked_at.get(driver_id, float("-inf")) >= settings.ACTIVE_ORDER_RECHECK:
+                self._active_checked_at[driver_id] = now
+                loaded = await run_in_threadpool(loader, driver_id)
+                for order_type, order_id, user_id in loaded:
+                    await self.set_active_order(driver_id, order_type, order_id, user_id)
+                return loaded
+
+        result = []
+        for field, user_id in cached.items():
+            order_type, _, order_id = field.partition(":")
+            result.append((order_type, int(order_id), user_id))
+        return result
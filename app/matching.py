@@ -0,0 +1,143 @@
+"""
+Nearest-driver candidate search
+Answers "K nearest available drivers to this pickup" from the live location
+index: Redis GEOSEARCH when Redis is available, the in-memory grid otherwise.
+Available means a fresh position, not blocked and below the active order limit.
+"""
+from typing import Iterable, List, Optional, Set, Tuple
+import time
+from app.config import settings
+from app.geo import parse_coordinates
+from app.locations import DriverLocationStore, GEO_KEY, SEEN_KEY
+
+BLOCKED_KEY = "drivers:blocked"
+
+
+def order_pickup_point(order) -> Optional[Tuple[float, float]]:
+    """(lat, lng) of a TaxiOrder/DeliveryOrder pickup, None if not given"""
+    return parse_coordinates(order.pickup_latitude, order.pickup_longitude)
+
+
+class DriverMatcher:
+    """K-nearest available driver search over a DriverLocationStore"""
+
+    def __init__(self, locations: DriverLocationStore):
+        self.locations = locations
+        self.blocked: Set[int] = set()  # standalone mode
+
+    @property
+    def redis_pool(self):
+        return self.locations.redis_pool
+
+    async def load_blocked(self, driver_ids: Iterable[int]):
+        """Replace the blocked driver set (called on startup from the database)"""
+        self.blocked = set(driver_ids)
+        if self.redis_pool:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=True)
+                pipe.delete(BLOCKED_KEY)
+                if self.blocked:
+                    pipe.sadd(BLOCKED_KEY, *[str(d) for d in self.blocked])
+                await pipe.execute()
+            except Exception as e:
+                print(f"Redis matcher error: {e}")
+
+    async def set_blocked(self, driver_id: int, blocked: bool):
+        """Keep the blocked set in sync with Driver.is_blocked"""
+        if blocked:
+            self.blocked.add(driver_id)
+        else:
+            self.blocked.discard(driver_id)
+        if self.redis_pool:
+            try:
+                if blocked:
+                    await self.redis_pool.sadd(BLOCKED_KEY, str(driver_id))
+                else:
+                    await self.redis_pool.srem(BLOCKED_KEY, str(driver_id))
+            except Exception as e:
+                print(f"Redis matcher error: {e}")
+
+    async def find_nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int = 10,
+        radius_km: Optional[float] = None,
+        exclude: Iterable[int] = ()
+    ) -> List[Tuple[int, float]]:
+        """
+        K nearest available drivers to a point as [(driver_id, distance_km), ...],
+        closest first. `exclude` skips drivers already considered (e.g. earlier waves).
+        """
+        radius_km = radius_km if radius_km is not None else settings.MATCH_MAX_RADIUS_KM
+        exclude = set(exclude)
+
+        if self.redis_pool:
+            try:
+                return await self._find_nearest_redis(lat, lng, k, radius_km, exclude)
+            except Exception as e:
+                print(f"Redis matcher error: {e}")
+
+        fresh_after = time.time() - settings.LOCATION_TTL
+        active_orders = self.locations.active_orders
+        max_load = settings.MAX_ACTIVE_ORDERS_PER_DRIVER
+        blocked = self.blocked
+
+        def accept(driver_id: int, timestamp: float) -> bool:
+            return (
+                timestamp >= fresh_after
+                and driver_id not in blocked
+                and driver_id not in exclude
+                and len(active_orders.get(driver_id, ())) < max_load
+            )
+
+        return [
+            (driver_id, distance)
+            for distance, driver_id in self.locations.grid.nearest(lat, lng, k, radius_km, accept)
+        ]
+
+    async def _find_nearest_redis(self, lat, lng, k, radius_km, exclude) -> List[Tuple[int, float]]:
+        # Over-fetch so filtering still leaves k candidates in the common case
+        fetch = max(k * 3, k + len(exclude))
+        hits = await self.redis_pool.geosearch(
+            GEO_KEY,
+            longitude=lng,
+            latitude=lat,
+            radius=radius_km,
+            unit="km",
+            sort="ASC",
+            count=fetch,
+            withdist=True
+        )
+        hits = [(member, distance) for member, distance in hits if int(member) not in exclude]
+        if not hits:
+            return []
+
+        members = [member for member, _ in hits]
+        pipe = self.redis_pool.pipeline(transaction=False)
+        pipe.zmscore(SEEN_KEY, members)
+        pipe.smismember(BLOCKED_KEY, members)
+        for member in members:
+            pipe.hlen(self.locations.orders_key(int(member)))
+        seen, blocked, *loads = await pipe.execute()
+
+        fresh_after = time.time() - settings.LOCATION_TTL
+        result = []
+        for (member, distance), last_seen, is_blocked, load in zip(hits, seen, blocked, loads):
+            if last_seen is None or last_seen < fresh_after or is_blocked:
+                continue
+            if load >= settings.MAX_ACTIVE_ORDERS_PER_DRIVER:
+                continue
+            result.append((int(member), float(distance)))
+            if len(result) == k:
+                break
+        return result
+
+
+def _create_matcher() -> DriverMatcher:
+    from app.websocket import manager
+    return DriverMatcher(manager.locations)
+
+
+# Global matcher over the connection manager's location store
+matcher = _create_matcher()
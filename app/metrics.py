@@ -0,0 +1,245 @@
+"""
+Prometheus metrics
+HTTP requests per route template, database pool and worker threadpool usage,
+Redis command latency, WebSocket connections and the pub/sub listener's
+message rate and lag, served in the Prometheus text format on /metrics.
+
+With several worker processes (gunicorn -w N, uvicorn --workers N) set the
+PROMETHEUS_MULTIPROC_DIR environment variable to an empty directory, created
+fresh before the server starts: every worker then writes its samples there and
+/metrics, whichever worker answers it, reports all of them. Gauges are summed
+over the live workers.
+"""
+from typing import Dict, Optional
+import asyncio
+import os
+import time
+import anyio.to_thread
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from app.config import settings
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Seconds; most requests are well under 100 ms, slow exports and uploads take seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request, until the response is sent",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled", multiprocess_mode="livesum"
+)
+
+DB_POOL_SIZE = Gauge("db_pool_size", "Database connections the pool keeps", multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections in use", multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Database connections open beyond the pool size", multiprocess_mode="livesum")
+
+THREADPOOL_CAPACITY = Gauge(
+    "threadpool_capacity", "Worker threads for sync routes and run_in_threadpool", multiprocess_mode="livesum"
+)
+THREADPOOL_IN_USE = Gauge("threadpool_in_use", "Worker threads busy", multiprocess_mode="livesum")
+THREADPOOL_WAITING = Gauge("threadpool_waiting", "Calls waiting for a free worker thread", multiprocess_mode="livesum")
+
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds", "Redis round trip per command (PIPELINE for a whole pipeline)",
+    ["client", "command"], buckets=REDIS_BUCKETS
+)
+REDIS_ERRORS = Counter("redis_command_errors_total", "Redis commands that raised", ["client", "command"])
+
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections", "Open WebSocket connections", ["kind"], multiprocess_mode="livesum"
+)
+PUBSUB_MESSAGES = Counter("pubsub_messages_total", "Messages received by the Redis pub/sub listener", ["channel"])
+PUBSUB_LAG = Histogram(
+    "pubsub_lag_seconds", "Time from publishing a message to the listener handling it",
+    ["channel"], buckets=LATENCY_BUCKETS
+)
+
+
+class MetricsMiddleware:
+    """
+    Counts and times HTTP requests by route template (/api/taxi-orders/{order_id}),
+    never by raw path, so label cardinality stays bounded. Requests no route
+    matched are labelled "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    def _route_template(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        template = self._routes.get(endpoint)
+        if template is None:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    template = route.path
+                    break
+            template = self._routes.setdefault(endpoint, template or "unmatched")
+        return template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            route = self._route_template(scope)
+            method = scope["method"]
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+
+def instrument_redis(client, name: str):
+    """Time every command (and every pipeline as a whole) a Redis client sends"""
+    execute_command = client.execute_command
+    make_pipeline = client.pipeline
+
+    def observe(command: str, started: float, failed: bool):
+        REDIS_LATENCY.labels(name, command).observe(time.perf_counter() - started)
+        if failed:
+            REDIS_ERRORS.labels(name, command).inc()
+
+    if asyncio.iscoroutinefunction(execute_command):
+        async def timed_command(*args, **options):
+            started, failed = time.perf_counter(), True
+            try:
+                result = await execute_command(*args, **options)
+                failed = False
+                return result
+            finally:
+                observe(str(args[0]).upper(), started, failed)
+
+        def timed_pipeline(*args, **kwargs):
+            pipe = make_pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def timed_execute(*execute_args, **execute_kwargs):
+                started, failed = time.perf_counter(), True
+                try:
+                    result = await execute(*execute_args, **execute_kwargs)
+                    failed = False
+                    return result
+                finally:
+                    observe("PIPELINE", started, failed)
+
+            pipe.execute = timed_execute
+            return pipe
+    else:
+        def timed_command(*args, **options):
+            started, failed = time.perf_counter(), True
+            try:
+                result = execute_command(*args, **options)
+                failed = False
+                return result
+            finally:
+                observe(str(args[0]).upper(), started, failed)
+
+        def timed_pipeline(*args, **kwargs):
+            pipe = make_pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def timed_execute(*execute_args, **execute_kwargs):
+                started, failed = time.perf_counter(), True
+                try:
+                    result = execute(*execute_args, **execute_kwargs)
+                    failed = False
+                    return result
+                finally:
+                    observe("PIPELINE", started, failed)
+
+            pipe.execute = timed_execute
+            return pipe
+
+    client.execute_command = timed_command
+    client.pipeline = timed_pipeline
+    return client
+
+
+def observe_pubsub_message(channel: str, sent_at: Optional[float]):
+    """Count a message the pub/sub listener received and how long it took to arrive"""
+    PUBSUB_MESSAGES.labels(channel).inc()
+    if sent_at is not None:
+        # Wall clocks of different servers: negative means clock skew, not time travel
+        PUBSUB_LAG.labels(channel).observe(max(time.time() - sent_at, 0.0))
+
+
+class MetricsSampler:
+    """Samples gauges that have no natural update point (pools, connections) once per interval"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self):
+        from app.database import engine
+        from app.websocket import manager
+
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            DB_POOL_CHECKED_OUT.set(pool.checkedout())
+        if hasattr(pool, "size") and hasattr(pool, "overflow"):
+            DB_POOL_SIZE.set(pool.size())
+            DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        THREADPOOL_CAPACITY.set(limiter.total_tokens)
+        THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+        THREADPOOL_WAITING.set(limiter.statistics().tasks_waiting)
+
+        WEBSOCKET_CONNECTIONS.labels("driver").set(sum(len(s) for s in manager.driver_connections.values()))
+        WEBSOCKET_CONNECTIONS.labels("user").set(sum(len(s) for s in manager.user_connections.values()))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"⚠️ Metrics sampling error: {e}")
+            await asyncio.sleep(settings.METRICS_SAMPLE_INTERVAL)
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if MULTIPROCESS:
+            # This worker's gauges stop counting towards the live sums
+            multiprocess.mark_process_dead(os.getpid())
+
+
+def render_metrics() -> bytes:
+    """All metrics in the Prometheus text format (every worker's, in multiprocess mode)"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+# Global sampler
+metrics_sampler = MetricsSampler()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Numeric, Enum as SQLEnum, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Numeric, Enum as SQLEnum, Text, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -134,6 +134,7 @@ class TaxiOrder(Base):
     time_start = Column(String(5), nullable=False)  # HH:MM
     time_end = Column(String(5), nullable=False)  # HH:MM
     scheduled_datetime = Column(DateTime(timezone=True), nullable=True)  # Scheduled pickup datetime
+    released_at = Column(DateTime(timezone=True), nullable=True)  # Offered to drivers; NULL while a scheduled order is held back
     price = Column(Numeric(10, 2), nullable=False)
     service_fee = Column(Numeric(10, 2), default=Decimal("0.00"), nullable=False)  # 8% platform fee
     driver_earnings = Column(Numeric(10, 2), default=Decimal("0.00"), nullable=False)  # Driver's portion after fee
@@ -154,6 +155,11 @@ class TaxiOrder(Base):
     to_region = relationship("Region", foreign_keys=[to_region_id])
     to_district = relationship("District", foreign_keys=[to_district_id])
     rating = relationship("Rating", back_populates="taxi_order", uselist=False)
+    
+    __table_args__ = (
+        Index("ix_taxi_orders_status_released_at", "status", "released_at"),
+        Index("ix_taxi_orders_created_at", "created_at"),
+    )
 
 
 class DeliveryOrder(Base):
@@ -180,6 +186,7 @@ class DeliveryOrder(Base):
     time_start = Column(String(5), nullable=False)  # HH:MM
     time_end = Column(String(5), nullable=False)  # HH:MM
     scheduled_datetime = Column(DateTime(timezone=True), nullable=True)  # Scheduled pickup datetime
+    released_at = Column(DateTime(timezone=True), nullable=True)  # Offered to drivers; NULL while a scheduled order is held back
     price = Column(Numeric(10, 2), nullable=False)
     service_fee = Column(Numeric(10, 2), default=Decimal("0.00"), nullable=False)  # 8% platform fee
     driver_earnings = Column(Numeric(10, 2), default=Decimal("0.00"), nullable=False)  # Driver's portion after fee
@@ -200,6 +207,11 @@ class DeliveryOrder(Base):
     to_region = relationship("Region", foreign_keys=[to_region_id])
     to_district = relationship("District", foreign_keys=[to_district_id])
     rating = relationship("Rating", back_populates="delivery_order", uselist=False)
+    
+    __table_args__ = (
+        Index("ix_delivery_orders_status_released_at", "status", "released_at"),
+        Index("ix_delivery_orders_created_at", "created_at"),
+    )
 
 
 class Rating(Base):
@@ -324,3 +336,18 @@ class SystemSettings(Base):
     
     # Relationships
     admin = relationship("User", foreign_keys=[updated_by])
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    stream = Column(String(50), nullable=False)  # "drivers", "users", "driver:{id}" or "user:{id}"
+    payload = Column(Text, nullable=False)  # JSON WebSocket message
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    published_at = Column(DateTime(timezone=True), nullable=True)  # NULL until relayed
+    
+    __table_args__ = (
+        # The relay only ever scans unpublished events
+        Index("ix_outbox_events_unpublished", "id", postgresql_where=text("published_at IS NULL")),
+    )
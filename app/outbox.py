@@ -0,0 +1,135 @@
+"""
+Transactional outbox for WebSocket events
+Routes add events to the outbox_events table in the same transaction as the
+order change they describe; the relay drains the table in batches and
+publishes them through the connection manager (Redis, or local sockets in
+standalone mode). Delivery is at-least-once: an event is only marked as
+published after it went out, so a crash in between republishes it.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+import asyncio
+import json
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.models import OutboxEvent
+from app.websocket import manager, convert_decimal_to_float
+
+
+def add_event(db: Session, stream: str, message: dict):
+    """
+    Queue a WebSocket event in the current transaction (nothing is sent until commit)
+    Streams: "drivers", "users", "driver:{id}" or "user:{id}"
+    """
+    db.add(OutboxEvent(stream=stream, payload=json.dumps(convert_decimal_to_float(message))))
+
+
+class OutboxRelay:
+    """Publishes committed outbox events in batches"""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def wake(self):
+        """
+        Drain now instead of waiting for the next poll (call after committing events)
+        Safe to call from sync routes running in the threadpool.
+        """
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if self._loop is not None and not on_loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        else:
+            self._wakeup.set()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        last_cleanup = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self._wakeup.clear()
+                published = await self.drain()
+                if loop.time() - last_cleanup > 3600:
+                    last_cleanup = loop.time()
+                    await run_in_threadpool(_delete_published, datetime.now(timezone.utc) - timedelta(seconds=settings.OUTBOX_RETENTION))
+                if published == settings.OUTBOX_BATCH_SIZE:
+                    continue  # more waiting
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Outbox relay error: {e}")
+                await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL)
+
+    async def drain(self) -> int:
+        """Publish one batch of pending events; returns how many were published"""
+        db = SessionLocal()
+        try:
+            events = await run_in_threadpool(_claim_batch, db)
+            if not events:
+                db.rollback()
+                return 0
+            await self.manager.publish_many([(event.stream, json.loads(event.payload)) for event in events])
+            await run_in_threadpool(_mark_published, db, events)
+            return len(events)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Flush what is already committed
+        try:
+            while await self.drain() == settings.OUTBOX_BATCH_SIZE:
+                pass
+        except Exception as e:
+            print(f"Outbox relay error: {e}")
+
+
+def _claim_batch(db: Session) -> List[OutboxEvent]:
+    # SKIP LOCKED lets several API nodes relay side by side without publishing twice
+    return db.query(OutboxEvent).filter(
+        OutboxEvent.published_at.is_(None)
+    ).order_by(OutboxEvent.id).limit(settings.OUTBOX_BATCH_SIZE).with_for_update(skip_locked=True).all()
+
+
+def _mark_published(db: Session, events: List[OutboxEvent]):
+    db.query(OutboxEvent).filter(OutboxEvent.id.in_([event.id for event in events])).update(
+        {OutboxEvent.published_at: datetime.now(timezone.utc)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def _delete_published(before: datetime):
+    db = SessionLocal()
+    try:
+        db.query(OutboxEvent).filter(OutboxEvent.published_at < before).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+# Global outbox relay
+outbox_relay = OutboxRelay(manager)
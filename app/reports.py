@@ -0,0 +1,176 @@
+"""
+Reports and data exports
+- The orders workbook reads rows through a server-side cursor (yield_per) and
+  writes them into an openpyxl write-only workbook, which flushes each row to
+  a temporary file as it is appended.
+- CSV / NDJSON table exports stream the same kind of cursor straight into the
+  response body, one chunk per batch, for incremental warehouse syncs.
+Neither keeps the result set in memory, so exporting millions of rows costs
+about as much RAM as exporting a hundred.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Iterator, Optional
+import csv
+import enum
+import io
+import json
+from openpyxl import Workbook
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.dispatch import ORDER_MODELS
+from app.models import OrderStatus, Region, TaxiOrder, DeliveryOrder, BalanceTransaction, Rating
+
+REPORT_BATCH_SIZE = 2000
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+ORDER_REPORT_HEADER = (
+    "Type", "Order ID", "Status", "Created At (UTC)", "Accepted At (UTC)",
+    "Completed At (UTC)", "Cancelled At (UTC)", "Customer", "Telephone",
+    "From Region", "To Region", "Driver ID", "Price", "Service Fee",
+    "Driver Earnings", "Cancellation Reason",
+)
+ORDER_REPORT_WIDTHS = (10, 10, 12, 20, 20, 20, 20, 24, 16, 20, 20, 10, 12, 12, 14, 40)
+
+
+def _excel_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    # Excel has no time zones: write naive UTC
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def iter_order_rows(
+    db: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    region_id: Optional[int] = None,
+    order_status: Optional[OrderStatus] = None,
+    order_type: Optional[str] = None,
+    batch_size: int = REPORT_BATCH_SIZE
+) -> Iterator[tuple]:
+    """
+    Yield one report row per order matching the filters, taxi orders first.
+    region_id matches either end of the trip; date_to is inclusive.
+    """
+    regions = dict(db.query(Region.id, Region.name_uz_latin).all())
+
+    for current_type, model in ORDER_MODELS.items():
+        if order_type and order_type != current_type:
+            continue
+        telephone = model.telephone if model is TaxiOrder else model.sender_telephone
+        stmt = select(
+            model.id, model.status, model.created_at, model.accepted_at, model.completed_at,
+            model.cancelled_at, model.username, telephone, model.from_region_id, model.to_region_id,
+            model.driver_id, model.price, model.service_fee, model.driver_earnings, model.cancellation_reason
+        ).order_by(model.id)
+        if date_from:
+            stmt = stmt.where(model.created_at >= datetime.combine(date_from, time.min, timezone.utc))
+        if date_to:
+            stmt = stmt.where(model.created_at < datetime.combine(date_to + timedelta(days=1), time.min, timezone.utc))
+        if region_id:
+            stmt = stmt.where((model.from_region_id == region_id) | (model.to_region_id == region_id))
+        if order_status:
+            stmt = stmt.where(model.status == order_status)
+
+        # yield_per streams from a server-side cursor instead of buffering the whole result
+        for (order_id, status_, created_at, accepted_at, completed_at, cancelled_at, username, phone,
+             from_region_id, to_region_id, driver_id, price, service_fee, driver_earnings,
+             cancellation_reason) in db.execute(stmt.execution_options(yield_per=batch_size)):
+            yield (
+                current_type, order_id, status_.value, _excel_datetime(created_at),
+                _excel_datetime(accepted_at), _excel_datetime(completed_at), _excel_datetime(cancelled_at),
+                username, phone, regions.get(from_region_id), regions.get(to_region_id), driver_id,
+                price, service_fee, driver_earnings, cancellation_reason,
+            )
+
+
+def write_orders_xlsx(rows: Iterator[tuple], path: str) -> int:
+    """Write report rows to an .xlsx file at `path`; returns the number of orders written"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Orders")
+    for index, width in enumerate(ORDER_REPORT_WIDTHS):
+        sheet.column_dimensions[chr(ord("A") + index)].width = width
+    sheet.freeze_panes = "A2"
+    sheet.append(ORDER_REPORT_HEADER)
+
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(path)
+    return count
+
+
+# Tables available as CSV / NDJSON exports, by URL name
+EXPORT_MODELS = {
+    "taxi_orders": TaxiOrder,
+    "delivery_orders": DeliveryOrder,
+    "balance_transactions": BalanceTransaction,
+    "ratings": Rating,
+}
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",  # Starlette adds the charset
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _export_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)  # keep money exact
+    return value
+
+
+def iter_export(
+    model,
+    export_format: str,
+    since_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    batch_size: int = REPORT_BATCH_SIZE
+) -> Iterator[str]:
+    """
+    Yield a table export in chunks of `batch_size` rows, ordered by id.
+    Only rows with id > since_id are included, so a consumer can resume from
+    the last id it stored. Opens its own session because it keeps running
+    after the request handler has returned.
+    """
+    columns = list(model.__table__.columns)
+    stmt = select(*columns).order_by(model.id)
+    if since_id is not None:
+        stmt = stmt.where(model.id > since_id)
+    if limit:
+        stmt = stmt.limit(limit)
+
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if export_format == "csv" else None
+        if writer:
+            writer.writerow([column.name for column in columns])
+            yield buffer.getvalue()
+
+        result = db.execute(stmt.execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            if writer:
+                writer.writerows([_export_value(value) for value in row] for row in rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(
+                        {column.name: _export_value(value) for column, value in zip(columns, row)},
+                        ensure_ascii=False
+                    ))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+    finally:
+        db.close()
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from anyio import from_thread
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract
-from typing import List
+from typing import List, Optional
 from datetime import datetime, date, timezone
 from decimal import Decimal
 from app.database import get_db
@@ -19,6 +20,9 @@ from app.schemas import (
 )
 from app.auth import get_current_admin, get_current_superadmin
 from app.utils import create_notification, get_service_fee_percentage
+from app.matching import matcher
+from app.tasks import enqueue, broadcast_notification_task
+from app.analytics import BUCKETS, MAX_BUCKETS, bucket_count, order_timeseries
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
@@ -149,6 +153,7 @@ def block_driver(
     
     driver.is_blocked = True
     db.commit()
+    from_thread.run(matcher.set_blocked, driver_id, True)  # matcher state lives on the event loop
     
     # Notify driver
     create_notification(
@@ -179,6 +184,7 @@ def unblock_driver(
     
     driver.is_blocked = False
     db.commit()
+    from_thread.run(matcher.set_blocked, driver_id, False)  # matcher state lives on the event loop
     
     # Notify driver
     create_notification(
@@ -307,51 +313,22 @@ def broadcast_message(
     db: Session = Depends(get_db)
 ):
     """Broadcast message to users or drivers"""
-    if message_data.target == "users":
-        users = db.query(User).filter(User.is_active == True).all()
-        for user in users:
-            create_notification(
-                db=db,
-                title=message_data.title,
-                message=message_data.message,
-                notification_type="broadcast",
-                user_id=user.id
-            )
-    elif message_data.target == "drivers":
-        drivers = db.query(Driver).filter(Driver.is_blocked == False).all()
-        for driver in drivers:
-            create_notification(
-                db=db,
-                title=message_data.title,
-                message=message_data.message,
-                notification_type="broadcast",
-                driver_id=driver.id
-            )
-    elif message_data.target == "all":
-        users = db.query(User).filter(User.is_active == True).all()
-        for user in users:
-            create_notification(
-                db=db,
-                title=message_data.title,
-                message=message_data.message,
-                notification_type="broadcast",
-                user_id=user.id
-            )
-        drivers = db.query(Driver).filter(Driver.is_blocked == False).all()
-        for driver in drivers:
-            create_notification(
-                db=db,
-                title=message_data.title,
-                message=message_data.message,
-                notification_type="broadcast",
-                driver_id=driver.id
-            )
-    else:
+    if message_data.target not in ("users", "drivers", "all"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid target. Must be 'users', 'drivers', or 'all'"
         )
     
+    # Fan-out runs in the background worker; Telegram copies go through the rate-limited queue
+    enqueue(
+        broadcast_notification_task,
+        message_data.target,
+        message_data.title,
+        message_data.message,
+        "broadcast",
+        telegram=True
+    )
+    
     return {"success": True, "message": "Message broadcasted successfully"}
 
 
@@ -421,6 +398,50 @@ def get_order_statistics(
     }
 
 
+@router.get("/analytics/timeseries")
+async def get_order_timeseries(
+    bucket: str = "day",  # hour, day, week
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    region_id: Optional[int] = Query(None, alias="region"),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Order counts, revenue, service fee and cancellation rate per hour, day or week.
+    The range defaults to the last 30 buckets and is widened to whole (UTC) buckets;
+    region filters by pickup region. Revenue and service fee count completed orders.
+    """
+    if bucket not in BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid bucket. Must be 'hour', 'day', or 'week'"
+        )
+    end = end or datetime.now(timezone.utc)
+    start = start or end - 30 * BUCKETS[bucket]
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'from' must be before 'to'"
+        )
+    if bucket_count(start, end, bucket) > MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too large: at most {MAX_BUCKETS} buckets per request"
+        )
+
+    return {
+        "bucket": bucket,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "region_id": region_id,
+        "series": await order_timeseries(bucket, start, end, region_id)
+    }
+
+
 @router.get("/feedback", response_model=List[FeedbackResponse])
 def get_feedback(
     current_user: User = Depends(get_current_admin),
@@ -10,10 +10,9 @@ from app.auth import (
     get_password_hash, verify_password, create_access_token,
     get_current_user
 )
-import os
-import shutil
 from app.config import settings
-from pathlib import Path
+from app.images import store_uploaded_image, variant_path, InvalidImageError, IMAGE_VARIANTS
+from app.storage import UploadTooLargeError
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -116,39 +115,21 @@ async def upload_profile_picture(
                 detail="Only JPEG and PNG images are allowed"
             )
         
-        # Validate file size
-        file.file.seek(0, 2)
-        file_size = file.file.tell()
-        file.file.seek(0)
-        
-        if file_size > settings.MAX_UPLOAD_SIZE:
+        # Stream to storage, then decode, validate and resize in the image worker pool
+        try:
+            relative_path = await store_uploaded_image(file, "profiles")
+        except (InvalidImageError, UploadTooLargeError) as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File size exceeds maximum allowed size of {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+                detail=str(e)
             )
-        
-        # Create upload directory if not exists
-        upload_dir = Path(settings.UPLOAD_DIR) / "profiles"
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Generate unique filename
-        import time
-        file_extension = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-        filename = f"user_{current_user.id}_{int(time.time())}.{file_extension}"
-        file_path = upload_dir / filename
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Update user profile picture path - use relative path
-        relative_path = f"uploads/profiles/{filename}"
         current_user.profile_picture = relative_path
         db.commit()
         
         return {
             "message": "Profile picture uploaded successfully",
-            "file_path": relative_path
+            "file_path": relative_path,
+            "variants": {variant: variant_path(relative_path, variant) for variant in IMAGE_VARIANTS}
         }
     except HTTPException:
         raise
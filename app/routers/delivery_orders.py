@@ -1,3 +1,4 @@
+from anyio import from_thread
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -6,8 +7,16 @@ from app.database import get_db
 from app.models import User, DeliveryOrder, OrderStatus, Driver, UserRole
 from app.schemas import DeliveryOrderCreate, DeliveryOrderResponse, OrderCancellation, BulkDeleteRequest
 from app.auth import get_current_user
-from app.utils import calculate_delivery_price, notify_all_drivers, create_notification, calculate_service_fee
+from app.utils import (
+    calculate_delivery_price, create_notification,
+    calculate_service_fee
+)
 from app.websocket import manager
+from app.dispatch import dispatcher
+from app.outbox import add_event, outbox_relay
+from app.scheduler import release_queue, is_due_for_release
+from app.tasks import enqueue_async, broadcast_notification_task
+from app.serializers import ORJSONResponse, DELIVERY_ORDER, parse_fields
 
 router = APIRouter(prefix="/api/delivery-orders", tags=["Delivery Orders"])
 
@@ -54,41 +63,33 @@ async def create_delivery_order(
         service_fee=service_fee,
         driver_earnings=driver_earnings,
         note=order_data.note,
-        status=OrderStatus.PENDING
+        status=OrderStatus.PENDING,
+        # Orders scheduled further ahead wait in the release queue
+        released_at=datetime.now(timezone.utc) if is_due_for_release(order_data.scheduled_datetime) else None
     )
     
     db.add(new_order)
+    first_wave = []
+    if new_order.released_at is not None:
+        # Announce to the nearest drivers (or everyone) in the same transaction (outbox)
+        first_wave = await dispatcher.announce(db, "delivery", new_order)
     db.commit()
+    outbox_relay.wake()
     db.refresh(new_order)
     
-    # Notify all drivers via database
-    notify_all_drivers(
-        db=db,
-        title="New Delivery Order",
-        message=f"New delivery order from region {order_data.from_region_id} to {order_data.to_region_id}"
-    )
+    if new_order.released_at is not None:
+        # Notify all drivers via database (in the background worker)
+        await enqueue_async(
+            broadcast_notification_task,
+            "drivers",
+            "New Delivery Order",
+            f"New delivery order from region {order_data.from_region_id} to {order_data.to_region_id}",
+            "new_order"
+        )
     
-    # Broadcast to all drivers via WebSocket
-    import asyncio
-    order_data_dict = {
-        "id": new_order.id,
-        "type": "delivery",
-        "from_region_id": new_order.from_region_id,
-        "to_region_id": new_order.to_region_id,
-        "item_type": new_order.item_type.value,
-        "price": float(new_order.price),
-        "service_fee": float(new_order.service_fee),
-        "driver_earnings": float(new_order.driver_earnings),
-        "date": new_order.date,
-        "time_start": new_order.time_start,
-        "time_end": new_order.time_end,
-        "scheduled_datetime": new_order.scheduled_datetime.isoformat() if new_order.scheduled_datetime else None,
-        "created_at": new_order.created_at.isoformat()
-    }
-    asyncio.create_task(manager.broadcast_to_all_drivers({
-        "type": "new_order",
-        "order": order_data_dict
-    }))
+    # Widen the offer in further waves (WebSocket),
+    # or hold a scheduled order until its release time
+    await release_queue.submit("delivery", new_order, first_wave)
     
     return new_order
 
@@ -96,6 +97,7 @@ async def create_delivery_order(
 @router.get("/", response_model=List[DeliveryOrderResponse])
 def get_all_delivery_orders(
     status_filter: Optional[OrderStatus] = None,
+    fields: Optional[str] = None,  # comma-separated subset of fields, e.g. id,price,status
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -105,36 +107,45 @@ def get_all_delivery_orders(
     if status_filter:
         query = query.filter(DeliveryOrder.status == status_filter)
     
+    query, encode = DELIVERY_ORDER.select(query, parse_fields(fields, DELIVERY_ORDER))
     orders = query.order_by(DeliveryOrder.created_at.desc()).all()
-    return orders
+    return ORJSONResponse([encode(order) for order in orders])
 
 
 @router.get("/active", response_model=List[DeliveryOrderResponse])
 def get_active_delivery_orders(
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get active delivery orders (pending or accepted)"""
-    orders = db.query(DeliveryOrder).filter(
+    query = db.query(DeliveryOrder).filter(
         DeliveryOrder.user_id == current_user.id,
         DeliveryOrder.status.in_([OrderStatus.PENDING, OrderStatus.ACCEPTED])
-    ).order_by(DeliveryOrder.created_at.desc()).all()
+    )
+    
+    query, encode = DELIVERY_ORDER.select(query, parse_fields(fields, DELIVERY_ORDER))
+    orders = query.order_by(DeliveryOrder.created_at.desc()).all()
     
-    return orders
+    return ORJSONResponse([encode(order) for order in orders])
 
 
 @router.get("/history", response_model=List[DeliveryOrderResponse])
 def get_delivery_order_history(
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get completed and cancelled delivery orders"""
-    orders = db.query(DeliveryOrder).filter(
+    query = db.query(DeliveryOrder).filter(
         DeliveryOrder.user_id == current_user.id,
         DeliveryOrder.status.in_([OrderStatus.COMPLETED, OrderStatus.CANCELLED])
-    ).order_by(DeliveryOrder.completed_at.desc()).all()
+    )
+    
+    query, encode = DELIVERY_ORDER.select(query, parse_fields(fields, DELIVERY_ORDER))
+    orders = query.order_by(DeliveryOrder.completed_at.desc()).all()
     
-    return orders
+    return ORJSONResponse([encode(order) for order in orders])
 
 
 @router.get("/{order_id}", response_model=DeliveryOrderResponse)
@@ -329,7 +340,15 @@ def cancel_delivery_order(
     order.cancellation_reason = cancellation.cancellation_reason
     order.cancelled_at = datetime.now(timezone.utc)
     
+    # Tell drivers to drop the order from their lists (WebSocket)
+    add_event(db, "drivers", {
+        "type": "order_cancelled",
+        "order_id": order.id,
+        "order_type": "delivery"
+    })
+    
     db.commit()
+    outbox_relay.wake()
     db.refresh(order)
     
     # Notify driver if order was accepted
@@ -344,6 +363,11 @@ def cancel_delivery_order(
                 driver_id=driver.id
             )
     
+    # Location routing and dispatch state live on the event loop
+    if order.driver_id:
+        from_thread.run(manager.locations.clear_active_order, order.driver_id, "delivery", order.id)
+    from_thread.run_sync(dispatcher.close, "delivery", order.id)
+    
     # Notify user
     create_notification(
         db=db,
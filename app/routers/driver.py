@@ -1,11 +1,10 @@
+from anyio import from_thread
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, extract
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-import shutil
-from pathlib import Path
 from app.database import get_db
 from app.models import (
     User, Driver, DriverApplication, ApplicationStatus, 
@@ -16,9 +15,19 @@ from app.schemas import (
     DriverUpdate, DriverResponse, DriverStatistics
 )
 from app.auth import get_current_user, get_current_driver
-from app.utils import check_driver_can_accept_order, create_notification
+from app.utils import check_driver_can_accept_order, create_notification, as_utc, ORDER_ACCEPT_WINDOW
 from app.config import settings
 from app.websocket import manager
+from app.dispatch import dispatcher
+from app.outbox import add_event, outbox_relay
+from app.tasks import enqueue_async, send_telegram_message
+from app.images import store_uploaded_image, variant_path, InvalidImageError, IMAGE_VARIANTS
+from app.storage import UploadTooLargeError
+from app.serializers import (
+    ORJSONResponse, DRIVER_TAXI_ORDER, DRIVER_DELIVERY_ORDER,
+    DRIVER_ACTIVE_TAXI_ORDER, DRIVER_ACTIVE_DELIVERY_ORDER,
+    DRIVER_HISTORY_TAXI_ORDER, DRIVER_HISTORY_DELIVERY_ORDER, parse_fields
+)
 
 router = APIRouter(prefix="/api/driver", tags=["Driver"])
 
@@ -64,7 +73,14 @@ async def apply_as_driver(
     db.commit()
     db.refresh(new_application)
     
-    # TODO: Send notification to admin via Telegram bot
+    # Send notification to admin via Telegram bot
+    await enqueue_async(
+        send_telegram_message,
+        f"🚗 New driver application #{new_application.id}\n"
+        f"Name: {new_application.full_name}\n"
+        f"Phone: {new_application.telephone}\n"
+        f"Car: {new_application.car_model} ({new_application.car_number})"
+    )
     
     return new_application
 
@@ -84,37 +100,19 @@ async def upload_license_photo(
                 detail="Only JPEG and PNG images are allowed"
             )
         
-        # Validate file size (max 5MB)
-        file.file.seek(0, 2)  # Move to end of file
-        file_size = file.file.tell()  # Get file size
-        file.file.seek(0)  # Reset to beginning
-        
-        if file_size > settings.MAX_UPLOAD_SIZE:
+        # Stream to storage, then decode, validate and resize in the image worker pool
+        try:
+            relative_path = await store_uploaded_image(file, "licenses")
+        except (InvalidImageError, UploadTooLargeError) as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File size exceeds maximum allowed size of {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+                detail=str(e)
             )
         
-        # Create upload directory if not exists
-        upload_dir = Path(settings.UPLOAD_DIR) / "licenses"
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Generate unique filename
-        import time
-        file_extension = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-        filename = f"license_{current_user.id}_{int(time.time())}.{file_extension}"
-        file_path = upload_dir / filename
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Return relative path for storing in database
-        relative_path = f"uploads/licenses/{filename}"
-        
         return {
             "message": "License photo uploaded successfully",
-            "file_path": relative_path
+            "file_path": relative_path,
+            "variants": {variant: variant_path(relative_path, variant) for variant in IMAGE_VARIANTS}
         }
     except HTTPException:
         raise
@@ -287,6 +285,7 @@ def get_driver_statistics(
 @router.get("/orders/my-orders")
 def get_my_orders(
     status_filter: Optional[OrderStatus] = None,
+    fields: Optional[str] = None,  # comma-separated subset of fields, e.g. id,price,status
     current_user: User = Depends(get_current_driver),
     db: Session = Depends(get_db)
 ):
@@ -308,79 +307,22 @@ def get_my_orders(
         taxi_query = taxi_query.filter(TaxiOrder.status == status_filter)
         delivery_query = delivery_query.filter(DeliveryOrder.status == status_filter)
     
+    requested = parse_fields(fields, DRIVER_TAXI_ORDER, DRIVER_DELIVERY_ORDER)
+    taxi_query, encode_taxi = DRIVER_TAXI_ORDER.select(taxi_query, requested)
+    delivery_query, encode_delivery = DRIVER_DELIVERY_ORDER.select(delivery_query, requested)
+    
     taxi_orders = taxi_query.order_by(TaxiOrder.created_at.desc()).all()
     delivery_orders = delivery_query.order_by(DeliveryOrder.created_at.desc()).all()
     
-    return {
-        "taxi_orders": [
-            {
-                "id": order.id,
-                "type": "taxi",
-                "user_id": order.user_id,
-                "username": order.username,
-                "telephone": order.telephone,
-                "from_region_id": order.from_region_id,
-                "from_district_id": order.from_district_id,
-                "to_region_id": order.to_region_id,
-                "to_district_id": order.to_district_id,
-                "pickup_address": order.pickup_address,
-                "pickup_latitude": order.pickup_latitude,
-                "pickup_longitude": order.pickup_longitude,
-                "passengers": order.passengers,
-                "price": str(order.price),
-                "service_fee": str(order.service_fee),
-                "driver_earnings": str(order.driver_earnings),
-                "date": order.date,
-                "time_start": order.time_start,
-                "time_end": order.time_end,
-                "scheduled_datetime": order.scheduled_datetime.isoformat() if order.scheduled_datetime else None,
-                "status": order.status.value,
-                "note": order.note,
-                "created_at": order.created_at.isoformat(),
-                "accepted_at": order.accepted_at.isoformat() if order.accepted_at else None,
-                "completed_at": order.completed_at.isoformat() if order.completed_at else None
-            }
-            for order in taxi_orders
-        ],
-        "delivery_orders": [
-            {
-                "id": order.id,
-                "type": "delivery",
-                "user_id": order.user_id,
-                "username": order.username,
-                "sender_telephone": order.sender_telephone,
-                "receiver_telephone": order.receiver_telephone,
-                "from_region_id": order.from_region_id,
-                "from_district_id": order.from_district_id,
-                "to_region_id": order.to_region_id,
-                "to_district_id": order.to_district_id,
-                "pickup_address": order.pickup_address,
-                "pickup_latitude": order.pickup_latitude,
-                "pickup_longitude": order.pickup_longitude,
-                "dropoff_address": order.dropoff_address,
-                "dropoff_latitude": order.dropoff_latitude,
-                "dropoff_longitude": order.dropoff_longitude,
-                "item_type": order.item_type.value,
-                "price": str(order.price),
-                "service_fee": str(order.service_fee),
-                "driver_earnings": str(order.driver_earnings),
-                "date": order.date,
-                "time_start": order.time_start,
-                "time_end": order.time_end,
-                "scheduled_datetime": order.scheduled_datetime.isoformat() if order.scheduled_datetime else None,
-                "status": order.status.value,
-                "note": order.note,
-                "created_at": order.created_at.isoformat(),
-                "accepted_at": order.accepted_at.isoformat() if order.accepted_at else None,
-                "completed_at": order.completed_at.isoformat() if order.completed_at else None
-            }
-            for order in delivery_orders
-        ]
-    }
+    return ORJSONResponse({
+        "taxi_orders": [encode_taxi(order) for order in taxi_orders],
+        "delivery_orders": [encode_delivery(order) for order in delivery_orders]
+    })
 
 
 @router.get("/orders/active")
 def get_active_orders(
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_driver),
     db: Session = Depends(get_db)
 ):
@@ -394,82 +336,28 @@ def get_active_orders(
         )
     
     # Get only ACCEPTED orders
-    taxi_orders = db.query(TaxiOrder).filter(
+    requested = parse_fields(fields, DRIVER_ACTIVE_TAXI_ORDER, DRIVER_ACTIVE_DELIVERY_ORDER)
+    taxi_query, encode_taxi = DRIVER_ACTIVE_TAXI_ORDER.select(db.query(TaxiOrder).filter(
         TaxiOrder.driver_id == driver.id,
         TaxiOrder.status == OrderStatus.ACCEPTED
-    ).order_by(TaxiOrder.accepted_at.desc()).all()
-    
-    delivery_orders = db.query(DeliveryOrder).filter(
+    ), requested)
+    delivery_query, encode_delivery = DRIVER_ACTIVE_DELIVERY_ORDER.select(db.query(DeliveryOrder).filter(
         DeliveryOrder.driver_id == driver.id,
         DeliveryOrder.status == OrderStatus.ACCEPTED
-    ).order_by(DeliveryOrder.accepted_at.desc()).all()
+    ), requested)
     
-    return {
-        "taxi_orders": [
-            {
-                "id": order.id,
-                "type": "taxi",
-                "user_id": order.user_id,
-                "username": order.username,
-                "telephone": order.telephone,
-                "from_region_id": order.from_region_id,
-                "from_district_id": order.from_district_id,
-                "to_region_id": order.to_region_id,
-                "to_district_id": order.to_district_id,
-                "pickup_address": order.pickup_address,
-                "pickup_latitude": order.pickup_latitude,
-                "pickup_longitude": order.pickup_longitude,
-                "passengers": order.passengers,
-                "price": str(order.price),
-                "service_fee": str(order.service_fee),
-                "driver_earnings": str(order.driver_earnings),
-                "date": order.date,
-                "time_start": order.time_start,
-                "time_end": order.time_end,
-                "scheduled_datetime": order.scheduled_datetime.isoformat() if order.scheduled_datetime else None,
-                "status": order.status.value,
-                "note": order.note,
-                "accepted_at": order.accepted_at.isoformat() if order.accepted_at else None
-            }
-            for order in taxi_orders
-        ],
-        "delivery_orders": [
-            {
-                "id": order.id,
-                "type": "delivery",
-                "user_id": order.user_id,
-                "username": order.username,
-                "sender_telephone": order.sender_telephone,
-                "receiver_telephone": order.receiver_telephone,
-                "from_region_id": order.from_region_id,
-                "from_district_id": order.from_district_id,
-                "to_region_id": order.to_region_id,
-                "to_district_id": order.to_district_id,
-                "pickup_address": order.pickup_address,
-                "pickup_latitude": order.pickup_latitude,
-                "pickup_longitude": order.pickup_longitude,
-                "dropoff_address": order.dropoff_address,
-                "dropoff_latitude": order.dropoff_latitude,
-                "dropoff_longitude": order.dropoff_longitude,
-                "item_type": order.item_type.value,
-                "price": str(order.price),
-                "service_fee": str(order.service_fee),
-                "driver_earnings": str(order.driver_earnings),
-                "date": order.date,
-                "time_start": order.time_start,
-                "time_end": order.time_end,
-                "scheduled_datetime": order.scheduled_datetime.isoformat() if order.scheduled_datetime else None,
-                "status": order.status.value,
-                "note": order.note,
-                "accepted_at": order.accepted_at.isoformat() if order.accepted_at else None
-            }
-            for order in delivery_orders
-        ]
-    }
+    taxi_orders = taxi_query.order_by(TaxiOrder.accepted_at.desc()).all()
+    delivery_orders = delivery_query.order_by(DeliveryOrder.accepted_at.desc()).all()
+    
+    return ORJSONResponse({
+        "taxi_orders": [encode_taxi(order) for order in taxi_orders],
+        "delivery_orders": [encode_delivery(order) for order in delivery_orders]
+    })
 
 
 @router.get("/orders/history")
 def get_order_history(
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_driver),
     db: Session = Depends(get_db)
 ):
@@ -483,54 +371,23 @@ def get_order_history(
         )
     
     # Get only COMPLETED orders
-    taxi_orders = db.query(TaxiOrder).filter(
+    requested = parse_fields(fields, DRIVER_HISTORY_TAXI_ORDER, DRIVER_HISTORY_DELIVERY_ORDER)
+    taxi_query, encode_taxi = DRIVER_HISTORY_TAXI_ORDER.select(db.query(TaxiOrder).filter(
         TaxiOrder.driver_id == driver.id,
         TaxiOrder.status == OrderStatus.COMPLETED
-    ).order_by(TaxiOrder.completed_at.desc()).all()
-    
-    delivery_orders = db.query(DeliveryOrder).filter(
+    ), requested)
+    delivery_query, encode_delivery = DRIVER_HISTORY_DELIVERY_ORDER.select(db.query(DeliveryOrder).filter(
         DeliveryOrder.driver_id == driver.id,
         DeliveryOrder.status == OrderStatus.COMPLETED
-    ).order_by(DeliveryOrder.completed_at.desc()).all()
+    ), requested)
     
-    return {
-        "taxi_orders": [
-            {
-                "id": order.id,
-                "type": "taxi",
-                "username": order.username,
-                "from_region_id": order.from_region_id,
-                "to_region_id": order.to_region_id,
-                "passengers": order.passengers,
-                "price": str(order.price),
-                "service_fee": str(order.service_fee),
-                "driver_earnings": str(order.driver_earnings),
-                "date": order.date,
-                "status": order.status.value,
-                "accepted_at": order.accepted_at.isoformat() if order.accepted_at else None,
-                "completed_at": order.completed_at.isoformat() if order.completed_at else None
-            }
-            for order in taxi_orders
-        ],
-        "delivery_orders": [
-            {
-                "id": order.id,
-                "type": "delivery",
-                "username": order.username,
-                "from_region_id": order.from_region_id,
-                "to_region_id": order.to_region_id,
-                "item_type": order.item_type.value,
-                "price": str(order.price),
-                "service_fee": str(order.service_fee),
-                "driver_earnings": str(order.driver_earnings),
-                "date": order.date,
-                "status": order.status.value,
-                "accepted_at": order.accepted_at.isoformat() if order.accepted_at else None,
-                "completed_at": order.completed_at.isoformat() if order.completed_at else None
-            }
-            for order in delivery_orders
-        ]
-    }
+    taxi_orders = taxi_query.order_by(TaxiOrder.completed_at.desc()).all()
+    delivery_orders = delivery_query.order_by(DeliveryOrder.completed_at.desc()).all()
+    
+    return ORJSONResponse({
+        "taxi_orders": [encode_taxi(order) for order in taxi_orders],
+        "delivery_orders": [encode_delivery(order) for order in delivery_orders]
+    })
 
 
 @router.get("/orders/new")
@@ -549,9 +406,15 @@ def get_new_orders(
             detail="Driver profile not found"
         )
     
-    # Build query for taxi orders
-    taxi_query = db.query(TaxiOrder).filter(TaxiOrder.status == OrderStatus.PENDING)
-    delivery_query = db.query(DeliveryOrder).filter(DeliveryOrder.status == OrderStatus.PENDING)
+    # Build query for taxi orders (scheduled orders only once released)
+    taxi_query = db.query(TaxiOrder).filter(
+        TaxiOrder.status == OrderStatus.PENDING,
+        TaxiOrder.released_at.isnot(None)
+    )
+    delivery_query = db.query(DeliveryOrder).filter(
+        DeliveryOrder.status == OrderStatus.PENDING,
+        DeliveryOrder.released_at.isnot(None)
+    )
     
     # Apply filters
     if from_region_id:
@@ -565,6 +428,14 @@ def get_new_orders(
     taxi_orders = taxi_query.order_by(TaxiOrder.created_at.desc()).all()
     delivery_orders = delivery_query.order_by(DeliveryOrder.created_at.desc()).all()
     
+    # Orders still in their targeted dispatch waves are only listed to the drivers they were offered to
+    lockable = from_thread.run(
+        dispatcher.lockable_orders, driver.id,
+        [("taxi", order.id) for order in taxi_orders] + [("delivery", order.id) for order in delivery_orders]
+    )
+    taxi_orders = [order for order in taxi_orders if ("taxi", order.id) in lockable]
+    delivery_orders = [order for order in delivery_orders if ("delivery", order.id) in lockable]
+    
     return {
         "taxi_orders": [
             {
@@ -626,60 +497,79 @@ async def accept_order(
     
     # Get order based on type
     if order_type == "taxi":
-        order = db.query(TaxiOrder).filter(TaxiOrder.id == order_id).first()
+        model = TaxiOrder
     elif order_type == "delivery":
-        order = db.query(DeliveryOrder).filter(DeliveryOrder.id == order_id).first()
+        model = DeliveryOrder
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid order type. Must be 'taxi' or 'delivery'"
         )
     
+    # While an order is in its targeted dispatch waves only offered drivers may take it
+    if not await dispatcher.may_lock(order_type, order_id, driver.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="This order has not been offered to you yet"
+        )
+    
+    # Turn away drivers racing someone who holds the accept lock before touching the row
+    if not await manager.may_accept_order(order_id, driver.id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another driver is accepting this order"
+        )
+    
+    order = db.query(model).filter(model.id == order_id).first()
+    
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Order not found"
         )
     
-    if order.status != OrderStatus.PENDING:
+    if order.status != OrderStatus.PENDING or order.released_at is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Order is not available for acceptance"
         )
     
-    # Check if order was created within last 5 minutes
-    time_diff = datetime.now(timezone.utc) - order.created_at
-    if time_diff > timedelta(minutes=5):
+    # Check if order was released within the acceptance window
+    time_diff = datetime.now(timezone.utc) - as_utc(order.released_at)
+    if time_diff > ORDER_ACCEPT_WINDOW:
         # Return order to pending state if expired
         return {
             "success": False,
             "message": "Order acceptance time has expired (5 minutes)"
         }
     
-    # Accept order
-    order.driver_id = driver.id
-    order.status = OrderStatus.ACCEPTED
-    order.accepted_at = datetime.now(timezone.utc)
-    
-    db.commit()
-    db.refresh(order)
-    
-    # Release order lock
-    await manager.release_order_lock(order_id)
+    # Accept order; the status condition makes concurrent accepts of the same row lose cleanly
+    accepted = db.query(model).filter(
+        model.id == order_id,
+        model.status == OrderStatus.PENDING
+    ).update({
+        model.driver_id: driver.id,
+        model.status: OrderStatus.ACCEPTED,
+        model.accepted_at: datetime.now(timezone.utc)
+    }, synchronize_session=False)
+    
+    if not accepted:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Order has already been accepted"
+        )
     
-    # Notify all drivers that this order is no longer available (WebSocket)
-    import asyncio
-    asyncio.create_task(manager.broadcast_to_all_drivers({
+    # Notify all drivers that this order is no longer available, and the user (WebSocket)
+    add_event(db, "drivers", {
         "type": "order_accepted",
-        "order_id": order.id,
+        "order_id": order_id,
         "order_type": order_type,
         "driver_id": driver.id
-    }))
-    
-    # Notify user via WebSocket
-    asyncio.create_task(manager.send_to_user(order.user_id, {
+    })
+    add_event(db, f"user:{order.user_id}", {
         "type": "order_accepted",
-        "order_id": order.id,
+        "order_id": order_id,
         "order_type": order_type,
         "driver": {
             "id": driver.id,
@@ -688,7 +578,20 @@ async def accept_order(
             "car_number": driver.car_number,
             "rating": float(driver.rating)
         }
-    }))
+    })
+    db.commit()
+    outbox_relay.wake()
+    
+    db.refresh(order)
+    
+    # Stop offering the order to further dispatch waves
+    dispatcher.close(order_type, order.id, accepted_by=driver.id)
+    
+    # Release order lock
+    await manager.release_order_lock(order_id)
+    
+    # Route this driver's location updates to the customer
+    await manager.locations.set_active_order(driver.id, order_type, order.id, order.user_id)
     
     # Notify user via database notification
     create_notification(
@@ -759,9 +662,20 @@ def complete_order(
     order.status = OrderStatus.COMPLETED
     order.completed_at = datetime.now(timezone.utc)
     
+    # Notify user via WebSocket
+    add_event(db, f"user:{order.user_id}", {
+        "type": "order_completed",
+        "order_id": order.id,
+        "order_type": order_type
+    })
+    
     db.commit()
+    outbox_relay.wake()
     db.refresh(order)
     
+    # Stop forwarding this driver's location to the customer (state lives on the event loop)
+    from_thread.run(manager.locations.clear_active_order, driver.id, order_type, order.id)
+    
     # Notify user
     create_notification(
         db=db,
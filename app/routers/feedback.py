@@ -4,6 +4,7 @@ from app.database import get_db
 from app.models import User, Feedback
 from app.schemas import FeedbackCreate, FeedbackResponse
 from app.auth import get_current_user
+from app.tasks import enqueue, send_telegram_message
 
 router = APIRouter(prefix="/api/feedback", tags=["Feedback"])
 
@@ -24,6 +25,10 @@ def submit_feedback(
     db.commit()
     db.refresh(new_feedback)
     
-    # TODO: Send to Telegram admin group
+    # Send to Telegram admin group
+    enqueue(
+        send_telegram_message,
+        f"📝 New feedback #{new_feedback.id} from {current_user.name} ({current_user.telephone}):\n\n{new_feedback.message}"
+    )
     
     return new_feedback
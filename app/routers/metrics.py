@@ -0,0 +1,16 @@
+"""
+Prometheus scrape endpoint
+Meant for the monitoring network only: keep /metrics off the public proxy.
+"""
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.metrics import CONTENT_TYPE_LATEST, metrics_sampler, render_metrics
+
+router = APIRouter(tags=["Monitoring"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text format; gauges are sampled fresh for the answering worker"""
+    metrics_sampler.sample()
+    return Response(render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST})
@@ -5,7 +5,8 @@ from app.database import get_db
 from app.models import User, Rating, TaxiOrder, DeliveryOrder
 from app.schemas import RatingCreate, RatingResponse
 from app.auth import get_current_user
-from app.utils import update_driver_rating, create_notification
+from app.utils import create_notification
+from app.tasks import enqueue, recompute_driver_rating
 
 router = APIRouter(prefix="/api/ratings", tags=["Ratings"])
 
@@ -80,8 +81,8 @@ def create_rating(
     db.commit()
     db.refresh(new_rating)
     
-    # Update driver's average rating
-    update_driver_rating(db, rating_data.driver_id)
+    # Update driver's average rating (in the background worker)
+    enqueue(recompute_driver_rating, rating_data.driver_id)
     
     # Notify driver
     create_notification(
@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
+from typing import Optional
+from datetime import date, datetime, timezone
+import os
+import tempfile
+from app.database import get_db
+from app.models import User, OrderStatus
+from app.auth import get_current_admin
+from app.dispatch import ORDER_MODELS
+from app.reports import (
+    XLSX_MEDIA_TYPE, EXPORT_MODELS, EXPORT_MEDIA_TYPES,
+    iter_order_rows, write_orders_xlsx, iter_export
+)
+
+router = APIRouter(prefix="/api/admin/reports", tags=["Reports"])
+
+
+@router.get("/orders.xlsx")
+def export_orders_xlsx(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    region_id: Optional[int] = None,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    order_type: Optional[str] = None,  # taxi, delivery
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    Export orders as an Excel workbook.
+    Filters: date_from/date_to (inclusive, by creation date), region_id (pickup or
+    destination), status and order_type. The workbook is built on disk row by row
+    and removed once it has been sent.
+    """
+    if order_type and order_type not in ORDER_MODELS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid order type. Must be 'taxi' or 'delivery'"
+        )
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="date_from must not be after date_to"
+        )
+
+    fd, path = tempfile.mkstemp(prefix="orders_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        rows = iter_order_rows(db, date_from, date_to, region_id, order_status, order_type)
+        count = write_orders_xlsx(rows, path)
+    except Exception:
+        os.remove(path)
+        raise
+    print(f"📊 Orders report: {count} rows exported by admin {current_user.id}")
+
+    filename = f"orders_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.xlsx"
+    return FileResponse(
+        path,
+        media_type=XLSX_MEDIA_TYPE,
+        filename=filename,
+        background=BackgroundTask(os.remove, path)
+    )
+
+
+@router.get("/export/{table}.{export_format}")
+def export_table(
+    table: str,
+    export_format: str,  # csv, ndjson
+    since_id: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Stream a table as CSV or NDJSON, ordered by id.
+    Tables: taxi_orders, delivery_orders, balance_transactions, ratings.
+    Pass the last id you received as since_id to continue an earlier export.
+    """
+    model = EXPORT_MODELS.get(table)
+    if model is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown export. Available: {', '.join(EXPORT_MODELS)}"
+        )
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid format. Must be 'csv' or 'ndjson'"
+        )
+
+    return StreamingResponse(
+        iter_export(model, export_format, since_id, limit),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{export_format}"'}
+    )
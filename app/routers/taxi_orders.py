@@ -1,3 +1,4 @@
+from anyio import from_thread
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, func
@@ -7,8 +8,16 @@ from app.database import get_db
 from app.models import User, TaxiOrder, OrderStatus, Driver, UserRole
 from app.schemas import TaxiOrderCreate, TaxiOrderResponse, OrderCancellation, BulkDeleteRequest
 from app.auth import get_current_user
-from app.utils import calculate_taxi_price, notify_all_drivers, create_notification, calculate_service_fee
+from app.utils import (
+    calculate_taxi_price, create_notification,
+    calculate_service_fee
+)
 from app.websocket import manager, convert_decimal_to_float
+from app.dispatch import dispatcher
+from app.outbox import add_event, outbox_relay
+from app.scheduler import release_queue, is_due_for_release
+from app.tasks import enqueue_async, broadcast_notification_task
+from app.serializers import ORJSONResponse, TAXI_ORDER, parse_fields
 
 router = APIRouter(prefix="/api/taxi-orders", tags=["Taxi Orders"])
 
@@ -53,41 +62,33 @@ async def create_taxi_order(
         service_fee=service_fee,
         driver_earnings=driver_earnings,
         note=order_data.note,
-        status=OrderStatus.PENDING
+        status=OrderStatus.PENDING,
+        # Orders scheduled further ahead wait in the release queue
+        released_at=datetime.now(timezone.utc) if is_due_for_release(order_data.scheduled_datetime) else None
     )
     
     db.add(new_order)
+    first_wave = []
+    if new_order.released_at is not None:
+        # Announce to the nearest drivers (or everyone) in the same transaction (outbox)
+        first_wave = await dispatcher.announce(db, "taxi", new_order)
     db.commit()
+    outbox_relay.wake()
     db.refresh(new_order)
     
-    # Notify all drivers via database
-    notify_all_drivers(
-        db=db,
-        title="New Taxi Order",
-        message=f"New taxi order from region {order_data.from_region_id} to {order_data.to_region_id}"
-    )
+    if new_order.released_at is not None:
+        # Notify all drivers via database (in the background worker)
+        await enqueue_async(
+            broadcast_notification_task,
+            "drivers",
+            "New Taxi Order",
+            f"New taxi order from region {order_data.from_region_id} to {order_data.to_region_id}",
+            "new_order"
+        )
     
-    # Broadcast to all drivers via WebSocket
-    import asyncio
-    order_data_dict = {
-        "id": new_order.id,
-        "type": "taxi",
-        "from_region_id": new_order.from_region_id,
-        "to_region_id": new_order.to_region_id,
-        "passengers": new_order.passengers,
-        "price": float(new_order.price),
-        "service_fee": float(new_order.service_fee),
-        "driver_earnings": float(new_order.driver_earnings),
-        "date": new_order.date,
-        "time_start": new_order.time_start,
-        "time_end": new_order.time_end,
-        "scheduled_datetime": new_order.scheduled_datetime.isoformat() if new_order.scheduled_datetime else None,
-        "created_at": new_order.created_at.isoformat()
-    }
-    asyncio.create_task(manager.broadcast_to_all_drivers({
-        "type": "new_order",
-        "order": order_data_dict
-    }))
+    # Widen the offer in further waves (WebSocket),
+    # or hold a scheduled order until its release time
+    await release_queue.submit("taxi", new_order, first_wave)
     
     return new_order
 
@@ -95,6 +96,7 @@ async def create_taxi_order(
 @router.get("/", response_model=List[TaxiOrderResponse])
 def get_all_taxi_orders(
     status_filter: Optional[OrderStatus] = None,
+    fields: Optional[str] = None,  # comma-separated subset of fields, e.g. id,price,status
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -104,36 +106,45 @@ def get_all_taxi_orders(
     if status_filter:
         query = query.filter(TaxiOrder.status == status_filter)
     
+    query, encode = TAXI_ORDER.select(query, parse_fields(fields, TAXI_ORDER))
     orders = query.order_by(TaxiOrder.created_at.desc()).all()
-    return orders
+    return ORJSONResponse([encode(order) for order in orders])
 
 
 @router.get("/active", response_model=List[TaxiOrderResponse])
 def get_active_taxi_orders(
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get active taxi orders (pending or accepted)"""
-    orders = db.query(TaxiOrder).filter(
+    query = db.query(TaxiOrder).filter(
         TaxiOrder.user_id == current_user.id,
         TaxiOrder.status.in_([OrderStatus.PENDING, OrderStatus.ACCEPTED])
-    ).order_by(TaxiOrder.created_at.desc()).all()
+    )
+    
+    query, encode = TAXI_ORDER.select(query, parse_fields(fields, TAXI_ORDER))
+    orders = query.order_by(TaxiOrder.created_at.desc()).all()
     
-    return orders
+    return ORJSONResponse([encode(order) for order in orders])
 
 
 @router.get("/history", response_model=List[TaxiOrderResponse])
 def get_taxi_order_history(
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get completed and cancelled taxi orders"""
-    orders = db.query(TaxiOrder).filter(
+    query = db.query(TaxiOrder).filter(
         TaxiOrder.user_id == current_user.id,
         TaxiOrder.status.in_([OrderStatus.COMPLETED, OrderStatus.CANCELLED])
-    ).order_by(TaxiOrder.completed_at.desc()).all()
+    )
+    
+    query, encode = TAXI_ORDER.select(query, parse_fields(fields, TAXI_ORDER))
+    orders = query.order_by(TaxiOrder.completed_at.desc()).all()
     
-    return orders
+    return ORJSONResponse([encode(order) for order in orders])
 
 
 @router.get("/{order_id}", response_model=TaxiOrderResponse)
@@ -328,7 +339,15 @@ def cancel_taxi_order(
     order.cancellation_reason = cancellation.cancellation_reason
     order.cancelled_at = datetime.now(timezone.utc)
     
+    # Tell drivers to drop the order from their lists (WebSocket)
+    add_event(db, "drivers", {
+        "type": "order_cancelled",
+        "order_id": order.id,
+        "order_type": "taxi"
+    })
+    
     db.commit()
+    outbox_relay.wake()
     db.refresh(order)
     
     # Notify driver if order was accepted
@@ -346,6 +365,11 @@ def cancel_taxi_order(
             # Process refund (add balance back to driver if needed)
             # This would be implemented based on your business logic
     
+    # Location routing and dispatch state live on the event loop
+    if order.driver_id:
+        from_thread.run(manager.locations.clear_active_order, order.driver_id, "taxi", order.id)
+    from_thread.run_sync(dispatcher.close, "taxi", order.id)
+    
     # Notify user
     create_notification(
         db=db,
@@ -0,0 +1,189 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.orm import Session
+from typing import Optional, Tuple
+from pathlib import Path
+import anyio
+import os
+import re
+from app.database import get_db
+from app.models import User, UserRole, Driver, DriverApplication
+from app.auth import get_current_user
+from app.config import settings
+from app.images import IMAGE_VARIANTS, variant_path
+from app.storage import storage
+
+router = APIRouter(prefix="/uploads", tags=["Uploads"])
+
+# <sha256>.<ext> or <sha256>_<variant>.webp: the name changes whenever the content does
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# One range-spec: first-last, first- or -suffix_length
+RANGE_SPEC = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+
+class UploadFileResponse(FileResponse):
+    """
+    FileResponse for the whole file or a single byte range. The body goes out
+    through the ASGI zero-copy extension (os.sendfile) when the server offers it.
+    """
+
+    def __init__(self, path: Path, stat_result: os.stat_result, byte_range: Optional[Tuple[int, int]] = None, **kwargs):
+        self.byte_range = byte_range or (0, stat_result.st_size - 1)
+        super().__init__(path, stat_result=stat_result, **kwargs)
+
+    async def __call__(self, scope, receive, send):
+        first, last = self.byte_range
+        remaining = last - first + 1
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or remaining <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.wrapped,
+                    "offset": first,
+                    "count": remaining,
+                    "more_body": False
+                })
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(first)
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    # File shrank under us; end the body so the connection is not left hanging
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single `bytes=` range as (first, last); None means send the whole file.
+    Invalid headers are ignored (RFC 9110 14.2); only a valid range that
+    selects nothing of the file is answered with 416.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    # Multiple ranges would need multipart/byteranges; a full response is allowed instead
+    match = RANGE_SPEC.fullmatch(header[len("bytes="):].strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        first = int(first)
+        if last and int(last) < first:
+            return None  # invalid, not unsatisfiable
+        satisfiable = first < size
+        last = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        suffix_length = int(last)
+        satisfiable = suffix_length > 0 and size > 0
+        first, last = max(size - suffix_length, 0), size - 1
+    if not satisfiable:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"content-range": f"bytes */{size}"}
+        )
+    return first, last
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _image_response(request: Request, kind: str, filename: str, size: Optional[str], private: bool = False) -> Response:
+    if size is not None and size not in IMAGE_VARIANTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid size. Must be one of: {', '.join(IMAGE_VARIANTS)}"
+        )
+
+    upload_dir = Path(settings.UPLOAD_DIR) / kind
+    path = upload_dir / filename
+    if path.parent != upload_dir or not path.is_file():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    if size:
+        variant = upload_dir / variant_path(filename, size)
+        # Uploads from before variants existed only have the original
+        if variant.is_file():
+            path = variant
+
+    stat_result = path.stat()
+    scope = "private" if private else "public"
+    if CONTENT_ADDRESSED.match(path.stem):
+        # The name is the content hash, so it doubles as a strong ETag and the file never changes
+        etag = f'"{path.stem}"'
+        cache_control = f"{scope}, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        # Uploads from before content addressing: revalidate on every use
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        cache_control = f"{scope}, no-cache"
+    headers = {"etag": etag, "cache-control": cache_control, "accept-ranges": "bytes"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    file_size = stat_result.st_size
+    # A stale If-Range means the whole file is sent and Range is not looked at
+    if_range = request.headers.get("if-range")
+    byte_range = _parse_range(request.headers.get("range"), file_size) if if_range in (None, etag) else None
+    if byte_range is None:
+        headers["content-length"] = str(file_size)
+        return UploadFileResponse(path, stat_result, headers=headers)
+
+    first, last = byte_range
+    headers["content-length"] = str(last - first + 1)
+    headers["content-range"] = f"bytes {first}-{last}/{file_size}"
+    return UploadFileResponse(
+        path, stat_result, byte_range,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers
+    )
+
+
+def _owns_license(db: Session, user: User, path: str) -> bool:
+    return any(
+        db.query(model.id).filter(model.user_id == user.id, model.license_photo == path).first()
+        for model in (DriverApplication, Driver)
+    )
+
+
+@router.api_route("/profiles/{filename}", methods=["GET", "HEAD"])
+def get_profile_picture(request: Request, filename: str, size: Optional[str] = None):
+    """Profile picture; size=thumb|small|medium returns a WebP variant instead of the original"""
+    return _image_response(request, "profiles", filename, size)
+
+
+@router.api_route("/licenses/{filename}", methods=["GET", "HEAD"])
+def get_license_photo(
+    request: Request,
+    filename: str,
+    size: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Driving license photo (admins and the driver or applicant it belongs to)"""
+    is_admin = current_user.role in [UserRole.ADMIN, UserRole.SUPERADMIN]
+    # Files are named by content hash, so ownership comes from the records that reference them
+    if not is_admin and not _owns_license(db, current_user, storage.relative_path("licenses", filename)):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view this file"
+        )
+    # Never stored by shared caches or CDNs
+    return _image_response(request, "licenses", filename, size, private=True)
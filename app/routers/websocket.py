@@ -4,15 +4,131 @@ Handles WebSocket connections and real-time events
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
 from sqlalchemy.orm import Session
-from app.database import get_db
+from starlette.concurrency import run_in_threadpool
+from typing import Callable, Dict, List
+from app.database import get_db, SessionLocal
 from app.websocket import manager, convert_decimal_to_float
-from app.models import User, Driver
+from app.locations import LocationRejected
+from app.dispatch import dispatcher
+from app.models import User, Driver, TaxiOrder, DeliveryOrder, OrderStatus
 from app.auth import get_user_from_token
+from app.utils import build_order_event_payload
 import json
 
 router = APIRouter(prefix="/ws", tags=["WebSocket"])
 
 
+def _orders_snapshot(*filters_by_model) -> List[dict]:
+    """Load orders for a reconnect snapshot: [(Model, order_type, [criteria...]), ...]"""
+    db = SessionLocal()
+    try:
+        orders = []
+        for model, order_type, criteria in filters_by_model:
+            rows = db.query(model).filter(*criteria).order_by(model.created_at.desc()).all()
+            orders.extend(build_order_event_payload(order, order_type) for order in rows)
+        return orders
+    finally:
+        db.close()
+
+
+def _pending_orders_snapshot() -> List[dict]:
+    return _orders_snapshot(
+        (TaxiOrder, "taxi", [TaxiOrder.status == OrderStatus.PENDING, TaxiOrder.released_at.isnot(None)]),
+        (DeliveryOrder, "delivery", [DeliveryOrder.status == OrderStatus.PENDING, DeliveryOrder.released_at.isnot(None)]),
+    )
+
+
+def _driver_orders_snapshot(driver_id: int) -> List[dict]:
+    return _orders_snapshot(
+        (TaxiOrder, "taxi", [TaxiOrder.driver_id == driver_id, TaxiOrder.status == OrderStatus.ACCEPTED]),
+        (DeliveryOrder, "delivery", [DeliveryOrder.driver_id == driver_id, DeliveryOrder.status == OrderStatus.ACCEPTED]),
+    )
+
+
+def _user_orders_snapshot(user_id: int) -> List[dict]:
+    active = [OrderStatus.PENDING, OrderStatus.ACCEPTED]
+    return _orders_snapshot(
+        (TaxiOrder, "taxi", [TaxiOrder.user_id == user_id, TaxiOrder.status.in_(active)]),
+        (DeliveryOrder, "delivery", [DeliveryOrder.user_id == user_id, DeliveryOrder.status.in_(active)]),
+    )
+
+
+def _load_active_orders(driver_id: int):
+    """Accepted orders a driver is serving, for location forwarding"""
+    db = SessionLocal()
+    try:
+        result = []
+        for model, order_type in ((TaxiOrder, "taxi"), (DeliveryOrder, "delivery")):
+            rows = db.query(model.id, model.user_id).filter(
+                model.driver_id == driver_id,
+                model.status == OrderStatus.ACCEPTED
+            ).all()
+            result.extend((order_type, order_id, user_id) for order_id, user_id in rows)
+        return result
+    finally:
+        db.close()
+
+
+async def _handle_driver_location(websocket: WebSocket, driver_id: int, data: dict):
+    """Store a driver position and forward it to the customers being served"""
+    try:
+        point = await manager.locations.update(driver_id, data.get("lat"), data.get("lng"))
+    except LocationRejected as e:
+        await websocket.send_json({"type": "location_rejected", "reason": str(e)})
+        return
+    if point is None:
+        return  # throttled
+    
+    heading = data.get("heading")
+    for order_type, order_id, user_id in await manager.locations.get_active_orders(driver_id, _load_active_orders):
+        await manager.send_to_user(user_id, {
+            "type": "driver_location",
+            "order_id": order_id,
+            "order_type": order_type,
+            "driver_id": driver_id,
+            "lat": point[0],
+            "lng": point[1],
+            "heading": heading if isinstance(heading, (int, float)) else None
+        })
+
+
+async def _stream_heads(streams: Dict[str, Callable]) -> Dict[str, str]:
+    return {stream: await manager.events.head(stream) for stream in streams}
+
+
+async def _resume(websocket: WebSocket, streams: Dict[str, Callable], cursors: dict):
+    """
+    Bring a reconnecting client up to date.
+    For every stream the client has a cursor for, replay the events it missed;
+    if the cursor is too old (or unknown) send a snapshot of current state instead.
+    Clients should drop events whose seq they have already seen.
+    """
+    if not isinstance(cursors, dict):
+        cursors = {}
+    
+    for stream, build_snapshot in streams.items():
+        if stream not in cursors:
+            continue
+        missed = await manager.events.read_since(stream, cursors[stream])
+        if missed is not None:
+            for event in missed:
+                await websocket.send_json(event)
+            continue
+        # Read the head before the snapshot so nothing newer is skipped
+        head = await manager.events.head(stream)
+        await websocket.send_json({
+            "type": "snapshot",
+            "stream": stream,
+            "seq": head,
+            "orders": await run_in_threadpool(build_snapshot)
+        })
+    
+    await websocket.send_json({
+        "type": "resumed",
+        "cursors": await _stream_heads(streams)
+    })
+
+
 @router.websocket("/driver/{token}")
 async def websocket_driver_endpoint(
     websocket: WebSocket,
@@ -25,18 +141,34 @@ async def websocket_driver_endpoint(
     
     Events received from driver:
     - {"type": "ping"} - Keep alive
+    - {"type": "pong"} - Reply to a server heartbeat
     - {"type": "viewing_order", "order_id": 123, "order_type": "taxi"} - Driver viewing order
     - {"type": "stop_viewing_order", "order_id": 123} - Driver stopped viewing
-    - {"type": "request_lock", "order_id": 123} - Driver requesting to accept order
+    - {"type": "request_lock", "order_id": 123, "order_type": "taxi"} - Driver requesting to accept order
+    - {"type": "location", "lat": 41.31, "lng": 69.24, "heading": 90} - Live position; at most one
+      update per LOCATION_MIN_INTERVAL is used, forwarded only to customers of accepted orders
+    - {"type": "resume", "cursors": {"drivers": "<seq>", "driver:<id>": "<seq>"}} - Replay
+      events missed while offline (see "Resuming after a reconnect" in WEBSOCKET_GUIDE.md)
     
     Events sent to driver:
-    - {"type": "new_order", "order": {...}} - New order available
+    - {"type": "new_order", "order": {...}, "wave": 1} - Order offered to this driver in a dispatch
+      wave (wave 0 = broadcast to all drivers once the targeted waves ran out)
     - {"type": "order_accepted", "order_id": 123, "driver_id": 456} - Order accepted by someone
     - {"type": "order_cancelled", "order_id": 123} - Order cancelled
     - {"type": "order_completed", "order_id": 123} - Order completed
+    - {"type": "order_expired", "order_id": 123} - Nobody accepted the order in time
     - {"type": "viewer_count", "order_id": 123, "count": 5} - Number of drivers viewing order
     - {"type": "lock_acquired", "order_id": 123} - Lock acquired, can accept
     - {"type": "lock_failed", "order_id": 123} - Lock failed, someone else accepting
+    - {"type": "location_rejected", "reason": "..."} - Invalid or implausible location update
+    - {"type": "heartbeat", "timestamp": "..."} - Server heartbeat; reply with {"type": "pong"}.
+      Once a client has replied, it is closed if it stays silent for WS_IDLE_TIMEOUT seconds
+    - {"type": "snapshot", "stream": "drivers", "seq": "...", "orders": [...]} - Current state
+      when a resume cursor is too old to replay
+    - {"type": "resumed", "cursors": {...}} - Replay finished
+    
+    Durable events (new_order, order_accepted, order_cancelled, order_completed, order_expired) carry
+    "stream" and "seq" fields; keep the last seq per stream to resume from.
     """
     # Verify driver token
     try:
@@ -48,22 +180,38 @@ async def websocket_driver_endpoint(
         driver_id = user.driver_profile.id
         await manager.connect_driver(websocket, driver_id)
         
+        streams = {
+            "drivers": _pending_orders_snapshot,
+            f"driver:{driver_id}": lambda: _driver_orders_snapshot(driver_id),
+        }
+        
         # Send connection confirmation
         await websocket.send_json({
             "type": "connected",
             "driver_id": driver_id,
-            "message": "WebSocket connected successfully"
+            "message": "WebSocket connected successfully",
+            "cursors": await _stream_heads(streams)
         })
         
         try:
             while True:
                 # Receive messages from driver
                 data = await websocket.receive_json()
+                manager.touch(websocket)
                 message_type = data.get("type")
                 
                 if message_type == "ping":
                     await websocket.send_json({"type": "pong"})
                 
+                elif message_type == "pong":
+                    manager.ack_heartbeat(websocket)
+                
+                elif message_type == "location":
+                    await _handle_driver_location(websocket, driver_id, data)
+                
+                elif message_type == "resume":
+                    await _resume(websocket, streams, data.get("cursors"))
+                
                 elif message_type == "viewing_order":
                     order_id = data.get("order_id")
                     if order_id:
@@ -90,8 +238,15 @@ async def websocket_driver_endpoint(
                 elif message_type == "request_lock":
                     order_id = data.get("order_id")
                     if order_id:
+                        # While an order is in its targeted waves only offered drivers may take it
+                        if not await dispatcher.may_lock(data.get("order_type"), order_id, driver_id):
+                            await websocket.send_json({
+                                "type": "lock_failed",
+                                "order_id": order_id,
+                                "message": "This order has not been offered to you yet"
+                            })
                         # Try to acquire lock
-                        if await manager.try_lock_order(order_id, driver_id):
+                        elif await manager.try_lock_order(order_id, driver_id):
                             await websocket.send_json({
                                 "type": "lock_acquired",
                                 "order_id": order_id,
@@ -128,7 +283,17 @@ async def websocket_user_endpoint(
     Events sent to user:
     - {"type": "order_accepted", "order_id": 123, "driver": {...}} - Order accepted by driver
     - {"type": "order_completed", "order_id": 123} - Order completed
-    - {"type": "driver_location", "order_id": 123, "lat": 41.123, "lng": 69.456} - Driver location update
+    - {"type": "order_expired", "order_id": 123} - No driver accepted the order within 5 minutes
+    - {"type": "driver_location", "order_id": 123, "order_type": "taxi", "driver_id": 5,
+       "lat": 41.123, "lng": 69.456, "heading": 90} - Location of the driver serving your order
+    - {"type": "heartbeat", "timestamp": "..."} - Server heartbeat; reply with {"type": "pong"}.
+      Once a client has replied, it is closed if it stays silent for WS_IDLE_TIMEOUT seconds
+    - {"type": "snapshot", ...} / {"type": "resumed", ...} - Replies to a resume request
+    
+    Events received from user:
+    - {"type": "ping"} - Keep alive
+    - {"type": "pong"} - Reply to a server heartbeat
+    - {"type": "resume", "cursors": {"user:<id>": "<seq>"}} - Replay events missed while offline
     """
     # Verify user token
     try:
@@ -140,21 +305,31 @@ async def websocket_user_endpoint(
         user_id = user.id
         await manager.connect_user(websocket, user_id)
         
+        streams = {f"user:{user_id}": lambda: _user_orders_snapshot(user_id)}
+        
         # Send connection confirmation
         await websocket.send_json({
             "type": "connected",
             "user_id": user_id,
-            "message": "WebSocket connected successfully"
+            "message": "WebSocket connected successfully",
+            "cursors": await _stream_heads(streams)
         })
         
         try:
             while True:
                 # Receive messages from user (mostly ping to keep alive)
                 data = await websocket.receive_json()
+                manager.touch(websocket)
                 message_type = data.get("type")
                 
                 if message_type == "ping":
                     await websocket.send_json({"type": "pong"})
+                
+                elif message_type == "pong":
+                    manager.ack_heartbeat(websocket)
+                
+                elif message_type == "resume":
+                    await _resume(websocket, streams, data.get("cursors"))
         
         except WebSocketDisconnect:
             manager.disconnect_user(websocket, user_id)
@@ -173,5 +348,6 @@ async def get_websocket_stats():
     return {
         "active_drivers": await manager.get_active_driver_count(),
         "active_users": await manager.get_active_user_count(),
-        "total_connections": await manager.get_active_driver_count() + await manager.get_active_user_count()
+        "total_connections": await manager.get_active_driver_count() + await manager.get_active_user_count(),
+        "dispatch": dispatcher.get_stats()
     }
@@ -0,0 +1,370 @@
+"""
+Order timers
+- OrderReleaseQueue holds scheduled orders back and releases each one to
+  dispatch SCHEDULED_ORDER_LEAD_TIME seconds before its scheduled_datetime.
+- OrderExpiryScheduler cancels released orders nobody accepted within the
+  acceptance window, so they leave the pending set and the driver feed.
+
+Released orders are announced to their first dispatch wave through the
+outbox, in the same transaction that marks them released.
+
+Both keep a min-heap keyed on the time the order is due and handle due orders
+in batches with one UPDATE per order type. The clock is injectable so the
+queues can be driven by a fake clock.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import heapq
+import time
+from sqlalchemy import or_, update
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.models import OrderStatus, Notification
+from app.utils import ORDER_ACCEPT_WINDOW, as_utc, build_order_event_payload
+from app.tasks import enqueue_async, broadcast_notification_task
+from app.outbox import add_event, outbox_relay
+from app.dispatch import ORDER_MODELS, add_announcement
+from app.matching import order_pickup_point
+
+EXPIRY_REASON = "Expired: no driver accepted the order within 5 minutes"
+
+Due = Dict[str, List[int]]  # {order_type: [order_id, ...]}
+Pickup = Optional[Tuple[float, float]]
+
+
+def release_time(scheduled_datetime: Optional[datetime]) -> Optional[datetime]:
+    """When an order scheduled for `scheduled_datetime` should be offered to drivers"""
+    if scheduled_datetime is None:
+        return None
+    return as_utc(scheduled_datetime) - timedelta(seconds=settings.SCHEDULED_ORDER_LEAD_TIME)
+
+
+def is_due_for_release(scheduled_datetime: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    """True if a new order should go to drivers right away rather than wait in the release queue"""
+    release_at = release_time(scheduled_datetime)
+    return release_at is None or release_at <= (now or datetime.now(timezone.utc))
+
+
+class _OrderTimerQueue:
+    """Min-heap of (due time, order_type, order_id) drained by a background task"""
+
+    name = "order timer"
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._heap: List[Tuple[float, str, int]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_sweep = float("-inf")
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.clock(), timezone.utc)
+
+    def _push(self, due_at: datetime, order_type: str, order_id: int):
+        timestamp = as_utc(due_at).timestamp()
+        heapq.heappush(self._heap, (timestamp, order_type, order_id))
+        if self._heap[0][0] == timestamp:
+            self._wakeup.set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def start(self):
+        """Load waiting orders from the database and start the loop"""
+        for order_type, order_id, due_at in await run_in_threadpool(self._load):
+            self._push(due_at, order_type, order_id)
+        self._task = asyncio.create_task(self._run())
+        print(f"⏱️ {self.name.capitalize()} started ({len(self._heap)} orders)")
+
+    async def _run(self):
+        while True:
+            try:
+                now = self.clock()
+                timeout = settings.ORDER_TIMER_SWEEP_INTERVAL - (now - self._last_sweep)
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - now)
+                if timeout > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                        continue  # an earlier order was scheduled
+                    except asyncio.TimeoutError:
+                        pass
+                await self.run_due()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"{self.name.capitalize()} error: {e}")
+                await asyncio.sleep(1)
+
+    async def run_due(self):
+        """Handle every order that is due and, periodically, sweep the database for stragglers"""
+        now = self.clock()
+        due: Due = {}
+        count = 0
+        while self._heap and self._heap[0][0] <= now and count < settings.ORDER_TIMER_BATCH_SIZE:
+            _, order_type, order_id = heapq.heappop(self._heap)
+            due.setdefault(order_type, []).append(order_id)
+            count += 1
+        if due:
+            await self._fire(due)
+
+        if now - self._last_sweep >= settings.ORDER_TIMER_SWEEP_INTERVAL:
+            # Orders created on other nodes or missed before a restart
+            self._last_sweep = now
+            overdue = {t: ids for t, ids in (await run_in_threadpool(self._sweep, self.now())).items() if ids}
+            if overdue:
+                await self._fire(overdue)
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _load(self) -> List[Tuple[str, int, datetime]]:
+        raise NotImplementedError
+
+    def _sweep(self, now: datetime) -> Due:
+        raise NotImplementedError
+
+    async def _fire(self, due: Due):
+        raise NotImplementedError
+
+
+def _expire_orders(due: Due, now: datetime) -> List[Tuple[str, int, int]]:
+    """
+    Cancel still-pending orders with one UPDATE per order type.
+    Returns [(order_type, order_id, user_id), ...] for the orders actually expired;
+    orders accepted or cancelled in the meantime are left alone.
+    """
+    expired = []
+    db = SessionLocal()
+    try:
+        for order_type, order_ids in due.items():
+            model = ORDER_MODELS[order_type]
+            rows = db.execute(
+                update(model)
+                .where(model.id.in_(order_ids), model.status == OrderStatus.PENDING)
+                .values(status=OrderStatus.CANCELLED, cancellation_reason=EXPIRY_REASON, cancelled_at=now)
+                .returning(model.id, model.user_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            expired.extend((order_type, order_id, user_id) for order_id, user_id in rows)
+
+        for order_type, order_id, user_id in expired:
+            event = {"type": "order_expired", "order_id": order_id, "order_type": order_type}
+            add_event(db, "drivers", event)
+            add_event(db, f"user:{user_id}", event)
+
+        db.add_all([
+            Notification(
+                user_id=user_id,
+                title="Order Expired",
+                message=f"No driver accepted your {order_type} order #{order_id} in time. Please create it again.",
+                notification_type="order_expired"
+            )
+            for order_type, order_id, user_id in expired
+        ])
+        db.commit()
+        return expired
+    finally:
+        db.close()
+
+
+class OrderExpiryScheduler(_OrderTimerQueue):
+    """Expires released orders when their acceptance window closes"""
+
+    name = "order expiry scheduler"
+
+    def __init__(self, dispatcher, clock: Callable[[], float] = time.time):
+        super().__init__(clock)
+        self.dispatcher = dispatcher
+
+    def schedule(self, order_type: str, order_id: int, released_at: Optional[datetime] = None):
+        """Expire an order once its acceptance window has passed"""
+        self._push((as_utc(released_at) or self.now()) + ORDER_ACCEPT_WINDOW, order_type, order_id)
+
+    def _load(self):
+        db = SessionLocal()
+        try:
+            return [
+                (order_type, order_id, as_utc(released_at) + ORDER_ACCEPT_WINDOW)
+                for order_type, model in ORDER_MODELS.items()
+                for order_id, released_at in db.query(model.id, model.released_at).filter(
+                    model.status == OrderStatus.PENDING,
+                    model.released_at.isnot(None)
+                )
+            ]
+        finally:
+            db.close()
+
+    def _sweep(self, now: datetime) -> Due:
+        db = SessionLocal()
+        try:
+            return {
+                order_type: [
+                    order_id for (order_id,) in db.query(model.id).filter(
+                        model.status == OrderStatus.PENDING,
+                        model.released_at <= now - ORDER_ACCEPT_WINDOW
+                    ).limit(settings.ORDER_TIMER_BATCH_SIZE)
+                ]
+                for order_type, model in ORDER_MODELS.items()
+            }
+        finally:
+            db.close()
+
+    async def _fire(self, due: Due):
+        expired = await run_in_threadpool(_expire_orders, due, self.now())
+        if not expired:
+            return
+        print(f"⏱️ Expired {len(expired)} order(s) nobody accepted")
+        outbox_relay.wake()
+        for order_type, order_id, _ in expired:
+            self.dispatcher.close(order_type, order_id)
+
+
+def _held_pickups(due: Due) -> Dict[Tuple[str, int], Pickup]:
+    """Pickup points of the due orders that are still pending and held back"""
+    pickups = {}
+    db = SessionLocal()
+    try:
+        for order_type, order_ids in due.items():
+            model = ORDER_MODELS[order_type]
+            for order in db.query(model).filter(
+                model.id.in_(order_ids), model.status == OrderStatus.PENDING, model.released_at.is_(None)
+            ):
+                pickups[(order_type, order.id)] = order_pickup_point(order)
+        return pickups
+    finally:
+        db.close()
+
+
+def _release_orders(due: Due, now: datetime,
+                    first_waves: Dict[Tuple[str, int], List[int]]) -> List[Tuple[str, int, dict, Pickup]]:
+    """
+    Mark held orders as released with one UPDATE per order type and queue their
+    new_order announcements (to `first_waves`) in the same transaction.
+    Returns [(order_type, order_id, event payload, pickup point), ...] for the orders
+    actually released; cancelled or already released orders are skipped.
+    """
+    released = []
+    db = SessionLocal()
+    try:
+        for order_type, order_ids in due.items():
+            model = ORDER_MODELS[order_type]
+            ids = db.execute(
+                update(model)
+                .where(model.id.in_(order_ids), model.status == OrderStatus.PENDING, model.released_at.is_(None))
+                .values(released_at=now)
+                .returning(model.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            if not ids:
+                continue
+            for order in db.query(model).filter(model.id.in_(ids)):
+                payload = build_order_event_payload(order, order_type)
+                add_announcement(db, payload, first_waves.get((order_type, order.id), []))
+                released.append((order_type, order.id, payload, order_pickup_point(order)))
+        db.commit()
+        return released
+    finally:
+        db.close()
+
+
+class OrderReleaseQueue(_OrderTimerQueue):
+    """Holds scheduled orders until SCHEDULED_ORDER_LEAD_TIME before their scheduled_datetime"""
+
+    name = "scheduled order release queue"
+
+    def __init__(self, dispatcher, expiry: OrderExpiryScheduler, clock: Callable[[], float] = time.time):
+        super().__init__(clock)
+        self.dispatcher = dispatcher
+        self.expiry = expiry
+
+    async def submit(self, order_type: str, order, first_wave: Sequence[int] = ()):
+        """
+        Dispatch a just-created order already announced with dispatcher.announce,
+        or hold it until its release time
+        """
+        if order.released_at is not None:
+            await self._dispatch(
+                order_type, order.id, build_order_event_payload(order, order_type),
+                order_pickup_point(order), order.released_at, first_wave
+            )
+        else:
+            self._push(release_time(order.scheduled_datetime), order_type, order.id)
+
+    async def _dispatch(self, order_type: str, order_id: int, payload: dict, pickup: Pickup,
+                        released_at: datetime, first_wave: Sequence[int]):
+        await self.dispatcher.start(order_type, order_id, payload, pickup, released_at, first_wave)
+        self.expiry.schedule(order_type, order_id, released_at)
+
+    def _load(self):
+        db = SessionLocal()
+        try:
+            return [
+                (order_type, order_id, release_time(scheduled_datetime) or self.now())
+                for order_type, model in ORDER_MODELS.items()
+                for order_id, scheduled_datetime in db.query(model.id, model.scheduled_datetime).filter(
+                    model.status == OrderStatus.PENDING,
+                    model.released_at.is_(None)
+                )
+            ]
+        finally:
+            db.close()
+
+    def _sweep(self, now: datetime) -> Due:
+        db = SessionLocal()
+        try:
+            return {
+                order_type: [
+                    order_id for (order_id,) in db.query(model.id).filter(
+                        model.status == OrderStatus.PENDING,
+                        model.released_at.is_(None),
+                        or_(
+                            model.scheduled_datetime.is_(None),
+                            model.scheduled_datetime <= now + timedelta(seconds=settings.SCHEDULED_ORDER_LEAD_TIME)
+                        )
+                    ).limit(settings.ORDER_TIMER_BATCH_SIZE)
+                ]
+                for order_type, model in ORDER_MODELS.items()
+            }
+        finally:
+            db.close()
+
+    async def _fire(self, due: Due):
+        pickups = await run_in_threadpool(_held_pickups, due)
+        if not pickups:
+            return
+        waves = await asyncio.gather(*(self.dispatcher.first_wave(pickup) for pickup in pickups.values()))
+        first_waves = dict(zip(pickups, waves))
+        now = self.now()
+        released = await run_in_threadpool(_release_orders, due, now, first_waves)
+        if not released:
+            return
+        print(f"⏱️ Released {len(released)} scheduled order(s) to drivers")
+        outbox_relay.wake()
+        for order_type, order_id, payload, pickup in released:
+            await self._dispatch(order_type, order_id, payload, pickup, now, first_waves.get((order_type, order_id), []))
+            await enqueue_async(
+                broadcast_notification_task,
+                "drivers",
+                f"New {order_type.capitalize()} Order",
+                f"New {order_type} order from region {payload['from_region_id']} to {payload['to_region_id']}",
+                "new_order"
+            )
+
+
+def _create_schedulers() -> Tuple[OrderExpiryScheduler, OrderReleaseQueue]:
+    from app.dispatch import dispatcher
+    expiry = OrderExpiryScheduler(dispatcher)
+    return expiry, OrderReleaseQueue(dispatcher, expiry)
+
+
+# Global order timers
+expiry_scheduler, release_queue = _create_schedulers()
@@ -152,6 +152,7 @@ class TaxiOrderResponse(BaseModel):
     time_start: str
     time_end: str
     scheduled_datetime: Optional[datetime]  # Scheduled pickup datetime
+    released_at: Optional[datetime] = None  # When the order was offered to drivers (None = waiting for release)
     price: Decimal
     service_fee: Decimal
     driver_earnings: Decimal
@@ -211,6 +212,7 @@ class DeliveryOrderResponse(BaseModel):
     time_start: str
     time_end: str
     scheduled_datetime: Optional[datetime]  # Scheduled pickup datetime
+    released_at: Optional[datetime] = None  # When the order was offered to drivers (None = waiting for release)
     price: Decimal
     service_fee: Decimal
     driver_earnings: Decimal
@@ -0,0 +1,147 @@
+"""
+Fast JSON serialization for list endpoints
+Encoders are generated once per (model, field list): each is a plain function
+returning a dict literal, with Decimal columns turned into strings (like the
+Pydantic schemas do) and everything else left for orjson, which handles
+datetimes and enums natively. Routes return ORJSONResponse(...) directly,
+which skips FastAPI's response_model validation and jsonable_encoder pass.
+
+List views also support sparse fieldsets (?fields=id,price,...): only the
+requested columns are loaded (load_only) and encoded. Subset encoders share a
+bounded LRU cache, since clients can ask for any of 2^n field combinations;
+each view keeps its full encoder itself.
+"""
+from decimal import Decimal
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Sequence, Set, Tuple
+import orjson
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import Numeric
+from sqlalchemy.orm import Query, load_only
+from app.models import TaxiOrder, DeliveryOrder
+from app.schemas import TaxiOrderResponse, DeliveryOrderResponse
+
+Encoder = Callable[[object], dict]
+
+ENCODER_CACHE_SIZE = 256  # compiled (model, fields) encoders kept for sparse fieldsets
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (Decimal as string, datetimes as ISO 8601)"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache(maxsize=ENCODER_CACHE_SIZE)
+def _compile(model, fields: Tuple[str, ...], constants: Tuple[Tuple[str, object], ...]) -> Encoder:
+    columns = model.__table__.columns
+    items = [f"{name!r}: __constants[{name!r}]" for name, _ in constants]
+    for name in fields:
+        column = columns.get(name)
+        if column is not None and isinstance(column.type, Numeric):
+            value = f"str(o.{name})" if not column.nullable else f"(None if o.{name} is None else str(o.{name}))"
+        else:
+            value = f"o.{name}"
+        items.append(f"{name!r}: {value}")
+    source = f"def encode(o):\n    return {{{', '.join(items)}}}\n"
+    namespace = {"__constants": dict(constants)}
+    exec(compile(source, f"<encoder {model.__name__}>", "exec"), namespace)
+    return namespace["encode"]
+
+
+def model_encoder(model, fields: Sequence[str], constants: Optional[Dict[str, object]] = None) -> Encoder:
+    """
+    Encoder turning a `model` instance into a dict of `fields` (plus fixed `constants`).
+    Compiled on first use and kept in an LRU cache, so it is cheap to call per request.
+    """
+    return _compile(model, tuple(fields), tuple((constants or {}).items()))
+
+
+class ListView:
+    """The fields a list endpoint returns for one model, with their compiled encoder"""
+
+    def __init__(self, model, fields: Sequence[str], constants: Optional[Dict[str, object]] = None):
+        self.model = model
+        self.fields = tuple(fields)
+        self.constants = constants or {}
+        self.encode = model_encoder(model, self.fields, self.constants)
+
+    def __call__(self, obj) -> dict:
+        return self.encode(obj)
+
+    def select(self, query: Query, requested: Optional[Set[str]]) -> Tuple[Query, Encoder]:
+        """
+        Restrict `query` to the requested fields of this view (all of them when
+        `requested` is None). Returns the query and the encoder to use for its rows.
+        """
+        if requested is None:
+            return query, self.encode
+        fields = [name for name in self.fields if name in requested or name == "id"]
+        query = query.options(load_only(*(getattr(self.model, name) for name in fields)))
+        return query, model_encoder(self.model, fields, self.constants)
+
+
+def parse_fields(fields: Optional[str], *views: ListView) -> Optional[Set[str]]:
+    """
+    Parse a comma-separated `fields` query parameter. Fields missing from one
+    view (e.g. passengers for delivery orders) are skipped there; names no view
+    knows are rejected. The id is always returned.
+    """
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    known = set()
+    for view in views:
+        known.update(view.fields, view.constants)
+    unknown = requested - known
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(sorted(known))}"
+        )
+    return requested
+
+
+# Same fields as the response schemas
+TAXI_ORDER = ListView(TaxiOrder, list(TaxiOrderResponse.model_fields))
+DELIVERY_ORDER = ListView(DeliveryOrder, list(DeliveryOrderResponse.model_fields))
+
+# Driver app order lists
+_DRIVER_TAXI_FIELDS = (
+    "id", "user_id", "username", "telephone", "from_region_id", "from_district_id",
+    "to_region_id", "to_district_id", "pickup_address", "pickup_latitude", "pickup_longitude",
+    "passengers", "price", "service_fee", "driver_earnings", "date", "time_start", "time_end",
+    "scheduled_datetime", "status", "note",
+)
+_DRIVER_DELIVERY_FIELDS = (
+    "id", "user_id", "username", "sender_telephone", "receiver_telephone", "from_region_id",
+    "from_district_id", "to_region_id", "to_district_id", "pickup_address", "pickup_latitude",
+    "pickup_longitude", "dropoff_address", "dropoff_latitude", "dropoff_longitude", "item_type",
+    "price", "service_fee", "driver_earnings", "date", "time_start", "time_end",
+    "scheduled_datetime", "status", "note",
+)
+
+DRIVER_TAXI_ORDER = ListView(
+    TaxiOrder, _DRIVER_TAXI_FIELDS + ("created_at", "accepted_at", "completed_at"), {"type": "taxi"}
+)
+DRIVER_DELIVERY_ORDER = ListView(
+    DeliveryOrder, _DRIVER_DELIVERY_FIELDS + ("created_at", "accepted_at", "completed_at"), {"type": "delivery"}
+)
+DRIVER_ACTIVE_TAXI_ORDER = ListView(TaxiOrder, _DRIVER_TAXI_FIELDS + ("accepted_at",), {"type": "taxi"})
+DRIVER_ACTIVE_DELIVERY_ORDER = ListView(DeliveryOrder, _DRIVER_DELIVERY_FIELDS + ("accepted_at",), {"type": "delivery"})
+DRIVER_HISTORY_TAXI_ORDER = ListView(TaxiOrder, (
+    "id", "username", "from_region_id", "to_region_id", "passengers", "price", "service_fee",
+    "driver_earnings", "date", "status", "accepted_at", "completed_at",
+), {"type": "taxi"})
+DRIVER_HISTORY_DELIVERY_ORDER = ListView(DeliveryOrder, (
+    "id", "username", "from_region_id", "to_region_id", "item_type", "price", "service_fee",
+    "driver_earnings", "date", "status", "accepted_at", "completed_at",
+), {"type": "delivery"})
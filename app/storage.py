@@ -0,0 +1,97 @@
+"""
+Upload storage
+Uploads are copied to disk in chunks with aiofiles, so the event loop never
+blocks on file I/O. The size limit is enforced while copying and the content
+is hashed on the way, so the stored name (its SHA-256) is known as soon as the
+last chunk arrives. Re-uploading a file that is already stored costs one
+existence check.
+"""
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+import hashlib
+import uuid
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from app.config import settings
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """The upload is larger than the allowed size"""
+
+
+class ReceivedUpload(NamedTuple):
+    sha256: str
+    size: int
+    temp_path: Path  # delete with UploadStorage.discard() once handled
+
+
+class UploadStorage:
+    """Content-addressed files under UPLOAD_DIR/<kind>/"""
+
+    @property
+    def root(self) -> Path:
+        return Path(settings.UPLOAD_DIR)
+
+    @staticmethod
+    def relative_path(kind: str, filename: str) -> str:
+        """Path as stored in the database and served under /uploads"""
+        return f"uploads/{kind}/{filename}"
+
+    async def _temp_path(self) -> Path:
+        temp_dir = self.root / "tmp"
+        await aiofiles.os.makedirs(temp_dir, exist_ok=True)
+        return temp_dir / uuid.uuid4().hex
+
+    async def receive(self, file: UploadFile, max_size: int) -> ReceivedUpload:
+        """Copy an upload to a temporary file, hashing it and enforcing `max_size` as it streams"""
+        temp_path = await self._temp_path()
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(temp_path, "wb") as out:
+                while chunk := await file.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise UploadTooLargeError(
+                            f"File size exceeds maximum allowed size of {max_size / 1024 / 1024}MB"
+                        )
+                    digest.update(chunk)
+                    await out.write(chunk)
+        except BaseException:
+            await aiofiles.os.remove(temp_path)
+            raise
+        return ReceivedUpload(digest.hexdigest(), size, temp_path)
+
+    async def read(self, upload: ReceivedUpload) -> bytes:
+        async with aiofiles.open(upload.temp_path, "rb") as f:
+            return await f.read()
+
+    async def discard(self, upload: ReceivedUpload):
+        try:
+            await aiofiles.os.remove(upload.temp_path)
+        except FileNotFoundError:
+            pass
+
+    async def find(self, kind: str, names: Iterable[str]) -> Optional[str]:
+        """Relative path of the first of `names` already stored under `kind`, if any"""
+        for name in names:
+            if await aiofiles.os.path.isfile(self.root / kind / name):
+                return self.relative_path(kind, name)
+        return None
+
+    async def write(self, kind: str, filename: str, data: bytes) -> str:
+        """Store `data` atomically (temp file + rename) and return its relative path"""
+        directory = self.root / kind
+        await aiofiles.os.makedirs(directory, exist_ok=True)
+        temp_path = await self._temp_path()
+        async with aiofiles.open(temp_path, "wb") as out:
+            await out.write(data)
+        await aiofiles.os.replace(temp_path, directory / filename)
+        return self.relative_path(kind, filename)
+
+
+# Global upload storage
+storage = UploadStorage()
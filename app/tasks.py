@@ -0,0 +1,96 @@
+"""
+Background tasks (Celery)
+Side effects that don't need to finish before the response is sent:
+notification fan-out, rating recomputation and queueing Telegram messages
+(delivered by the rate-limited senders in app.telegram_queue).
+
+Run a worker with:
+    celery -A app.tasks worker --loglevel=info
+
+With CELERY_TASK_ALWAYS_EAGER=true (tests, local development) tasks run
+inline in the calling process instead of going through the broker.
+"""
+import time
+from celery import Celery
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.utils import broadcast_notification, update_driver_rating, telegram_chat_ids
+from app.telegram_queue import user_bot_queue, admin_bot_queue
+
+celery_app = Celery(
+    "taxi_service",
+    broker=settings.CELERY_BROKER_URL or settings.REDIS_URL
+)
+celery_app.conf.update(
+    task_always_eager=settings.CELERY_TASK_ALWAYS_EAGER,
+    task_eager_propagates=False,  # a failing side effect must not fail the request
+    task_ignore_result=True,
+    task_acks_late=True,
+    worker_prefetch_multiplier=4,
+    task_serializer="json",
+    accept_content=["json"],
+    # Fail fast when the broker is down so enqueue() can fall back to running inline
+    broker_connection_timeout=2,
+    task_publish_retry=False,
+)
+
+
+# While the broker is unreachable, skip straight to running inline until this time
+_broker_down_until = 0.0
+
+
+def enqueue(task, *args, **kwargs):
+    """
+    Queue a task for the worker. If the broker can't be reached the task
+    runs inline so the side effect isn't lost (same idea as the standalone
+    mode fallback of the WebSocket manager).
+    """
+    global _broker_down_until
+    if time.monotonic() >= _broker_down_until:
+        try:
+            return task.apply_async(args=args, kwargs=kwargs)
+        except Exception as e:
+            _broker_down_until = time.monotonic() + 30
+            print(f"⚠️ Celery broker unavailable ({e}), running tasks inline")
+    return task.apply(args=args, kwargs=kwargs)
+
+
+async def enqueue_async(task, *args, **kwargs):
+    """
+    enqueue() for async routes and background loops: the broker publish (or the
+    inline fallback) runs in the threadpool so a slow broker doesn't stall the event loop
+    """
+    return await run_in_threadpool(enqueue, task, *args, **kwargs)
+
+
+@celery_app.task(name="notifications.broadcast")
+def broadcast_notification_task(target: str, title: str, message: str, notification_type: str, telegram: bool = False):
+    """
+    Create a notification for every active user and/or driver ("users", "drivers" or "all");
+    with telegram=True also queue it for everyone of them with a Telegram chat
+    """
+    db = SessionLocal()
+    try:
+        broadcast_notification(db, target, title, message, notification_type)
+        if telegram:
+            text = f"{title}\n\n{message}"
+            user_bot_queue.push_many((chat_id, text) for chat_id in telegram_chat_ids(db, target))
+    finally:
+        db.close()
+
+
+@celery_app.task(name="ratings.recompute")
+def recompute_driver_rating(driver_id: int):
+    """Recalculate a driver's average rating"""
+    db = SessionLocal()
+    try:
+        update_driver_rating(db, driver_id)
+    finally:
+        db.close()
+
+
+@celery_app.task(name="telegram.send_message")
+def send_telegram_message(text: str, chat_id: str = None):
+    """Queue a message from the admin bot (to the admin group by default)"""
+    admin_bot_queue.push(chat_id or settings.TELEGRAM_ADMIN_CHAT_ID, text)
@@ -0,0 +1,396 @@
+"""
+Rate-limited Telegram delivery
+Messages are queued per chat (in Redis, or in memory in standalone mode) and a
+sender task per bot delivers them within Telegram's limits: a global token
+bucket of TELEGRAM_GLOBAL_RATE messages/s and at most one message per chat
+every TELEGRAM_CHAT_INTERVAL seconds. Messages that pile up for a chat while it
+waits go out together as one digest. A RetryAfter from Telegram pauses the
+whole bot for as long as it asks, and chats that blocked the bot are dropped.
+
+Any process can queue messages (push() is synchronous, for Celery tasks and
+route handlers). With Redis, one sender per bot holds a lock and delivers for
+every node, so the limits hold however many API processes run. Standalone mode
+keeps the queue in the process that pushed, which only works when the sender
+runs there too (CELERY_TASK_ALWAYS_EAGER).
+"""
+from collections import Counter, deque
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import heapq
+import threading
+import time
+import uuid
+import redis
+from starlette.concurrency import run_in_threadpool
+from telegram import Bot
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+from app.config import settings
+from app.metrics import instrument_redis
+
+MAX_MESSAGE_LENGTH = 4096  # Telegram's limit for one text message
+DIGEST_SEPARATOR = "\n\n"
+MAX_DIGEST_MESSAGES = 50  # queued messages looked at when building a digest
+PUSH_BATCH_SIZE = 1000  # messages per Redis pipeline when queueing
+CLAIM_LEASE = 300  # seconds a claimed chat stays out of the ready set while it is being sent to
+RETRY_DELAY = 5  # seconds before retrying a chat after a network error
+SENDER_LOCK_TTL = 15000  # ms
+SENDER_POLL_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `capacity` saved up"""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def take(self) -> float:
+        """Take a token: returns 0, or the seconds to wait before trying again"""
+        now = self.clock()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """Hand out nothing for `seconds`, then start from an empty bucket"""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+def split_message(text: str) -> List[str]:
+    """Texts over Telegram's length limit, cut into sendable pieces"""
+    return [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)] or [text]
+
+
+def build_digest(texts: List[str]) -> Tuple[str, int]:
+    """Join queued messages into one, up to the length limit. Returns (text, messages used)"""
+    digest = texts[0]
+    used = 1
+    for text in texts[1:]:
+        if len(digest) + len(DIGEST_SEPARATOR) + len(text) > MAX_MESSAGE_LENGTH:
+            break
+        digest += DIGEST_SEPARATOR + text
+        used += 1
+    return digest, used
+
+
+class _RedisStore:
+    """
+    telegram:{bot}:chat:{chat_id}  list of pending texts
+    telegram:{bot}:ready           sorted set {chat_id: earliest next send (unix time)}
+    """
+
+    def __init__(self, client: redis.Redis, bot: str):
+        self.redis = client
+        self.prefix = f"telegram:{bot}:chat:"
+        self.ready_key = f"telegram:{bot}:ready"
+        self.lock_key = f"telegram:{bot}:sender"
+
+    def push(self, messages: List[Tuple[str, str]], now: float):
+        pipe = self.redis.pipeline(transaction=False)
+        for chat_id, text in messages:
+            pipe.rpush(self.prefix + chat_id, text)
+            # NX: a chat already waiting keeps its place (and its per-chat spacing)
+            pipe.zadd(self.ready_key, {chat_id: now}, nx=True)
+        pipe.execute()
+
+    def claim_due(self, now: float, limit: int) -> List[str]:
+        chats = self.redis.zrangebyscore(self.ready_key, "-inf", now, start=0, num=limit)
+        if chats:
+            self.redis.zadd(self.ready_key, {chat_id: now + CLAIM_LEASE for chat_id in chats}, xx=True)
+        return chats
+
+    def next_due(self) -> Optional[float]:
+        first = self.redis.zrange(self.ready_key, 0, 0, withscores=True)
+        return first[0][1] if first else None
+
+    def peek(self, chat_id: str, count: int) -> List[str]:
+        return self.redis.lrange(self.prefix + chat_id, 0, count - 1)
+
+    def ack(self, chat_id: str, count: int, next_at: float):
+        """Remove `count` delivered texts and schedule the chat's next send"""
+        pipe = self.redis.pipeline(transaction=False)
+        if count:
+            pipe.ltrim(self.prefix + chat_id, count, -1)
+        pipe.zadd(self.ready_key, {chat_id: next_at})
+        pipe.execute()
+
+    def release_if_empty(self, chat_id: str, now: float):
+        self.redis.zrem(self.ready_key, chat_id)
+        # A push between the two calls put its text in the list first, so it is seen here
+        if self.redis.llen(self.prefix + chat_id):
+            self.redis.zadd(self.ready_key, {chat_id: now}, nx=True)
+
+    def drop(self, chat_id: str):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(self.prefix + chat_id)
+        pipe.zrem(self.ready_key, chat_id)
+        pipe.execute()
+
+    def waiting_chats(self) -> int:
+        return self.redis.zcard(self.ready_key)
+
+    def hold_lock(self, token: str) -> bool:
+        """Take or renew the sender lock; False while another node holds it"""
+        if self.redis.set(self.lock_key, token, nx=True, px=SENDER_LOCK_TTL):
+            return True
+        if self.redis.get(self.lock_key) == token:
+            self.redis.pexpire(self.lock_key, SENDER_LOCK_TTL)
+            return True
+        return False
+
+
+class _LocalStore:
+    """Standalone mode: per-chat deques plus a heap of (next send, chat_id)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()  # push() runs in worker threads
+        self._messages: Dict[str, deque] = {}
+        self._due: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def _schedule(self, chat_id: str, at: float):
+        self._due[chat_id] = at
+        heapq.heappush(self._heap, (at, chat_id))
+
+    def push(self, messages: List[Tuple[str, str]], now: float):
+        with self._lock:
+            for chat_id, text in messages:
+                self._messages.setdefault(chat_id, deque()).append(text)
+                if chat_id not in self._due:
+                    self._schedule(chat_id, now)
+
+    def claim_due(self, now: float, limit: int) -> List[str]:
+        claimed = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(claimed) < limit:
+                at, chat_id = heapq.heappop(self._heap)
+                if self._due.get(chat_id) == at:  # otherwise rescheduled since
+                    self._schedule(chat_id, now + CLAIM_LEASE)
+                    claimed.append(chat_id)
+        return claimed
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def peek(self, chat_id: str, count: int) -> List[str]:
+        with self._lock:
+            return list(islice(self._messages.get(chat_id, ()), count))
+
+    def ack(self, chat_id: str, count: int, next_at: float):
+        with self._lock:
+            queue = self._messages.get(chat_id, deque())
+            for _ in range(min(count, len(queue))):
+                queue.popleft()
+            self._schedule(chat_id, next_at)
+
+    def release_if_empty(self, chat_id: str, now: float):
+        with self._lock:
+            if not self._messages.get(chat_id):
+                self._messages.pop(chat_id, None)
+                self._due.pop(chat_id, None)
+
+    def drop(self, chat_id: str):
+        with self._lock:
+            self._messages.pop(chat_id, None)
+            self._due.pop(chat_id, None)
+
+    def waiting_chats(self) -> int:
+        return len(self._due)
+
+    def hold_lock(self, token: str) -> bool:
+        return True
+
+
+def _create_store(bot: str):
+    try:
+        client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True, socket_connect_timeout=2)
+        client.ping()
+        return _RedisStore(instrument_redis(client, f"telegram_{bot}"), bot)
+    except Exception as e:
+        print(f"⚠️ Redis unavailable for the {bot} bot Telegram queue ({e}), queueing in memory")
+        return _LocalStore()
+
+
+class TelegramDeliveryQueue:
+    """Per-chat message queue for one bot plus the task that delivers it"""
+
+    def __init__(self, name: str, token: str, clock=time.time):
+        self.name = name
+        self.token = token
+        self.clock = clock
+        # Capacity 1: sends are evenly spaced, never a burst on top of the full rate
+        self.bucket = TokenBucket(settings.TELEGRAM_GLOBAL_RATE, 1)
+        self.stats = Counter()  # sent, messages, retry_after, dropped, failed
+        self._store = None
+        self._store_lock = threading.Lock()
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = _create_store(self.name)
+        return self._store
+
+    def push(self, chat_id, text: str):
+        """Queue one message"""
+        self.push_many([(chat_id, text)])
+
+    def push_many(self, messages: Iterable[Tuple[object, str]]):
+        """Queue messages as (chat_id, text) pairs (blocking: call from sync code or a thread)"""
+        batch = []
+        for chat_id, text in messages:
+            batch.extend((str(chat_id), piece) for piece in split_message(text))
+            if len(batch) >= PUSH_BATCH_SIZE:
+                self.store.push(batch, self.clock())
+                batch = []
+        if batch:
+            self.store.push(batch, self.clock())
+        if self._loop is not None:
+            # Sender in this process: deliver now instead of at the next poll
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self, bot: Optional[Bot] = None):
+        """Start delivering (the bot is built from the token and TELEGRAM_API_BASE_URL unless given)"""
+        if bot is None and not self.token:
+            return
+        self._bot = bot or Bot(
+            self.token,
+            base_url=settings.TELEGRAM_API_BASE_URL,
+            request=HTTPXRequest(connection_pool_size=settings.TELEGRAM_SEND_CONCURRENCY)
+        )
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        lock_token = uuid.uuid4().hex
+        lock_checked = float("-inf")
+        while True:
+            try:
+                if time.monotonic() - lock_checked > SENDER_LOCK_TTL / 3000:
+                    if not await run_in_threadpool(self.store.hold_lock, lock_token):
+                        await asyncio.sleep(SENDER_LOCK_TTL / 3000)  # another node is delivering
+                        continue
+                    lock_checked = time.monotonic()
+
+                free = settings.TELEGRAM_SEND_CONCURRENCY - len(self._inflight)
+                if free <= 0:
+                    await asyncio.wait(self._inflight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                chats = await run_in_threadpool(self.store.claim_due, self.clock(), free)
+                for chat_id in chats:
+                    task = asyncio.create_task(self._deliver(chat_id))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+                if chats:
+                    continue
+
+                next_due = await run_in_threadpool(self.store.next_due)
+                timeout = SENDER_POLL_INTERVAL
+                if next_due is not None:
+                    timeout = min(max(next_due - self.clock(), 0.01), timeout)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Telegram sender ({self.name} bot) error: {e}")
+                await asyncio.sleep(1)
+
+    async def _acquire(self):
+        while (wait := self.bucket.take()) > 0:
+            await asyncio.sleep(wait)
+
+    async def _deliver(self, chat_id: str):
+        try:
+            await self._send_next(chat_id)
+        except Exception as e:
+            # The chat stays claimed and is retried once its lease runs out
+            print(f"Telegram sender ({self.name} bot) error for chat {chat_id}: {e}")
+
+    async def _send_next(self, chat_id: str):
+        """Send the next digest for a claimed chat and schedule what is left"""
+        store = self.store
+        try:
+            texts = await run_in_threadpool(store.peek, chat_id, MAX_DIGEST_MESSAGES)
+            if not texts:
+                await run_in_threadpool(store.release_if_empty, chat_id, self.clock())
+                return
+            digest, count = build_digest(texts)
+            await self._acquire()
+            await self._bot.send_message(chat_id=chat_id, text=digest)
+        except RetryAfter as e:
+            # Flood control applies to the whole bot: stop sending for as long as Telegram asks
+            self.stats["retry_after"] += 1
+            self.bucket.pause(e.retry_after)
+            print(f"⚠️ Telegram flood control ({self.name} bot): pausing {e.retry_after}s")
+            await run_in_threadpool(store.ack, chat_id, 0, self.clock() + e.retry_after)
+        except (Forbidden, ChatMigrated) as e:
+            # Blocked the bot, deleted, or moved: nothing queued for it can be delivered
+            self.stats["dropped"] += 1
+            print(f"⚠️ Telegram ({self.name} bot): dropping messages for chat {chat_id}: {e}")
+            await run_in_threadpool(store.drop, chat_id)
+        except BadRequest as e:
+            self.stats["dropped"] += 1
+            if "chat not found" in str(e).lower():
+                print(f"⚠️ Telegram ({self.name} bot): dropping messages for chat {chat_id}: {e}")
+                await run_in_threadpool(store.drop, chat_id)
+            else:
+                # This digest can never be sent as is; skip it, keep the rest
+                print(f"⚠️ Telegram ({self.name} bot): skipping message for chat {chat_id}: {e}")
+                await run_in_threadpool(store.ack, chat_id, count, self.clock() + settings.TELEGRAM_CHAT_INTERVAL)
+        except (TelegramError, OSError) as e:
+            # Network trouble or a Telegram-side error: try this chat again shortly
+            self.stats["failed"] += 1
+            print(f"⚠️ Telegram ({self.name} bot) send failed for chat {chat_id}: {e}")
+            await run_in_threadpool(store.ack, chat_id, 0, self.clock() + RETRY_DELAY)
+        else:
+            self.stats["sent"] += 1
+            self.stats["messages"] += count
+            await run_in_threadpool(store.ack, chat_id, count, self.clock() + settings.TELEGRAM_CHAT_INTERVAL)
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            # Unfinished chats are picked up again once their claim lease runs out
+            await asyncio.wait(self._inflight, timeout=5)
+        if self._bot is not None:
+            # The bot is never initialize()d (that would call getMe at startup), so close its connections directly
+            await self._bot.request.shutdown()
+            self._bot = None
+        self._loop = None
+
+
+# Global delivery queues
+user_bot_queue = TelegramDeliveryQueue("user", settings.USER_BOT_TOKEN)
+admin_bot_queue = TelegramDeliveryQueue("admin", settings.ADMIN_BOT_TOKEN)
@@ -1,4 +1,6 @@
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+from sqlalchemy import func, insert, literal, select
 from sqlalchemy.orm import Session
 from app.models import Pricing, Driver, User, Notification, SystemSettings
 from typing import Optional, Tuple
@@ -6,6 +8,9 @@ from typing import Optional, Tuple
 # Default platform service fee percentage (fallback if not set in DB)
 DEFAULT_SERVICE_FEE_PERCENTAGE = Decimal("10.00")  # 10%
 
+# How long a new order can be accepted by drivers
+ORDER_ACCEPT_WINDOW = timedelta(minutes=5)
+
 
 def get_service_fee_percentage(db: Session) -> Decimal:
     """
@@ -93,13 +98,13 @@ def update_driver_rating(db: Session, driver_id: int):
     """Recalculate driver's average rating"""
     from app.models import Rating
     
-    ratings = db.query(Rating).filter(Rating.driver_id == driver_id).all()
-    if ratings:
-        avg_rating = sum(r.rating for r in ratings) / len(ratings)
-        driver = db.query(Driver).filter(Driver.id == driver_id).first()
-        if driver:
-            driver.rating = Decimal(str(round(avg_rating, 2)))
-            db.commit()
+    avg_rating = db.query(func.avg(Rating.rating)).filter(Rating.driver_id == driver_id).scalar()
+    if avg_rating is not None:
+        db.query(Driver).filter(Driver.id == driver_id).update(
+            {Driver.rating: Decimal(str(round(float(avg_rating), 2)))},
+            synchronize_session=False
+        )
+        db.commit()
 
 
 def create_notification(
@@ -124,17 +129,73 @@ def create_notification(
     return notification
 
 
+def broadcast_notification(db: Session, target: str, title: str, message: str, notification_type: str):
+    """
+    Create the same notification for every active user and/or non-blocked driver
+    (target "users", "drivers" or "all") with one INSERT ... SELECT per audience
+    """
+    audiences = []
+    if target in ("users", "all"):
+        audiences.append((Notification.user_id, select(User.id).where(User.is_active == True)))
+    if target in ("drivers", "all"):
+        audiences.append((Notification.driver_id, select(Driver.id).where(Driver.is_blocked == False)))
+    
+    for recipient_column, recipients in audiences:
+        db.execute(
+            insert(Notification).from_select(
+                [recipient_column, Notification.title, Notification.message,
+                 Notification.notification_type, Notification.is_read],
+                recipients.add_columns(
+                    literal(title), literal(message), literal(notification_type), literal(False)
+                )
+            )
+        )
+    db.commit()
+
+
+def telegram_chat_ids(db: Session, target: str):
+    """Telegram chats of the active users and/or non-blocked drivers a broadcast goes to"""
+    audience = select(User.telegram_chat_id).where(User.is_active == True, User.telegram_chat_id.isnot(None))
+    if target == "drivers":
+        audience = audience.join(Driver, Driver.user_id == User.id).where(Driver.is_blocked == False)
+    return db.execute(audience.distinct().execution_options(yield_per=1000)).scalars()
+
+
 def notify_all_drivers(db: Session, title: str, message: str):
     """Send notification to all active drivers"""
-    drivers = db.query(Driver).filter(Driver.is_blocked == False).all()
-    for driver in drivers:
-        create_notification(
-            db=db,
-            title=title,
-            message=message,
-            notification_type="new_order",
-            driver_id=driver.id
-        )
+    broadcast_notification(db, "drivers", title, message, "new_order")
+
+
+def build_order_event_payload(order, order_type: str) -> dict:
+    """Order summary pushed to drivers over WebSocket (new_order events and snapshots)"""
+    payload = {
+        "id": order.id,
+        "type": order_type,
+        "from_region_id": order.from_region_id,
+        "to_region_id": order.to_region_id,
+    }
+    if order_type == "taxi":
+        payload["passengers"] = order.passengers
+    else:
+        payload["item_type"] = order.item_type.value
+    payload.update({
+        "price": float(order.price),
+        "service_fee": float(order.service_fee),
+        "driver_earnings": float(order.driver_earnings),
+        "date": order.date,
+        "time_start": order.time_start,
+        "time_end": order.time_end,
+        "scheduled_datetime": order.scheduled_datetime.isoformat() if order.scheduled_datetime else None,
+        "created_at": order.created_at.isoformat()
+    })
+    return payload
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Treat naive datetimes (e.g. from SQLite) as UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
 
 
 def check_driver_can_accept_order(db: Session, driver_id: int) -> bool:
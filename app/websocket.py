@@ -3,13 +3,44 @@ WebSocket Connection Manager with Redis PubSub for Real-time Communication
 Handles driver and user connections with multi-server support
 """
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Set, Optional
+from typing import Dict, List, Set, Optional, Tuple
 import json
+import time
+import uuid
 import asyncio
 from datetime import datetime, timezone
 from decimal import Decimal
 import redis.asyncio as redis
 from app.config import settings
+from app.event_log import EventLog, REPLAYABLE_EVENTS
+from app.locations import DriverLocationStore
+from app.metrics import instrument_redis, observe_pubsub_message
+
+
+def _envelope(recipient: Optional[int], message: dict) -> str:
+    """Pub/sub payload: the recipient (None = everyone on the channel), the message and when it was sent"""
+    return json.dumps({"to": recipient, "message": message, "sent_at": time.time()})
+
+
+# Identifies this process in presence entries, so one node's disconnect
+# does not remove a driver or user still connected to another node
+NODE_ID = uuid.uuid4().hex[:12]
+
+# Presence in Redis, per kind ("driver" / "user"):
+# - presence:{kind}s holds one member per id, scored by when any node last saw it,
+#   so counting is a ZCOUNT over the last WS_PRESENCE_TTL seconds
+# - presence:{kind}:{id} holds the nodes the id is connected to, scored the same way,
+#   so a disconnect on one node keeps an id still connected to another
+PRESENCE_KINDS = ("driver", "user")
+
+
+def _queue_presence(pipe, kind: str, owner_ids: List[int], now: float):
+    """Queue last-seen updates for ids connected to this node"""
+    for owner_id in owner_ids:
+        pipe.zadd(f"presence:{kind}:{owner_id}", {NODE_ID: now})
+        pipe.expire(f"presence:{kind}:{owner_id}", settings.WS_PRESENCE_TTL)
+    if owner_ids:
+        pipe.zadd(f"presence:{kind}s", {str(owner_id): now for owner_id in owner_ids}, gt=True)
 
 
 class ConnectionManager:
@@ -28,10 +59,24 @@ class ConnectionManager:
         # Track order locks when driver clicks accept (temporary 5 second lock)
         self.order_locks: Dict[int, tuple] = {}  # {order_id: (driver_id, timestamp)}
         
+        # Sequence-numbered log of durable events for reconnect replay
+        self.events = EventLog()
+        
+        # Latest driver positions and the orders each driver is serving
+        self.locations = DriverLocationStore()
+        
+        # Last time each local connection was heard from (monotonic seconds)
+        self.last_seen: Dict[WebSocket, float] = {}
+        
+        # Connections that have answered a heartbeat with a pong; only these are
+        # reaped for being silent, older clients are dropped when a send fails
+        self.heartbeat_acks: Set[WebSocket] = set()
+        
         # Redis connection pool
         self.redis_pool: Optional[redis.Redis] = None
         self.pubsub: Optional[redis.client.PubSub] = None
         self._redis_listener_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
     
     async def init_redis(self):
         """Initialize Redis connection pool"""
@@ -45,6 +90,9 @@ class ConnectionManager:
             # Test connection
             await self.redis_pool.ping()
             print("✅ Redis connected successfully")
+            instrument_redis(self.redis_pool, "app")
+            self.events.redis_pool = self.redis_pool
+            self.locations.redis_pool = self.redis_pool
             
             # Start Redis PubSub listener
             self._redis_listener_task = asyncio.create_task(self._redis_listener())
@@ -52,6 +100,109 @@ class ConnectionManager:
             print(f"⚠️ Redis connection failed: {e}. Running in standalone mode.")
             self.redis_pool = None
     
+    def start_heartbeat(self):
+        """Start the server-driven heartbeat / presence refresh loop"""
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+    
+    async def _heartbeat_loop(self):
+        """
+        Periodically ping every local connection, reap idle ones and refresh
+        this node's presence entries in Redis.
+        
+        Presence entries are scored by last-seen time, so the ones left behind
+        by a crashed node simply age out instead of being counted forever.
+        """
+        while True:
+            try:
+                await self._reap_idle_connections()
+                await self._refresh_presence()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Heartbeat error: {e}")
+            await asyncio.sleep(settings.WS_HEARTBEAT_INTERVAL)
+    
+    async def _reap_idle_connections(self):
+        """
+        Close connections that stopped answering heartbeats, ping the rest.
+        Clients that never replied to a heartbeat are only dropped when a send fails.
+        """
+        now = time.monotonic()
+        heartbeat = {"type": "heartbeat", "timestamp": datetime.now(timezone.utc).isoformat()}
+        
+        for connections, disconnect in (
+            (self.driver_connections, self.disconnect_driver),
+            (self.user_connections, self.disconnect_user),
+        ):
+            for owner_id, sockets in list(connections.items()):
+                for websocket in list(sockets):
+                    idle = now - self.last_seen.get(websocket, now)
+                    if websocket in self.heartbeat_acks and idle > settings.WS_IDLE_TIMEOUT:
+                        print(f"⏱️ Reaping idle connection for {owner_id} (silent {int(idle)}s)")
+                        disconnect(websocket, owner_id)
+                        try:
+                            await websocket.close(code=1001, reason="Idle timeout")
+                        except:
+                            pass
+                        continue
+                    try:
+                        await websocket.send_json(heartbeat)
+                    except:
+                        disconnect(websocket, owner_id)
+    
+    async def _refresh_presence(self):
+        """Bump last-seen scores for local connections and drop stale entries"""
+        if not self.redis_pool:
+            return
+        
+        now = time.time()
+        pipe = self.redis_pool.pipeline(transaction=False)
+        _queue_presence(pipe, "driver", list(self.driver_connections), now)
+        _queue_presence(pipe, "user", list(self.user_connections), now)
+        for kind in PRESENCE_KINDS:
+            pipe.zremrangebyscore(f"presence:{kind}s", "-inf", now - settings.WS_PRESENCE_TTL)
+        await pipe.execute()
+    
+    async def _mark_present(self, kind: str, owner_id: int):
+        """Record a new local connection in Redis"""
+        if not self.redis_pool:
+            return
+        try:
+            pipe = self.redis_pool.pipeline(transaction=False)
+            _queue_presence(pipe, kind, [owner_id], time.time())
+            await pipe.execute()
+        except Exception as e:
+            print(f"Redis presence error: {e}")
+    
+    async def _mark_absent(self, kind: str, owner_id: int):
+        """
+        Remove this node from an id's presence. The id keeps the last-seen time of
+        the other nodes it is connected to, or leaves the presence set if there are none.
+        A connect racing this on another node is restored by that node's next refresh.
+        """
+        nodes_key = f"presence:{kind}:{owner_id}"
+        try:
+            pipe = self.redis_pool.pipeline(transaction=False)
+            pipe.zrem(nodes_key, NODE_ID)
+            pipe.zrevrange(nodes_key, 0, 0, withscores=True)
+            _, latest = await pipe.execute()
+            if latest:
+                await self.redis_pool.zadd(f"presence:{kind}s", {str(owner_id): latest[0][1]})
+            else:
+                await self.redis_pool.zrem(f"presence:{kind}s", str(owner_id))
+        except Exception as e:
+            print(f"Redis presence error: {e}")
+    
+    def touch(self, websocket: WebSocket):
+        """Record that a connection has just been heard from"""
+        self.last_seen[websocket] = time.monotonic()
+    
+    def ack_heartbeat(self, websocket: WebSocket):
+        """Record a pong: the client speaks the heartbeat protocol and can be reaped when silent"""
+        self.heartbeat_acks.add(websocket)
+        self.touch(websocket)
+    
     async def _redis_listener(self):
         """Listen to Redis PubSub channels and broadcast to local WebSocket connections"""
         if not self.redis_pool:
@@ -69,18 +220,22 @@ class ConnectionManager:
             async for message in self.pubsub.listen():
                 if message["type"] == "message":
                     try:
+                        # Envelope: {"to": recipient_id or None, "message": {...}}
                         data = json.loads(message["data"])
                         channel = message["channel"]
+                        observe_pubsub_message(channel, data.get("sent_at"))
+                        recipient = data.get("to")
                         
                         if channel == "drivers_channel":
-                            # Broadcast to all local driver connections
-                            await self._broadcast_local_drivers(data)
+                            if recipient is not None:
+                                await self._send_to_local_driver(recipient, data["message"])
+                            else:
+                                await self._broadcast_local_drivers(data["message"])
                         elif channel == "users_channel":
-                            # Check if message is for specific user or all users
-                            if "user_id" in data:
-                                await self._send_local_user(data["user_id"], data["message"])
+                            if recipient is not None:
+                                await self._send_to_local_user(recipient, data["message"])
                             else:
-                                await self._broadcast_local_users(data)
+                                await self._broadcast_local_users(data["message"])
                     except Exception as e:
                         print(f"Error processing Redis message: {e}")
         except Exception as e:
@@ -128,14 +283,11 @@ class ConnectionManager:
         if driver_id not in self.driver_connections:
             self.driver_connections[driver_id] = []
         self.driver_connections[driver_id].append(websocket)
+        self.touch(websocket)
         print(f"✅ Driver {driver_id} connected. Total driver connections: {len(self.driver_connections)}")
         
         # Store in Redis for tracking across servers
-        if self.redis_pool:
-            try:
-                await self.redis_pool.sadd("active_drivers", str(driver_id))
-            except:
-                pass
+        await self._mark_present("driver", driver_id)
     
     async def connect_user(self, websocket: WebSocket, user_id: int):
         """Connect a user to WebSocket"""
@@ -143,29 +295,31 @@ class ConnectionManager:
         if user_id not in self.user_connections:
             self.user_connections[user_id] = []
         self.user_connections[user_id].append(websocket)
+        self.touch(websocket)
         print(f"✅ User {user_id} connected. Total user connections: {len(self.user_connections)}")
         
         # Store in Redis for tracking across servers
-        if self.redis_pool:
-            try:
-                await self.redis_pool.sadd("active_users", str(user_id))
-            except:
-                pass
+        await self._mark_present("user", user_id)
     
     def disconnect_driver(self, websocket: WebSocket, driver_id: int):
         """Disconnect a driver from WebSocket"""
+        self.last_seen.pop(websocket, None)
+        self.heartbeat_acks.discard(websocket)
         if driver_id in self.driver_connections:
             if websocket in self.driver_connections[driver_id]:
                 self.driver_connections[driver_id].remove(websocket)
             if not self.driver_connections[driver_id]:
                 del self.driver_connections[driver_id]
+                self.locations.forget_driver(driver_id)
                 # Remove from Redis
                 if self.redis_pool:
-                    asyncio.create_task(self.redis_pool.srem("active_drivers", str(driver_id)))
+                    asyncio.create_task(self._mark_absent("driver", driver_id))
         print(f"❌ Driver {driver_id} disconnected. Remaining drivers: {len(self.driver_connections)}")
     
     def disconnect_user(self, websocket: WebSocket, user_id: int):
         """Disconnect a user from WebSocket"""
+        self.last_seen.pop(websocket, None)
+        self.heartbeat_acks.discard(websocket)
         if user_id in self.user_connections:
             if websocket in self.user_connections[user_id]:
                 self.user_connections[user_id].remove(websocket)
@@ -173,17 +327,24 @@ class ConnectionManager:
                 del self.user_connections[user_id]
                 # Remove from Redis
                 if self.redis_pool:
-                    asyncio.create_task(self.redis_pool.srem("active_users", str(user_id)))
+                    asyncio.create_task(self._mark_absent("user", user_id))
         print(f"❌ User {user_id} disconnected. Remaining users: {len(self.user_connections)}")
     
+    async def _stamp(self, stream: str, message: dict) -> dict:
+        """Record replayable events in the event log and add their sequence number"""
+        if message.get("type") in REPLAYABLE_EVENTS:
+            return await self.events.append(stream, message)
+        return message
+    
     async def send_to_driver(self, driver_id: int, message: dict):
         """Send message to a specific driver (all their connections across all servers)"""
+        message = await self._stamp(f"driver:{driver_id}", message)
         if self.redis_pool:
             # Use Redis PubSub to reach driver on any server
             try:
                 await self.redis_pool.publish(
                     "drivers_channel",
-                    json.dumps({"driver_id": driver_id, "message": message})
+                    _envelope(driver_id, message)
                 )
             except Exception as e:
                 print(f"Redis publish error: {e}")
@@ -195,12 +356,13 @@ class ConnectionManager:
     
     async def send_to_user(self, user_id: int, message: dict):
         """Send message to a specific user (all their connections across all servers)"""
+        message = await self._stamp(f"user:{user_id}", message)
         if self.redis_pool:
             # Use Redis PubSub to reach user on any server
             try:
                 await self.redis_pool.publish(
                     "users_channel",
-                    json.dumps({"user_id": user_id, "message": message})
+                    _envelope(user_id, message)
                 )
             except Exception as e:
                 print(f"Redis publish error: {e}")
@@ -212,9 +374,10 @@ class ConnectionManager:
     
     async def broadcast_to_all_drivers(self, message: dict):
         """Send message to all connected drivers across all servers"""
+        message = await self._stamp("drivers", message)
         if self.redis_pool:
             try:
-                await self.redis_pool.publish("drivers_channel", json.dumps(message))
+                await self.redis_pool.publish("drivers_channel", _envelope(None, message))
             except Exception as e:
                 print(f"Redis broadcast error: {e}")
                 await self._broadcast_local_drivers(message)
@@ -223,15 +386,60 @@ class ConnectionManager:
     
     async def broadcast_to_all_users(self, message: dict):
         """Send message to all connected users across all servers"""
+        message = await self._stamp("users", message)
         if self.redis_pool:
             try:
-                await self.redis_pool.publish("users_channel", json.dumps(message))
+                await self.redis_pool.publish("users_channel", _envelope(None, message))
             except Exception as e:
                 print(f"Redis broadcast error: {e}")
                 await self._broadcast_local_users(message)
         else:
             await self._broadcast_local_users(message)
     
+    @staticmethod
+    def _route(stream: str):
+        """Map an event stream name to (pubsub channel, recipient id or None)"""
+        audience, _, recipient = stream.partition(":")
+        channel = "drivers_channel" if audience in ("drivers", "driver") else "users_channel"
+        return channel, int(recipient) if recipient else None
+    
+    async def _deliver_local(self, stream: str, message: dict):
+        channel, recipient = self._route(stream)
+        if channel == "drivers_channel":
+            if recipient is not None:
+                await self._send_to_local_driver(recipient, message)
+            else:
+                await self._broadcast_local_drivers(message)
+        elif recipient is not None:
+            await self._send_to_local_user(recipient, message)
+        else:
+            await self._broadcast_local_users(message)
+    
+    async def publish_many(self, events: List[Tuple[str, dict]]):
+        """
+        Deliver a batch of (stream, message) events, e.g. from the outbox.
+        Streams: "drivers", "users", "driver:{id}", "user:{id}".
+        Replayable events are stamped and everything is published in one pipeline.
+        """
+        replayable = [i for i, (_, message) in enumerate(events) if message.get("type") in REPLAYABLE_EVENTS]
+        events = list(events)
+        for i, stamped in zip(replayable, await self.events.append_many([events[i] for i in replayable])):
+            events[i] = (events[i][0], stamped)
+        
+        if self.redis_pool:
+            try:
+                pipe = self.redis_pool.pipeline(transaction=False)
+                for stream, message in events:
+                    channel, recipient = self._route(stream)
+                    pipe.publish(channel, _envelope(recipient, message))
+                await pipe.execute()
+                return
+            except Exception as e:
+                print(f"Redis publish error: {e}")
+        
+        for stream, message in events:
+            await self._deliver_local(stream, message)
+    
     def add_order_viewer(self, order_id: int, driver_id: int):
         """Track that a driver is viewing an order"""
         if order_id not in self.order_viewers:
@@ -300,7 +508,22 @@ class ConnectionManager:
         
         self.order_locks[order_id] = (driver_id, current_time)
         return True
-    
+
+    async def may_accept_order(self, order_id: int, driver_id: int) -> bool:
+        """True unless another driver currently holds the accept lock for an order"""
+        if self.redis_pool:
+            try:
+                holder = await self.redis_pool.get(f"order_lock:{order_id}")
+                return holder is None or int(holder) == driver_id
+            except Exception as e:
+                print(f"Redis lock error: {e}")
+
+        if order_id in self.order_locks:
+            locked_driver_id, lock_time = self.order_locks[order_id]
+            if (datetime.now(timezone.utc) - lock_time).total_seconds() < 5:
+                return locked_driver_id == driver_id
+        return True
+
     async def release_order_lock(self, order_id: int):
         """Release order lock"""
         if self.redis_pool:
@@ -312,12 +535,15 @@ class ConnectionManager:
         if order_id in self.order_locks:
             del self.order_locks[order_id]
     
+    async def _count_present(self, kind: str) -> int:
+        """Distinct ids seen by any node within WS_PRESENCE_TTL (a ZCOUNT, not a scan)"""
+        return await self.redis_pool.zcount(f"presence:{kind}s", time.time() - settings.WS_PRESENCE_TTL, "+inf")
+    
     async def get_active_driver_count(self) -> int:
         """Get count of active drivers across all servers"""
         if self.redis_pool:
             try:
-                count = await self.redis_pool.scard("active_drivers")
-                return count
+                return await self._count_present("driver")
             except:
                 pass
         return len(self.driver_connections)
@@ -326,14 +552,15 @@ class ConnectionManager:
         """Get count of active users across all servers"""
         if self.redis_pool:
             try:
-                count = await self.redis_pool.scard("active_users")
-                return count
+                return await self._count_present("user")
             except:
                 pass
         return len(self.user_connections)
     
     async def cleanup(self):
         """Cleanup Redis connections on shutdown"""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
         if self._redis_listener_task:
             self._redis_listener_task.cancel()
         if self.pubsub:
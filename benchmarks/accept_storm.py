@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Accept-storm simulator
+Runs the app under uvicorn in-process, connects --drivers virtual drivers to
+/ws/driver and creates orders one at a time. Orders have no pickup point, so
+each one is broadcast to every driver at once and they all race for it the way
+the driver app does: after a random reaction time each driver sends
+request_lock and, once it holds the lock, POSTs /api/driver/orders/accept.
+A --skip-lock-share of drivers POST the accept even when the lock was refused,
+like old or misbehaving clients. Drivers that see order_accepted before they
+react drop out.
+
+Reported per locking mode (Redis, fakeredis unless --redis-url, and
+standalone, the in-process fallback when Redis is down):
+  time to accept   order creation to the winning accept response
+  lock outcomes    granted / refused, and locks granted to a second driver
+                   before the order row was accepted (mutual exclusion broken)
+                   or after it was (the lock is released on accept)
+  accept outcomes  HTTP status counts of the accept calls
+  violations       more than one successful accept per order, or a database
+                   row that does not name the winner
+  database load    statements during the race by verb, and the peak number of
+                   pooled connections in use
+
+Each mode runs in a fresh process. Results are printed and written to a JSON
+report like benchmarks.load_test's.
+
+Usage: python -m benchmarks.accept_storm [--drivers 300] [--rounds 5] [--modes redis,standalone] [--reaction-ms 300]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.load_test import DB_PATH, PERCENTILES, auth, configure, git_commit, order_body, seed
+
+MODES = ("redis", "standalone")
+UNREACHABLE_REDIS_URL = "redis://127.0.0.1:1/0"
+REPLY_TIMEOUT = 30  # seconds a driver waits for the broadcast or a lock reply
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--drivers", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=5, help="orders raced for, one after another")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--reaction-ms", type=float, default=300, help="drivers react after 0..this many ms")
+    parser.add_argument("--skip-lock-share", type=float, default=0.1, help="share of drivers that POST accept without the lock")
+    parser.add_argument("--database-url", default="", help="scratch PostgreSQL database (tables are dropped!); default: a temporary SQLite file")
+    parser.add_argument("--redis-url", default="", help="real Redis for the redis mode instead of fakeredis")
+    parser.add_argument("--report", default="accept_storm_report.json")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+    # What benchmarks.load_test.seed() needs: one customer places every order
+    args.customers, args.pending_orders = 1, 0
+    return args
+
+
+class DatabaseLoad:
+    """Counts SQL statements and pooled connections in use on the app's engine"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.statements = Counter()
+        self.in_use = 0
+        self.peak_in_use = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine.pool, "checkout", self._on_checkout)
+        event.listen(engine.pool, "checkin", self._on_checkin)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements[statement.lstrip().split(None, 1)[0].upper()] += 1
+
+    def _on_checkout(self, *args):
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _on_checkin(self, *args):
+        self.in_use -= 1
+
+    def reset(self):
+        self.statements.clear()
+        self.peak_in_use = self.in_use
+
+
+class VirtualDriver:
+    """One driver app: a WebSocket connection and an HTTP client"""
+
+    def __init__(self, token: str, rng: random.Random, skips_lock: bool):
+        self.driver_id = None
+        self.token = token
+        self.rng = rng
+        self.skips_lock = skips_lock
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.websocket = None
+        self._reader = None
+
+    async def connect(self, base_url: str):
+        import websockets
+        self.websocket = await websockets.connect(f"{base_url.replace('http', 'ws', 1)}/ws/driver/{self.token}", max_queue=None)
+        connected = json.loads(await self.websocket.recv())
+        self.driver_id = connected["driver_id"]
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for raw in self.websocket:
+            message = json.loads(raw)
+            if message.get("type") == "heartbeat":
+                await self.websocket.send(json.dumps({"type": "pong"}))
+            else:
+                self.inbox.put_nowait(message)
+
+    async def _next(self, match, deadline: float):
+        """Next inbox message that match() accepts, or None at the deadline"""
+        while True:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                return None
+            try:
+                message = await asyncio.wait_for(self.inbox.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if match(message):
+                return message
+
+    async def race(self, http, reaction: float, outcome) -> None:
+        """Wait for the next broadcast order and try to take it"""
+        offer = await self._next(lambda m: m.get("type") == "new_order", time.perf_counter() + REPLY_TIMEOUT)
+        if offer is None:
+            outcome.drivers["no_offer"] += 1
+            return
+        order_id = offer["order"]["id"]
+        taken = lambda m: m.get("type") == "order_accepted" and m.get("order_id") == order_id
+        if await self._next(taken, time.perf_counter() + reaction):
+            outcome.drivers["saw_accepted"] += 1
+            return
+
+        await self.websocket.send(json.dumps({"type": "request_lock", "order_id": order_id, "order_type": "taxi"}))
+        reply = await self._next(lambda m: m.get("type") in ("lock_acquired", "lock_failed") and m.get("order_id") == order_id,
+                                 time.perf_counter() + REPLY_TIMEOUT)
+        if reply is None:
+            outcome.locks["no_reply"] += 1
+            return
+        acquired = reply["type"] == "lock_acquired"
+        outcome.lock_acquired(acquired)
+        if not acquired and not self.skips_lock:
+            return
+
+        response = await http.post(f"/api/driver/orders/accept/taxi/{order_id}", headers=auth(self.token))
+        success = response.status_code == 200 and response.json().get("success") is True
+        outcome.accept_response(self.driver_id, response.status_code, success, acquired)
+
+
+class RoundOutcome:
+    """What happened while the drivers raced for one order"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.drivers = Counter()
+        self.locks = Counter()
+        self.accepts = Counter()
+        self.winners = []
+        self.grants = []  # wall-clock times locks were received
+        self.accepted_after = None  # seconds from order creation to the first successful accept
+
+    def lock_acquired(self, acquired: bool):
+        if acquired:
+            self.grants.append(time.time())
+        else:
+            self.locks["refused"] += 1
+
+    def classify_grants(self, accepted_at: Optional[float]):
+        """Split lock grants into before and after the order row was accepted (server time)"""
+        before = [t for t in self.grants if accepted_at is None or t < accepted_at]
+        self.locks["granted"] += min(len(before), 1)
+        if len(before) > 1:
+            self.locks["granted_while_held"] += len(before) - 1
+        if len(self.grants) > len(before):
+            self.locks["granted_after_accept"] += len(self.grants) - len(before)
+
+    def accept_response(self, driver_id: int, status: int, success: bool, had_lock: bool):
+        self.accepts[f"{status}{'' if had_lock else ' without lock'}"] += 1
+        if success:
+            self.winners.append(driver_id)
+            if self.accepted_after is None:
+                self.accepted_after = time.perf_counter() - self.started
+
+
+def percentiles(values) -> dict:
+    values = sorted(values)
+    if not values:
+        return {}
+    result = {f"p{p}": round(values[max(0, -(-len(values) * p // 100) - 1)] * 1000, 1) for p in PERCENTILES}
+    result["max"] = round(values[-1] * 1000, 1)
+    return result
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def storm(args, data) -> dict:
+    import httpx
+    import uvicorn
+    import main as app_main
+    from app.database import SessionLocal, engine
+    from app.models import TaxiOrder
+    from app.utils import as_utc
+    from app.websocket import manager
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+    redis_mode = manager.redis_pool is not None
+
+    rng = random.Random(args.seed)
+    drivers = [VirtualDriver(token, random.Random(rng.random()), rng.random() < args.skip_lock_share) for token in data["drivers"]]
+    load = DatabaseLoad(engine)
+    rounds = []
+    limits = httpx.Limits(max_connections=args.drivers + 1, max_keepalive_connections=args.drivers + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=REPLY_TIMEOUT) as http:
+        for n in range(0, len(drivers), 50):
+            await asyncio.gather(*(driver.connect(base_url) for driver in drivers[n:n + 50]))
+
+        for number in range(1, args.rounds + 1):
+            load.reset()
+            started = time.perf_counter()
+            outcome = RoundOutcome(started)
+            racing = [asyncio.create_task(driver.race(http, driver.rng.uniform(0, args.reaction_ms / 1000), outcome))
+                      for driver in drivers]
+            body = order_body(rng, data["regions"], data["districts"])
+            del body["pickup_latitude"], body["pickup_longitude"]  # broadcast to everyone at once
+            response = await http.post("/api/taxi-orders/", json=body, headers=auth(data["customers"][0]))
+            response.raise_for_status()
+            order_id = response.json()["id"]
+            creation = dict(load.statements)
+            load.statements.clear()
+            await asyncio.gather(*racing)
+            elapsed = time.perf_counter() - started
+
+            db = SessionLocal()
+            try:
+                order = db.get(TaxiOrder, order_id)
+                status, winner_id = order.status.value, order.driver_id
+                accepted_at = as_utc(order.accepted_at).timestamp() if order.accepted_at else None
+            finally:
+                db.close()
+            outcome.classify_grants(accepted_at)
+            violations = []
+            if len(outcome.winners) > 1:
+                violations.append(f"{len(outcome.winners)} successful accepts")
+            if outcome.winners and winner_id != outcome.winners[0]:
+                violations.append(f"order row names driver {winner_id}, accept went to {outcome.winners[0]}")
+            if not outcome.winners:
+                violations.append(f"nobody accepted (status {status})")
+            if outcome.locks["granted_while_held"]:
+                violations.append(f"lock granted to {outcome.locks['granted_while_held'] + 1} drivers at once")
+
+            rounds.append({
+                "order_id": order_id,
+                "time_to_accept_ms": round(outcome.accepted_after * 1000, 1) if outcome.accepted_after else None,
+                "race_ms": round(elapsed * 1000, 1),
+                "drivers": dict(outcome.drivers),
+                "locks": dict(outcome.locks),
+                "accepts": dict(outcome.accepts),
+                "violations": violations,
+                "db_statements": {"order_creation": creation, "race": dict(load.statements)},
+                "db_peak_connections": load.peak_in_use,
+            })
+            print(f"  round {number}: accepted after {rounds[-1]['time_to_accept_ms']} ms, drivers {dict(outcome.drivers)}, locks {dict(outcome.locks)}, "
+                  f"accepts {dict(outcome.accepts)}, {sum(load.statements.values())} statements"
+                  + (f", VIOLATIONS: {'; '.join(violations)}" if violations else ""))
+            await asyncio.sleep(0.5)  # let the order_accepted fan-out settle before the next order
+
+        for driver in drivers:
+            await driver.websocket.close()
+    server.should_exit = True
+    await server_task
+
+    total = lambda field: sum((Counter(r[field]) for r in rounds), Counter())
+    return {
+        "locking": "redis" if redis_mode else "standalone",
+        "time_to_accept_ms": percentiles([r["time_to_accept_ms"] / 1000 for r in rounds if r["time_to_accept_ms"]]),
+        "race_ms": percentiles([r["race_ms"] / 1000 for r in rounds]),
+        "locks": dict(total("locks")),
+        "accepts": dict(total("accepts")),
+        "violations": sum(len(r["violations"]) for r in rounds),
+        "db_statements_per_race": {verb: round(n / len(rounds), 1) for verb, n in
+                                   sum((Counter(r["db_statements"]["race"]) for r in rounds), Counter()).items()},
+        "db_peak_connections": max(r["db_peak_connections"] for r in rounds),
+        "rounds": rounds,
+    }
+
+
+def run_mode(args, mode: str) -> dict:
+    """One locking mode in this (fresh) process"""
+    args.redis_url = args.redis_url if mode == "redis" else UNREACHABLE_REDIS_URL
+    configure(args)
+    data = seed(args)
+    try:
+        return asyncio.run(storm(args, data))
+    finally:
+        if not args.database_url:
+            DB_PATH.unlink(missing_ok=True)
+
+
+def print_result(mode: str, result: dict):
+    print(f"{mode} (locking: {result['locking']}): time to accept {result['time_to_accept_ms']}, "
+          f"race {result['race_ms'].get('p50')} ms p50")
+    print(f"  locks {result['locks']}")
+    print(f"  accepts {result['accepts']}")
+    print(f"  violations {result['violations']}, db statements per race {result['db_statements_per_race']}, "
+          f"peak db connections {result['db_peak_connections']}")
+
+
+def main():
+    args = parse_args()
+    results = {}
+    for mode in args.modes:
+        print(f"⏱️ {mode}: {args.drivers} drivers, {args.rounds} orders")
+        # A fresh process per mode, like separate deployments: the app's singletons start clean
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[mode] = pool.submit(run_mode, args, mode).result()
+
+    for mode, result in results.items():
+        print_result(mode, result)
+    report = {
+        "meta": {
+            **git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "database": "postgresql" if args.database_url else "sqlite",
+            "redis": "redis" if args.redis_url else "fakeredis",
+            "args": {key: value for key, value in vars(args).items() if key not in ("database_url", "redis_url", "report")},
+        },
+        "modes": results,
+    }
+    Path(args.report).write_text(json.dumps(report, indent=2))
+    print(f"report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Telegram bot handler load test
+Drives many simulated chats through the real user and admin bot applications
+(handlers, ConversationHandler, per-chat update processor and the async
+database layer in bot.db) against a seeded SQLite database. The Telegram API is
+replaced by an in-process fake that answers after --api-latency-ms, so the run
+measures the bots and not the network. Each load runs once with updates handled
+one at a time (python-telegram-bot's default) and once with BOT_CONCURRENT_UPDATES.
+
+Usage: python -m benchmarks.bench_bot_handlers [--chats 200] [--updates-per-chat 4] [--api-latency-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+DB_PATH = Path(tempfile.gettempdir()) / "bench_bot_handlers.db"
+for key, value in {
+    "DATABASE_URL": f"sqlite:///{DB_PATH}", "SECRET_KEY": "bench", "USER_BOT_TOKEN": "1:bench",
+    "ADMIN_BOT_TOKEN": "2:bench", "TELEGRAM_ADMIN_CHAT_ID": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+from app.config import settings
+from app.database import Base
+from app.models import User, UserRole, Language
+from bot import admin_bot, user_bot
+from bot.db import engine as bot_engine
+
+ADMIN_CHATS = 20
+
+
+class FakeTelegramAPI(BaseRequest):
+    """Answers Bot API calls in-process after a fixed delay"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif endpoint in ("sendMessage", "editMessageText"):
+            await asyncio.sleep(self.latency)
+            chat_id = int(params.get("chat_id", 0))
+            result = {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+        else:
+            await asyncio.sleep(self.latency)
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def seed(chats: int):
+    DB_PATH.unlink(missing_ok=True)
+    sync_engine = create_engine(f"sqlite:///{DB_PATH}")
+    Base.metadata.create_all(sync_engine)
+    with Session(sync_engine) as db:
+        for chat in range(1, chats + ADMIN_CHATS + 1):
+            db.add(User(
+                telephone=f"+99890{chat:07d}", name=f"User {chat}", hashed_password="x",
+                role=UserRole.ADMIN if chat > chats else UserRole.USER,
+                # Every other user is new to the bot, so /start takes both paths
+                language=Language.RUSSIAN, telegram_chat_id=str(chat) if chat % 2 or chat > chats else None,
+            ))
+        db.commit()
+    sync_engine.dispose()
+
+
+def message(update_id: int, chat: int, text: str) -> dict:
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else []
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": text, "entities": entities,
+        "chat": {"id": chat, "type": "private"}, "from": {"id": chat, "is_bot": False, "first_name": "U"},
+    }}
+
+
+def callback(update_id: int, chat: int, data: str) -> dict:
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": str(chat), "data": data,
+        "from": {"id": chat, "is_bot": False, "first_name": "U"},
+        "message": {"message_id": 1, "date": 0, "chat": {"id": chat, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Bench"}, "text": "menu"},
+    }}
+
+
+def user_updates(chats: int, per_chat: int):
+    # /start, then main menu choices (new users get the language prompt first)
+    script = ["/start"] + ["📞 Контакты"] * (per_chat - 1)
+    return [(chat, step) for step in script for chat in range(1, chats + 1)]
+
+
+def admin_updates(chats: int, per_chat: int):
+    script = ["/start"] + ["statistics", "pending_apps"] * per_chat
+    return [(chat, step) for step in script[:per_chat] for chat in range(chats + 1, chats + ADMIN_CHATS + 1)]
+
+
+async def run_load(build, updates, concurrency: int, latency: float):
+    api = FakeTelegramAPI(latency)
+    settings.BOT_CONCURRENT_UPDATES = concurrency
+    builder = Application.builder().token("1:bench").request(api).get_updates_request(api).updater(None)
+    application = build(builder)
+    latencies = []
+
+    async def handle(update):
+        started = time.perf_counter()
+        await application.update_processor.process_update(update, application.process_update(update))
+        latencies.append(time.perf_counter() - started)
+
+    async with application:
+        parsed = []
+        for n, (chat, step) in enumerate(updates, 1):
+            data = message(n, chat, step) if step.startswith("/") or not step.isidentifier() else callback(n, chat, step)
+            parsed.append(Update.de_json(data, application.bot))
+        started = time.perf_counter()
+        # Arrival order is kept: tasks start in order, like Application's update fetcher
+        await asyncio.gather(*(handle(update) for update in parsed))
+        elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), api.calls
+
+
+def report(name: str, count: int, elapsed: float, latencies, calls):
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    api_calls = ", ".join(f"{endpoint} {n}" for endpoint, n in sorted(calls.items()) if endpoint != "getMe")
+    print(f"  {name}: {count / elapsed:.0f} updates/s, p50 {statistics.median(latencies) * 1000:.0f} ms, "
+          f"p95 {p95 * 1000:.0f} ms ({api_calls})")
+
+
+async def main_async(args):
+    latency = args.api_latency_ms / 1000
+    for bot_name, build, updates in (
+        ("user bot", user_bot.build_application, user_updates(args.chats, args.updates_per_chat)),
+        ("admin bot", admin_bot.build_application, admin_updates(args.chats, args.updates_per_chat)),
+    ):
+        print(f"{bot_name}: {len(updates)} updates")
+        for name, concurrency in (("one at a time", 1), (f"concurrent ({args.concurrency})", args.concurrency)):
+            seed(args.chats)
+            elapsed, latencies, calls = await run_load(build, updates, concurrency, latency)
+            report(name, len(updates), elapsed, latencies, calls)
+    await bot_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--updates-per-chat", type=int, default=4)
+    parser.add_argument("--api-latency-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=settings.BOT_CONCURRENT_UPDATES)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        DB_PATH.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Upload image processing benchmark
+Generates phone-sized JPEG photos and runs them through app.images.process_image
+(decode, validate, re-encode original, WebP variants), first in this process and
+then through the worker pool, reporting images per second and per core.
+
+Usage: python -m benchmarks.bench_image_processing [--images 40] [--width 2400] [--height 1800] [--workers N]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+for key, value in {
+    "DATABASE_URL": "sqlite://", "SECRET_KEY": "bench", "USER_BOT_TOKEN": "bench",
+    "ADMIN_BOT_TOKEN": "bench", "TELEGRAM_ADMIN_CHAT_ID": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+from PIL import Image
+from app.config import settings
+from app.images import ImageProcessor, process_image
+
+
+def make_photo(width: int, height: int, seed: int) -> bytes:
+    # Smooth gradients plus sensor-like noise, so JPEG sizes resemble real photos
+    gradient = Image.linear_gradient("L").resize((width, height)).rotate(seed * 37 % 360, expand=False)
+    noise = Image.effect_noise((width, height), 24 + seed % 8)
+    image = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=88)
+    return buffer.getvalue()
+
+
+async def run_pool(photos, workers: int) -> float:
+    processor = ImageProcessor(workers)
+    try:
+        await processor.process(photos[0])  # start the workers outside the timing
+        started = time.perf_counter()
+        await asyncio.gather(*(processor.process(photo) for photo in photos))
+        return time.perf_counter() - started
+    finally:
+        processor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--width", type=int, default=2400)
+    parser.add_argument("--height", type=int, default=1800)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    photos = [make_photo(args.width, args.height, seed) for seed in range(args.images)]
+    average_kb = sum(len(photo) for photo in photos) / len(photos) / 1024
+    print(f"images={args.images} size={args.width}x{args.height} (~{average_kb:.0f} KB JPEG) workers={args.workers}")
+
+    result = process_image(photos[0], settings.IMAGE_MAX_PIXELS)
+    stored_kb = {name: len(data) / 1024 for name, data in result.variants.items()}
+    print("stored: original {:.0f} KB, ".format(len(result.original) / 1024)
+          + ", ".join(f"{name} {kb:.1f} KB" for name, kb in stored_kb.items()))
+
+    started = time.perf_counter()
+    for photo in photos:
+        process_image(photo, settings.IMAGE_MAX_PIXELS)
+    serial = time.perf_counter() - started
+    print(f"in-process: {args.images / serial:.1f} images/s ({serial / args.images * 1000:.0f} ms per image, 1 core)")
+
+    pooled = asyncio.run(run_pool(photos, args.workers))
+    rate = args.images / pooled
+    print(f"worker pool: {rate:.1f} images/s total, {rate / args.workers:.1f} images/s per core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Nearest-driver search benchmark
+Fills the in-memory grid with drivers scattered around Tashkent and measures
+K-nearest query latency, checking results against a brute-force scan.
+
+Usage: python -m benchmarks.bench_nearest_drivers [--drivers 50000] [--queries 5000] [--k 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+for key, value in {
+    "DATABASE_URL": "sqlite://", "SECRET_KEY": "bench", "USER_BOT_TOKEN": "bench",
+    "ADMIN_BOT_TOKEN": "bench", "TELEGRAM_ADMIN_CHAT_ID": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+from app.geo import haversine_km
+from app.locations import DriverLocationStore
+from app.matching import DriverMatcher
+
+CENTER = (41.3111, 69.2797)  # Tashkent
+SPREAD_DEG = 0.3  # ~33 km
+
+
+def random_point(rng: random.Random):
+    return (
+        CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+    )
+
+
+async def run(drivers: int, queries: int, k: int, blocked_share: float, seed: int):
+    rng = random.Random(seed)
+    store = DriverLocationStore()
+    matcher = DriverMatcher(store)
+
+    now = time.time()
+    started = time.perf_counter()
+    for driver_id in range(1, drivers + 1):
+        lat, lng = random_point(rng)
+        store.grid.upsert(driver_id, lat, lng, now)
+    build_s = time.perf_counter() - started
+    await matcher.load_blocked(d for d in range(1, drivers + 1) if rng.random() < blocked_share)
+
+    points = [random_point(rng) for _ in range(queries)]
+
+    # Correctness spot check against a brute-force scan
+    for lat, lng in points[:20]:
+        got = [d for d, _ in await matcher.find_nearest(lat, lng, k)]
+        expected = sorted(
+            (haversine_km(lat, lng, p[0], p[1]), d)
+            for d, p in store.grid.positions.items() if d not in matcher.blocked
+        )[:k]
+        assert got == [d for _, d in expected], "grid search disagrees with brute force"
+
+    timings = []
+    for lat, lng in points:
+        t0 = time.perf_counter()
+        await matcher.find_nearest(lat, lng, k)
+        timings.append((time.perf_counter() - t0) * 1e6)
+
+    timings.sort()
+    print(f"drivers={drivers} queries={queries} k={k} blocked={blocked_share:.0%}")
+    print(f"index build: {build_s * 1000:.1f} ms ({drivers / build_s:,.0f} upserts/s)")
+    print(f"query p50: {statistics.median(timings):.1f} us")
+    print(f"query p95: {timings[int(len(timings) * 0.95)]:.1f} us")
+    print(f"query p99: {timings[int(len(timings) * 0.99)]:.1f} us")
+    print(f"query max: {timings[-1]:.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--drivers", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--blocked-share", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args.drivers, args.queries, args.k, args.blocked_share, args.seed))
+
+
+if __name__ == "__main__":
+    main()
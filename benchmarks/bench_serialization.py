@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Order list serialization benchmark
+Serializes the same orders three ways and reports the best time per run:
+- hand-built dicts + jsonable_encoder + json (driver order lists before app.serializers)
+- Pydantic response_model validation + JSON dump (taxi/delivery order lists before)
+- precompiled encoders + orjson (app.serializers)
+Outputs are checked to decode to the same data.
+
+Usage: python -m benchmarks.bench_serialization [--orders 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+for key, value in {
+    "DATABASE_URL": "sqlite://", "SECRET_KEY": "bench", "USER_BOT_TOKEN": "bench",
+    "ADMIN_BOT_TOKEN": "bench", "TELEGRAM_ADMIN_CHAT_ID": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from app.models import TaxiOrder, OrderStatus
+from app.schemas import TaxiOrderResponse
+from app.serializers import ORJSONResponse, TAXI_ORDER, DRIVER_TAXI_ORDER
+
+
+def make_orders(count: int) -> List[TaxiOrder]:
+    start = datetime(2024, 1, 1, 8, tzinfo=timezone.utc)
+    return [
+        TaxiOrder(
+            id=n, user_id=n % 5000, driver_id=n % 500, username=f"Customer {n}", telephone="+998901234567",
+            from_region_id=n % 14 + 1, from_district_id=1, to_region_id=(n + 3) % 14 + 1, to_district_id=2,
+            pickup_latitude="41.311081", pickup_longitude="69.240562", pickup_address="Amir Temur ko'chasi 1",
+            passengers=n % 4 + 1, is_mail_delivery=False, date="01.01.2024", time_start="09:00", time_end="10:00",
+            scheduled_datetime=start + timedelta(hours=n), released_at=start + timedelta(minutes=n),
+            price=Decimal("120000.00"), service_fee=Decimal("9600.00"), driver_earnings=Decimal("110400.00"),
+            note=None, status=OrderStatus.COMPLETED, cancellation_reason=None,
+            created_at=start + timedelta(minutes=n), accepted_at=start + timedelta(minutes=n + 2),
+            completed_at=start + timedelta(minutes=n + 50),
+        )
+        for n in range(count)
+    ]
+
+
+def render_json(content) -> bytes:
+    # starlette.responses.JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def legacy_driver_dicts(orders) -> bytes:
+    content = {"taxi_orders": [
+        {
+            "id": order.id,
+            "type": "taxi",
+            "user_id": order.user_id,
+            "username": order.username,
+            "telephone": order.telephone,
+            "from_region_id": order.from_region_id,
+            "from_district_id": order.from_district_id,
+            "to_region_id": order.to_region_id,
+            "to_district_id": order.to_district_id,
+            "pickup_address": order.pickup_address,
+            "pickup_latitude": order.pickup_latitude,
+            "pickup_longitude": order.pickup_longitude,
+            "passengers": order.passengers,
+            "price": str(order.price),
+            "service_fee": str(order.service_fee),
+            "driver_earnings": str(order.driver_earnings),
+            "date": order.date,
+            "time_start": order.time_start,
+            "time_end": order.time_end,
+            "scheduled_datetime": order.scheduled_datetime.isoformat() if order.scheduled_datetime else None,
+            "status": order.status.value,
+            "note": order.note,
+            "created_at": order.created_at.isoformat(),
+            "accepted_at": order.accepted_at.isoformat() if order.accepted_at else None,
+            "completed_at": order.completed_at.isoformat() if order.completed_at else None
+        }
+        for order in orders
+    ]}
+    return render_json(jsonable_encoder(content))
+
+
+def encoder_driver_dicts(orders) -> bytes:
+    return ORJSONResponse({"taxi_orders": [DRIVER_TAXI_ORDER.encode(order) for order in orders]}).body
+
+
+RESPONSE_ADAPTER = TypeAdapter(List[TaxiOrderResponse])
+
+
+def legacy_response_model(orders) -> bytes:
+    # What FastAPI does for response_model=List[TaxiOrderResponse]
+    validated = RESPONSE_ADAPTER.validate_python(orders, from_attributes=True)
+    return render_json(RESPONSE_ADAPTER.dump_python(validated, mode="json"))
+
+
+def encoder_response_model(orders) -> bytes:
+    return ORJSONResponse([TAXI_ORDER.encode(order) for order in orders]).body
+
+
+def best_of(func, orders, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(orders)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def normalized(body: bytes):
+    # Pydantic writes UTC as "Z", isoformat()/orjson as "+00:00"
+    return json.loads(body.decode().replace('Z"', '+00:00"'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders)
+    assert normalized(legacy_driver_dicts(orders)) == normalized(encoder_driver_dicts(orders))
+    assert normalized(legacy_response_model(orders)) == normalized(encoder_response_model(orders))
+
+    print(f"orders={args.orders} repeat={args.repeat} (best run)")
+    for name, legacy, fast in (
+        ("driver order list", legacy_driver_dicts, encoder_driver_dicts),
+        ("response_model list", legacy_response_model, encoder_response_model),
+    ):
+        before = best_of(legacy, orders, args.repeat)
+        after = best_of(fast, orders, args.repeat)
+        print(f"{name}: {before:.1f} ms -> {after:.1f} ms ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
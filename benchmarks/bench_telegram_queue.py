@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Telegram delivery queue benchmark
+Starts a local fake Bot API that enforces Telegram's limits the way the real
+one does (a 429 with retry_after when the bot exceeds the global rate or sends
+to a chat more than once per second, a 403 for chats that blocked the bot),
+points TELEGRAM_API_BASE_URL at it and broadcasts through app.telegram_queue.
+Reports delivered messages/s against the configured limit and how many requests
+Telegram would have rejected.
+
+The queue lives in memory unless REDIS_URL points at a running Redis.
+
+Usage: python -m benchmarks.bench_telegram_queue [--chats 1500] [--messages-per-chat 3] [--rate 30] [--latency-ms 40]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+for key, value in {
+    "DATABASE_URL": "sqlite://", "SECRET_KEY": "bench", "USER_BOT_TOKEN": "1:bench",
+    "ADMIN_BOT_TOKEN": "2:bench", "TELEGRAM_ADMIN_CHAT_ID": "0", "REDIS_URL": "redis://localhost:1/0",
+}.items():
+    os.environ.setdefault(key, value)
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from app.config import settings
+from app.telegram_queue import DIGEST_SEPARATOR, TelegramDeliveryQueue, TokenBucket
+
+BLOCKED_SHARE = 50  # every 50th chat has blocked the bot
+
+
+class FakeBotAPI:
+    """sendMessage with Telegram-style flood control"""
+
+    def __init__(self, rate: float, chat_interval: float, latency: float):
+        self.bucket = TokenBucket(rate, rate)
+        self.chat_interval = chat_interval
+        self.latency = latency
+        self.last_sent = {}
+        self.counts = Counter()
+        self.app = Starlette(routes=[Route("/bot{token}/{method}", self.handle, methods=["POST"])])
+
+    async def handle(self, request: Request):
+        await asyncio.sleep(self.latency)
+        if request.path_params["method"] != "sendMessage":
+            return JSONResponse({"ok": True, "result": True})
+        form = await request.form()
+        chat_id = int(form["chat_id"])
+        now = time.monotonic()
+        if chat_id % BLOCKED_SHARE == 0:
+            self.counts["forbidden"] += 1
+            return JSONResponse({"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}, 403)
+        if now - self.last_sent.get(chat_id, float("-inf")) < self.chat_interval or self.bucket.take() > 0:
+            self.counts["429"] += 1
+            return JSONResponse({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                 "parameters": {"retry_after": 1}}, 429)
+        self.last_sent[chat_id] = now
+        self.counts["sent"] += 1
+        self.counts["messages"] += form["text"].count(DIGEST_SEPARATOR) + 1
+        return JSONResponse({"ok": True, "result": {
+            "message_id": self.counts["sent"], "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": form["text"],
+        }})
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(args):
+    api = FakeBotAPI(args.rate, settings.TELEGRAM_CHAT_INTERVAL, args.latency_ms / 1000)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    settings.TELEGRAM_API_BASE_URL = f"http://127.0.0.1:{port}/bot"
+    settings.TELEGRAM_GLOBAL_RATE = args.rate
+    queue = TelegramDeliveryQueue("bench", "1:bench")
+    chats = range(1, args.chats + 1)
+    expected = sum(1 for chat in chats if chat % BLOCKED_SHARE)
+
+    started = time.perf_counter()
+    queue.push_many((chat, f"📢 Announcement {n + 1} for chat {chat}") for n in range(args.messages_per_chat) for chat in chats)
+    queued_s = time.perf_counter() - started
+    await queue.start()
+    while queue.stats["messages"] < expected * args.messages_per_chat:
+        await asyncio.sleep(0.1)
+        if time.perf_counter() - started > args.timeout:
+            print("timed out")
+            break
+    elapsed = time.perf_counter() - started
+    await queue.shutdown()
+    server.should_exit = True
+    await server_task
+
+    store = "Redis" if type(queue.store).__name__ == "_RedisStore" else "memory"
+    print(f"chats={args.chats} messages={args.chats * args.messages_per_chat} rate={args.rate}/s "
+          f"latency={args.latency_ms:.0f} ms store={store} (queued in {queued_s * 1000:.0f} ms)")
+    print(f"sent {api.counts['sent']} requests carrying {api.counts['messages']} messages in {elapsed:.1f}s: "
+          f"{api.counts['sent'] / elapsed:.1f} requests/s of {args.rate:.0f}/s allowed")
+    print(f"rejected by flood control: {api.counts['429']}, blocked chats dropped: {queue.stats['dropped']}")
+    print(f"100k-chat broadcast at this rate: ~{100000 / (api.counts['sent'] / elapsed) / 60:.0f} min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chats", type=int, default=1500)
+    parser.add_argument("--messages-per-chat", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=30)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--timeout", type=float, default=600)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
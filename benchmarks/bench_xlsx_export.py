@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+XLSX order export benchmark
+Fills a throwaway SQLite database with orders and runs the report export
+(yield_per cursor -> openpyxl write-only workbook), reporting rows per second
+and how much the process RSS grew while exporting. Run it with a few different
+--orders values: the RSS growth should stay about the same.
+
+Usage: python -m benchmarks.bench_xlsx_export [--orders 200000] [--batch-size 2000]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+for key, value in {
+    "DATABASE_URL": "sqlite://", "SECRET_KEY": "bench", "USER_BOT_TOKEN": "bench",
+    "ADMIN_BOT_TOKEN": "bench", "TELEGRAM_ADMIN_CHAT_ID": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import TaxiOrder, DeliveryOrder, Region, OrderStatus, ItemType
+from app.reports import iter_order_rows, write_orders_xlsx
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 1024 / 1024
+    except OSError:
+        # No procfs (macOS): fall back to the peak, reported in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / 1024
+
+
+def fill(engine, orders: int, seed: int):
+    rng = random.Random(seed)
+    statuses = list(OrderStatus)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(insert(Region.__table__), [
+            {"id": i, "name_uz_latin": f"Region {i}", "name_uz_cyrillic": f"Регион {i}",
+             "name_russian": f"Регион {i}", "is_active": True}
+            for i in range(1, 15)
+        ])
+        for offset in range(0, orders, 10000):
+            taxi, delivery = [], []
+            for n in range(offset, min(offset + 10000, orders)):
+                row = {
+                    "user_id": rng.randint(1, 5000), "driver_id": rng.randint(1, 500),
+                    "username": f"Customer {n}", "from_region_id": rng.randint(1, 14),
+                    "from_district_id": 1, "to_region_id": rng.randint(1, 14), "to_district_id": 1,
+                    "date": "01.01.2024", "time_start": "09:00", "time_end": "10:00",
+                    "price": Decimal("120000.00"), "service_fee": Decimal("9600.00"),
+                    "driver_earnings": Decimal("110400.00"), "status": rng.choice(statuses),
+                    "created_at": start + timedelta(minutes=n), "accepted_at": start + timedelta(minutes=n + 2),
+                }
+                if n % 4:
+                    taxi.append({**row, "telephone": "+998901234567", "passengers": 2})
+                else:
+                    delivery.append({**row, "sender_telephone": "+998901234567",
+                                     "receiver_telephone": "+998907654321", "item_type": ItemType.DOCUMENT})
+            conn.execute(insert(TaxiOrder.__table__), taxi)
+            if delivery:
+                conn.execute(insert(DeliveryOrder.__table__), delivery)
+
+
+def run(orders: int, batch_size: int, seed: int):
+    workdir = tempfile.mkdtemp(prefix="bench_xlsx_")
+    engine = create_engine(f"sqlite:///{workdir}/orders.db")
+    Base.metadata.create_all(engine)
+
+    started = time.perf_counter()
+    fill(engine, orders, seed)
+    print(f"orders={orders} batch_size={batch_size}")
+    print(f"fill: {time.perf_counter() - started:.1f} s")
+
+    db = sessionmaker(bind=engine)()
+    baseline = current_rss_mb()
+    peak = baseline
+
+    def sampled(rows):
+        nonlocal peak
+        for n, row in enumerate(rows):
+            if n % 5000 == 0:
+                peak = max(peak, current_rss_mb())
+            yield row
+
+    path = os.path.join(workdir, "orders.xlsx")
+    started = time.perf_counter()
+    count = write_orders_xlsx(sampled(iter_order_rows(db, batch_size=batch_size)), path)
+    elapsed = time.perf_counter() - started
+    peak = max(peak, current_rss_mb())
+    db.close()
+
+    assert count == orders, f"exported {count} of {orders} orders"
+    print(f"export: {elapsed:.1f} s ({count / elapsed:,.0f} rows/s)")
+    print(f"file size: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+    print(f"rss before export: {baseline:.1f} MB")
+    print(f"rss peak during export: {peak:.1f} MB (+{peak - baseline:.1f} MB)")
+
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.orders, args.batch_size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
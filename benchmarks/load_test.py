@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+HTTP load test against the app running in-process
+Drives the real FastAPI app (lifespan included) through httpx's ASGI transport
+from an asyncio load generator: no server, network or Redis needed. The
+database is a fresh SQLite file, or a scratch PostgreSQL database given with
+--database-url (its tables are dropped and recreated). Redis is fakeredis
+unless --redis-url points at a real one. Celery tasks run inline
+(CELERY_TASK_ALWAYS_EAGER), as they do when the broker is down.
+
+Scenarios:
+  register     a burst of sign-ups: register + login, --concurrency at a time
+  orders       taxi orders created at a fixed --order-rate per second (open loop:
+               latency is measured from the scheduled start, so a slow app
+               cannot hide its backlog)
+  driver-feed  --drivers drivers each polling every --poll-interval seconds:
+               new orders 70%, active orders 15%, unread notifications 15%
+
+Each run writes a JSON report (throughput, errors and latency percentiles per
+scenario and endpoint, plus the git commit) that --compare diffs against an
+earlier one.
+
+Usage: python -m benchmarks.load_test [--scenarios register,orders,driver-feed] [--report load_report.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+DB_PATH = Path(tempfile.gettempdir()) / "load_test.db"
+SCENARIOS = ("register", "orders", "driver-feed")
+FEED_MIX = (("/api/driver/orders/new", 70), ("/api/driver/orders/active", 15), ("/api/notifications/unread", 15))
+PERCENTILES = (50, 90, 95, 99)
+FAKEREDIS_URL = "redis://fakeredis/0"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--database-url", default="", help="scratch PostgreSQL database (tables are dropped!); default: a temporary SQLite file")
+    parser.add_argument("--redis-url", default="", help="real Redis to use instead of fakeredis")
+    parser.add_argument("--registrations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--order-rate", type=float, default=20, help="orders per second")
+    parser.add_argument("--duration", type=float, default=15, help="seconds for the orders and driver-feed scenarios")
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--drivers", type=int, default=200)
+    parser.add_argument("--poll-interval", type=float, default=5, help="seconds between one driver's polls")
+    parser.add_argument("--pending-orders", type=int, default=50, help="released orders waiting in the feed")
+    parser.add_argument("--report", default="load_report.json")
+    parser.add_argument("--compare", default="", help="earlier report to compare against")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def configure(args):
+    """Settings for the in-process app; must run before anything from app is imported"""
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{DB_PATH}",
+        "REDIS_URL": args.redis_url or FAKEREDIS_URL,
+        "CELERY_TASK_ALWAYS_EAGER": "true",
+        # No bots: nothing may reach Telegram during a load test
+        "USER_BOT_TOKEN": "", "ADMIN_BOT_TOKEN": "", "BOT_WEBHOOK_MODE": "false",
+    })
+    for key, value in {"SECRET_KEY": "load-test", "TELEGRAM_ADMIN_CHAT_ID": "0"}.items():
+        os.environ.setdefault(key, value)
+    if not args.database_url:
+        DB_PATH.unlink(missing_ok=True)
+
+    if not args.redis_url:
+        use_fakeredis()
+
+
+def use_fakeredis():
+    """Make the app's Redis clients for redis://fakeredis/... URLs talk to one in-process fakeredis server"""
+    import fakeredis
+    import redis
+    import redis.asyncio
+    server = fakeredis.FakeServer()
+    connect_async, connect_sync = redis.asyncio.from_url, redis.Redis.from_url
+
+    def from_url(url, **kwargs):
+        if not url.startswith(FAKEREDIS_URL):
+            return connect_async(url, **kwargs)
+        return fakeredis.aioredis.FakeRedis(server=server, decode_responses=kwargs.get("decode_responses", False))
+
+    def sync_from_url(url, **kwargs):
+        if not url.startswith(FAKEREDIS_URL):
+            return connect_sync(url, **kwargs)
+        return fakeredis.FakeRedis(server=server, decode_responses=kwargs.get("decode_responses", False))
+
+    redis.asyncio.from_url = from_url
+    redis.Redis.from_url = staticmethod(sync_from_url)
+
+
+def seed(args):
+    """Regions, pricing, customers, drivers and released pending orders; returns access tokens and ids"""
+    from app.auth import create_access_token
+    from app.database import Base, SessionLocal, engine
+    from app.models import District, Driver, OrderStatus, Pricing, Region, TaxiOrder, User, UserRole
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rng = random.Random(args.seed)
+    db = SessionLocal()
+    try:
+        regions = [Region(name_uz_latin=f"Region {n}", name_uz_cyrillic=f"Region {n}", name_russian=f"Region {n}") for n in range(4)]
+        db.add_all(regions)
+        db.flush()
+        districts = {region.id: District(region_id=region.id, name_uz_latin="Center", name_uz_cyrillic="Center",
+                                         name_russian="Center") for region in regions}
+        db.add_all(districts.values())
+        db.flush()
+        region_ids = [region.id for region in regions]
+        district_ids = {region_id: district.id for region_id, district in districts.items()}
+        db.add_all(Pricing(from_region_id=a.id, to_region_id=b.id, service_type="taxi", base_price=100000,
+                           discount_2_passengers=5, discount_3_passengers=10, discount_full_car=15)
+                   for a in regions for b in regions if a is not b)
+
+        customers = [User(telephone=f"+99890{n:07d}", name=f"Customer {n}", hashed_password="x")
+                     for n in range(args.customers)]
+        drivers = [User(telephone=f"+99891{n:07d}", name=f"Driver {n}", hashed_password="x", role=UserRole.DRIVER)
+                   for n in range(args.drivers)]
+        db.add_all(customers + drivers)
+        db.flush()
+        db.add_all(Driver(user_id=user.id, full_name=user.name, car_model="Cobalt", car_number=f"01A{n:03d}AA",
+                          license_photo="uploads/licenses/seed.jpg") for n, user in enumerate(drivers))
+
+        now = datetime.now(timezone.utc)
+        for n in range(args.pending_orders):
+            order = order_body(rng, region_ids, district_ids)
+            db.add(TaxiOrder(user_id=rng.choice(customers).id, **order, price=100000, service_fee=10000,
+                             driver_earnings=90000, status=OrderStatus.PENDING, released_at=now))
+        db.commit()
+
+        token = lambda user: create_access_token({"sub": str(user.id)})
+        return {
+            "customers": [token(user) for user in customers],
+            "drivers": [token(user) for user in drivers],
+            "regions": region_ids,
+            "districts": district_ids,
+        }
+    finally:
+        db.close()
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def order_body(rng: random.Random, regions, districts) -> dict:
+    """A taxi order between two random regions (ids), with its district ids"""
+    from_id, to_id = rng.sample(regions, 2)
+    return {
+        "username": "Load Test", "telephone": "+998900000000",
+        "from_region_id": from_id, "from_district_id": districts[from_id],
+        "to_region_id": to_id, "to_district_id": districts[to_id],
+        "passengers": rng.randint(1, 4), "date": "01.01.2030", "time_start": "09:00", "time_end": "10:00",
+        "pickup_latitude": f"{41.3 + rng.uniform(-0.1, 0.1):.6f}", "pickup_longitude": f"{69.28 + rng.uniform(-0.1, 0.1):.6f}",
+    }
+
+
+class Recorder:
+    """Latency and status of every request in a scenario, grouped by endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    async def request(self, client, method: str, endpoint: str, url: str = "", started: float = None, expect=(200, 201), **kwargs):
+        started = time.perf_counter() if started is None else started
+        try:
+            response = await client.request(method, url or endpoint, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        name = f"{method} {endpoint}"
+        self.latencies[name].append(time.perf_counter() - started)
+        self.statuses[name]["ok" if status in expect else str(status)] += 1
+        return status
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {name: stats(latencies, self.statuses[name], elapsed) for name, latencies in sorted(self.latencies.items())}
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        total = sum(self.statuses.values(), Counter())
+        return {"duration_s": round(elapsed, 3), **stats(everything, total, elapsed), "endpoints": endpoints}
+
+
+def stats(latencies, statuses: Counter, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    errors = {status: count for status, count in statuses.items() if status != "ok"}
+    result = {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "errors": sum(errors.values()),
+        "error_statuses": errors,
+        "latency_ms": {},
+    }
+    if latencies:
+        for p in PERCENTILES:
+            # Nearest-rank percentile
+            result["latency_ms"][f"p{p}"] = round(latencies[max(0, -(-len(latencies) * p // 100) - 1)] * 1000, 2)
+        result["latency_ms"]["max"] = round(latencies[-1] * 1000, 2)
+        result["latency_ms"]["mean"] = round(sum(latencies) / len(latencies) * 1000, 2)
+    return result
+
+
+async def register_burst(client, args, data, rng) -> dict:
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def sign_up(n: int):
+        async with semaphore:
+            body = {"telephone": f"+99893{n:07d}", "name": f"New user {n}", "password": "secret123", "confirm_password": "secret123"}
+            if await recorder.request(client, "POST", "/api/auth/register", json=body) == 201:
+                await recorder.request(client, "POST", "/api/auth/login",
+                                       json={"telephone": body["telephone"], "password": body["password"]})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sign_up(n) for n in range(args.registrations)))
+    return recorder.summary(time.perf_counter() - started)
+
+
+async def order_stream(client, args, data, rng) -> dict:
+    recorder = Recorder()
+    total = int(args.order_rate * args.duration)
+    started = time.perf_counter()
+
+    async def create(n: int):
+        scheduled = started + n / args.order_rate
+        await asyncio.sleep(scheduled - time.perf_counter())
+        await recorder.request(client, "POST", "/api/taxi-orders/", started=scheduled,
+                               headers=auth(rng.choice(data["customers"])),
+                               json=order_body(rng, data["regions"], data["districts"]))
+
+    await asyncio.gather(*(create(n) for n in range(total)))
+    return recorder.summary(time.perf_counter() - started)
+
+
+async def driver_feed(client, args, data, rng) -> dict:
+    recorder = Recorder()
+    paths, weights = zip(*FEED_MIX)
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    async def poll(token: str):
+        headers = auth(token)
+        # Drivers start spread over one interval, like a fleet of running apps
+        scheduled = started + rng.uniform(0, args.poll_interval)
+        while scheduled < deadline:
+            await asyncio.sleep(scheduled - time.perf_counter())
+            path = rng.choices(paths, weights)[0]
+            await recorder.request(client, "GET", path, started=scheduled, headers=headers)
+            scheduled += args.poll_interval
+
+    await asyncio.gather(*(poll(token) for token in data["drivers"]))
+    return recorder.summary(time.perf_counter() - started)
+
+
+RUNNERS = {"register": register_burst, "orders": order_stream, "driver-feed": driver_feed}
+
+
+async def run(args, data) -> dict:
+    import httpx
+    import main as app_main
+
+    results = {}
+    app = app_main.app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            for name in args.scenarios:
+                print(f"⏱️ {name}...")
+                results[name] = await RUNNERS[name](client, args, data, random.Random(args.seed))
+    return results
+
+
+def git_commit() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def print_report(report: dict):
+    for name, result in report["scenarios"].items():
+        print(f"{name}: {result['requests']} requests in {result['duration_s']:.1f}s, {result['throughput_rps']:.1f} req/s, "
+              f"{result['errors']} errors")
+        for endpoint, summary in result["endpoints"].items():
+            latency = summary["latency_ms"]
+            errors = f", errors {summary['error_statuses']}" if summary["errors"] else ""
+            print(f"  {endpoint:<34} {summary['requests']:>6}  {summary['throughput_rps']:>7.1f}/s  "
+                  f"p50 {latency.get('p50', 0):>7.1f}  p95 {latency.get('p95', 0):>7.1f}  p99 {latency.get('p99', 0):>7.1f} ms{errors}")
+
+
+def print_comparison(report: dict, baseline: dict):
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+
+    print(f"\nvs {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta'].get('timestamp')}):")
+    for name, result in report["scenarios"].items():
+        old_scenario = baseline["scenarios"].get(name)
+        if not old_scenario:
+            continue
+        for endpoint, summary in result["endpoints"].items():
+            old = old_scenario["endpoints"].get(endpoint)
+            if not old:
+                continue
+            print(f"  {name + ' ' + endpoint:<46} throughput {change(summary['throughput_rps'], old['throughput_rps']):>6}  "
+                  f"p95 {change(summary['latency_ms'].get('p95', 0), old['latency_ms'].get('p95', 0)):>6}  "
+                  f"p99 {change(summary['latency_ms'].get('p99', 0), old['latency_ms'].get('p99', 0)):>6}  "
+                  f"errors {old['errors']} -> {summary['errors']}")
+
+
+def main():
+    args = parse_args()
+    configure(args)
+    data = seed(args)
+    try:
+        scenarios = asyncio.run(run(args, data))
+    finally:
+        if not args.database_url:
+            DB_PATH.unlink(missing_ok=True)
+
+    from app.config import settings
+    report = {
+        "meta": {
+            **git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "database": settings.DATABASE_URL.split(":", 1)[0].split("+", 1)[0],
+            "redis": "redis" if args.redis_url else "fakeredis",
+            "args": {key: value for key, value in vars(args).items() if key not in ("database_url", "redis_url", "report", "compare")},
+        },
+        "scenarios": scenarios,
+    }
+    print_report(report)
+    Path(args.report).write_text(json.dumps(report, indent=2))
+    print(f"report written to {args.report}")
+    if args.compare:
+        print_comparison(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""ConnectionManager fan-out to local WebSocket connections (standalone mode, fake sockets)"""
+import json
+import pytest
+from app.websocket import ConnectionManager
+
+
+class FakeWebSocket:
+    """Serializes like Starlette's WebSocket.send_json and drops the bytes"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_json(self, data, mode: str = "text"):
+        self.sent += len(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+
+def connected_manager(drivers: int, sockets_per_driver: int = 1) -> ConnectionManager:
+    manager = ConnectionManager()
+    for driver_id in range(1, drivers + 1):
+        manager.driver_connections[driver_id] = [FakeWebSocket() for _ in range(sockets_per_driver)]
+    return manager
+
+
+def new_order(order_id: int = 1) -> dict:
+    return {"type": "new_order", "wave": 0, "order": {
+        "id": order_id, "type": "taxi", "from_region_id": 1, "to_region_id": 2, "passengers": 2,
+        "price": "150000.00", "date": "01.01.2026", "time_start": "09:00", "time_end": "10:00",
+        "scheduled_datetime": None, "created_at": "2026-01-01T09:00:00+00:00",
+    }}
+
+
+@pytest.mark.benchmark(group="fan-out")
+@pytest.mark.parametrize("drivers", [100, 1000])
+def bench_broadcast_to_all_drivers(benchmark, run_async, drivers):
+    manager = connected_manager(drivers)
+    message = new_order()
+    benchmark(lambda: run_async(manager.broadcast_to_all_drivers(message)))
+    assert manager.driver_connections[1][0].sent
+
+
+@pytest.mark.benchmark(group="fan-out")
+def bench_send_to_driver(benchmark, run_async):
+    # A driver signed in on two devices
+    manager = connected_manager(1000, sockets_per_driver=2)
+    message = {"type": "order_accepted", "order_id": 1, "order_type": "taxi", "driver_id": 500}
+    benchmark(lambda: run_async(manager.send_to_driver(500, message)))
+    assert manager.driver_connections[500][1].sent
+
+
+@pytest.mark.benchmark(group="fan-out")
+def bench_publish_many(benchmark, run_async):
+    # An outbox batch: accepted orders, each announced to all drivers and to its customer
+    manager = connected_manager(200)
+    events = []
+    for order_id in range(1, 26):
+        events.append(("drivers", {"type": "order_accepted", "order_id": order_id, "order_type": "taxi", "driver_id": order_id}))
+        events.append((f"user:{order_id}", {"type": "order_accepted", "order_id": order_id, "order_type": "taxi"}))
+    benchmark(lambda: run_async(manager.publish_many(events)))
+    assert manager.driver_connections[1][0].sent
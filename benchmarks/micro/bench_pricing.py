@@ -0,0 +1,23 @@
+"""Order pricing: price lookup with the passenger discount, and the service fee split"""
+from decimal import Decimal
+import pytest
+from app.utils import calculate_service_fee, calculate_taxi_price
+
+
+@pytest.mark.benchmark(group="pricing")
+@pytest.mark.parametrize("passengers", [1, 4])
+def bench_calculate_taxi_price(benchmark, db, passengers):
+    price = benchmark(calculate_taxi_price, db, 1, 2, passengers)
+    assert price > 0
+
+
+@pytest.mark.benchmark(group="pricing")
+def bench_calculate_taxi_price_default(benchmark, db):
+    # No pricing row for the route: falls back to the default price
+    assert benchmark(calculate_taxi_price, db, 1, 1, 1) == Decimal("50000.00")
+
+
+@pytest.mark.benchmark(group="pricing")
+def bench_calculate_service_fee(benchmark, db):
+    service_fee, driver_earnings = benchmark(calculate_service_fee, Decimal("150000.00"), db)
+    assert service_fee + driver_earnings == Decimal("150000.00")
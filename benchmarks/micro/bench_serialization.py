@@ -0,0 +1,59 @@
+"""Order dicts built for drivers: list encoders, the new-orders feed and WebSocket payloads"""
+from decimal import Decimal
+import pytest
+from app.models import User
+from app.routers.driver import get_new_orders
+from app.serializers import (
+    DRIVER_TAXI_ORDER, DRIVER_DELIVERY_ORDER, DRIVER_ACTIVE_TAXI_ORDER, DRIVER_ACTIVE_DELIVERY_ORDER,
+    DRIVER_HISTORY_TAXI_ORDER, DRIVER_HISTORY_DELIVERY_ORDER
+)
+from app.utils import build_order_event_payload
+from app.websocket import convert_decimal_to_float
+
+TAXI_VIEWS = {"my-orders": DRIVER_TAXI_ORDER, "active": DRIVER_ACTIVE_TAXI_ORDER, "history": DRIVER_HISTORY_TAXI_ORDER}
+DELIVERY_VIEWS = {
+    "my-orders": DRIVER_DELIVERY_ORDER, "active": DRIVER_ACTIVE_DELIVERY_ORDER, "history": DRIVER_HISTORY_DELIVERY_ORDER
+}
+
+
+@pytest.mark.benchmark(group="driver order lists")
+@pytest.mark.parametrize("view", TAXI_VIEWS)
+def bench_encode_taxi_orders(benchmark, taxi_orders, view):
+    encode = TAXI_VIEWS[view]
+    result = benchmark(lambda: [encode(order) for order in taxi_orders])
+    assert len(result) == len(taxi_orders)
+
+
+@pytest.mark.benchmark(group="driver order lists")
+@pytest.mark.parametrize("view", DELIVERY_VIEWS)
+def bench_encode_delivery_orders(benchmark, delivery_orders, view):
+    encode = DELIVERY_VIEWS[view]
+    result = benchmark(lambda: [encode(order) for order in delivery_orders])
+    assert len(result) == len(delivery_orders)
+
+
+@pytest.mark.benchmark(group="driver order lists")
+def bench_new_orders_feed(benchmark, db, in_worker_thread):
+    # GET /api/driver/orders/new: query, the dispatch-wave filter and the hand-built dicts
+    driver_user = db.get(User, 2)
+    result = benchmark(in_worker_thread, get_new_orders, current_user=driver_user, db=db)
+    assert result["taxi_orders"] and result["delivery_orders"]
+
+
+@pytest.mark.benchmark(group="websocket payloads")
+def bench_build_order_event_payload(benchmark, taxi_orders):
+    result = benchmark(lambda: [build_order_event_payload(order, "taxi") for order in taxi_orders])
+    assert result[0]["id"] == taxi_orders[0].id
+
+
+@pytest.mark.benchmark(group="websocket payloads")
+def bench_convert_decimal_to_float(benchmark, taxi_orders):
+    # An order_accepted event per order: nested dicts with Decimal money and rating fields
+    events = [{
+        "type": "order_accepted",
+        "order": {"id": order.id, "price": order.price, "service_fee": order.service_fee,
+                  "driver_earnings": order.driver_earnings, "stops": [{"lat": Decimal("41.31"), "lng": Decimal("69.24")}]},
+        "driver": {"id": 1, "name": "Driver", "rating": Decimal("4.85")},
+    } for order in taxi_orders]
+    result = benchmark(convert_decimal_to_float, events)
+    assert isinstance(result[0]["order"]["price"], float)
@@ -0,0 +1,145 @@
+"""
+Microbenchmarks for hot functions: pricing, order serialization and WebSocket fan-out
+When baseline.json exists, every run is compared against it and fails when a
+benchmark's fastest round is more than REGRESSION_THRESHOLD slower. The minimum
+is used because mean and median swing by tens of percent between runs on a busy
+machine. Timings only compare on the same machine, so the baseline is recorded
+locally and not committed:
+
+    python -m pytest benchmarks/micro --benchmark-json=benchmarks/micro/baseline.json   # record on main
+    python -m pytest benchmarks/micro                                  # run and compare
+    python -m pytest benchmarks/micro --benchmark-compare-fail=min:20%                # stricter check
+"""
+import asyncio
+import functools
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[2]))
+for key, value in {
+    "DATABASE_URL": "sqlite://", "SECRET_KEY": "bench", "USER_BOT_TOKEN": "", "ADMIN_BOT_TOKEN": "",
+    "TELEGRAM_ADMIN_CHAT_ID": "0", "REDIS_URL": "redis://localhost:1/0",
+}.items():
+    os.environ.setdefault(key, value)
+
+from anyio import to_thread
+from anyio.from_thread import start_blocking_portal
+from pytest_benchmark.utils import parse_compare_fail
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import (
+    DeliveryOrder, District, Driver, ItemType, OrderStatus, Pricing, Region, SystemSettings,
+    TaxiOrder, User, UserRole
+)
+
+BASELINE = Path(__file__).parent / "baseline.json"
+REGRESSION_THRESHOLD = "min:50%"
+REGIONS = 4
+ORDERS = 100  # per order type
+
+
+def pytest_configure(config):
+    # Runs before pytest-benchmark reads its options (its hook is trylast)
+    if not hasattr(config.option, "benchmark_compare"):
+        return
+    if config.option.benchmark_compare or config.option.benchmark_json or not BASELINE.exists():
+        return
+    config.option.benchmark_compare = str(BASELINE)
+    if not config.option.benchmark_compare_fail:
+        config.option.benchmark_compare_fail = [parse_compare_fail(REGRESSION_THRESHOLD)]
+
+
+def pytest_benchmark_update_json(config, benchmarks, output_json):
+    # Summary statistics are enough to compare against; drop the raw timings and the host name
+    output_json["machine_info"].pop("node", None)
+    for benchmark in output_json["benchmarks"]:
+        benchmark["stats"].pop("data", None)
+
+
+def make_taxi_order(n: int, **fields) -> TaxiOrder:
+    now = datetime(2026, 1, 1, 9, tzinfo=timezone.utc) + timedelta(minutes=n)
+    price = Decimal("150000.00") + n
+    return TaxiOrder(
+        id=n, user_id=1, username=f"Customer {n}", telephone="+998901234567",
+        from_region_id=1 + n % REGIONS, from_district_id=1 + n % REGIONS,
+        to_region_id=1 + (n + 1) % REGIONS, to_district_id=1 + (n + 1) % REGIONS,
+        pickup_latitude="41.311081", pickup_longitude="69.240562", pickup_address="Amir Temur ko'chasi 1",
+        passengers=1 + n % 4, is_mail_delivery=False, date="01.01.2026", time_start="09:00", time_end="10:00",
+        price=price, service_fee=price / 10, driver_earnings=price - price / 10, note=None,
+        status=OrderStatus.PENDING, released_at=now, created_at=now, **fields
+    )
+
+
+def make_delivery_order(n: int, **fields) -> DeliveryOrder:
+    now = datetime(2026, 1, 1, 9, tzinfo=timezone.utc) + timedelta(minutes=n)
+    price = Decimal("80000.00") + n
+    return DeliveryOrder(
+        id=n, user_id=1, username=f"Sender {n}", sender_telephone="+998901234567",
+        receiver_telephone="+998907654321", from_region_id=1 + n % REGIONS, from_district_id=1 + n % REGIONS,
+        to_region_id=1 + (n + 1) % REGIONS, to_district_id=1 + (n + 1) % REGIONS,
+        pickup_latitude="41.311081", pickup_longitude="69.240562", pickup_address="Amir Temur ko'chasi 1",
+        dropoff_latitude="39.654404", dropoff_longitude="66.975827", dropoff_address="Registon ko'chasi 5",
+        item_type=list(ItemType)[n % len(ItemType)], date="01.01.2026", time_start="09:00", time_end="10:00",
+        price=price, service_fee=price / 10, driver_earnings=price - price / 10, note="Fragile",
+        status=OrderStatus.PENDING, released_at=now, created_at=now, **fields
+    )
+
+
+@pytest.fixture(scope="session")
+def db():
+    """In-memory database with regions, pricing, the service fee, a driver and pending orders"""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    for n in range(1, REGIONS + 1):
+        session.add(Region(id=n, name_uz_latin=f"Region {n}", name_uz_cyrillic=f"Region {n}", name_russian=f"Region {n}"))
+        session.add(District(id=n, region_id=n, name_uz_latin="Center", name_uz_cyrillic="Center", name_russian="Center"))
+    for a in range(1, REGIONS + 1):
+        for b in range(1, REGIONS + 1):
+            if a != b:
+                session.add(Pricing(from_region_id=a, to_region_id=b, service_type="taxi", base_price=Decimal("150000"),
+                                    discount_1_passenger=0, discount_2_passengers=5, discount_3_passengers=10,
+                                    discount_full_car=15))
+    session.add(SystemSettings(setting_key="service_fee_percentage", setting_value="10.00"))
+    session.add(User(id=1, telephone="+998900000001", name="Customer", hashed_password="x"))
+    session.add(User(id=2, telephone="+998900000002", name="Driver", hashed_password="x", role=UserRole.DRIVER))
+    session.add(Driver(id=1, user_id=2, full_name="Driver", car_model="Cobalt", car_number="01A001AA",
+                       license_photo="uploads/licenses/x.jpg"))
+    session.add_all(make_taxi_order(n) for n in range(1, ORDERS + 1))
+    session.add_all(make_delivery_order(n) for n in range(1, ORDERS + 1))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def taxi_orders():
+    return [make_taxi_order(n, accepted_at=datetime(2026, 1, 1, 10, tzinfo=timezone.utc)) for n in range(1, ORDERS + 1)]
+
+
+@pytest.fixture(scope="session")
+def delivery_orders():
+    return [make_delivery_order(n, accepted_at=datetime(2026, 1, 1, 10, tzinfo=timezone.utc)) for n in range(1, ORDERS + 1)]
+
+
+@pytest.fixture(scope="session")
+def run_async():
+    """Runs a coroutine to completion on one loop kept for the whole session"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def in_worker_thread():
+    """Calls a sync route the way FastAPI does: in a worker thread of a running event loop"""
+    with start_blocking_portal() as portal:
+        yield lambda func, *args, **kwargs: portal.call(to_thread.run_sync, functools.partial(func, *args, **kwargs))
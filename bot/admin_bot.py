@@ -1,3 +1,4 @@
+import html
 import logging
 import sys
 from pathlib import Path
@@ -11,14 +12,16 @@ from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
     MessageHandler, filters, ContextTypes
 )
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import SessionLocal
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import (
     User, DriverApplication, ApplicationStatus, Driver,
-    TaxiOrder, DeliveryOrder, UserRole, Notification
+    TaxiOrder, DeliveryOrder, UserRole, Notification, Feedback
 )
 from app.config import settings
+from bot.db import with_db
+from bot.pagination import PagedList, get_page, invalidate_pages, parse_page_callback
+from bot.updates import ChatSerialUpdateProcessor
 
 # Enable logging
 logging.basicConfig(
@@ -28,33 +31,88 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def render_application(app: DriverApplication) -> str:
+    return (
+        f"ID: {app.id}\n"
+        f"Name: {html.escape(app.full_name)}\n"
+        f"Phone: {html.escape(app.telephone)}\n"
+        f"Car: {html.escape(app.car_model)} ({html.escape(app.car_number)})"
+    )
+
+
+def render_driver(driver: Driver) -> str:
+    blocked = " 🚫 blocked" if driver.is_blocked else ""
+    return (
+        f"#{driver.id} {html.escape(driver.full_name)}{blocked}\n"
+        f"Car: {html.escape(driver.car_model)} ({html.escape(driver.car_number)})\n"
+        f"Rating: {driver.rating} · Balance: {driver.balance}"
+    )
+
+
+def render_feedback(feedback: Feedback) -> str:
+    sender = f"user #{feedback.user_id}" if feedback.user_id else "Telegram"
+    created = feedback.created_at.strftime("%Y-%m-%d %H:%M") if feedback.created_at else ""
+    message = feedback.message if len(feedback.message) <= 500 else feedback.message[:500] + "…"
+    return f"#{feedback.id} · {sender} · {created}\n{html.escape(message)}"
+
+
+# Lists the admin can page through, by the name used in their callback data
+ADMIN_LISTS = {
+    "apps": PagedList(
+        title="Pending Driver Applications",
+        empty="No pending applications.",
+        model=DriverApplication,
+        criteria=lambda: DriverApplication.status == ApplicationStatus.PENDING,
+        render=render_application,
+        buttons=lambda app: [
+            InlineKeyboardButton(f"✅ Approve #{app.id}", callback_data=f"approve_{app.id}"),
+            InlineKeyboardButton(f"❌ Reject #{app.id}", callback_data=f"reject_{app.id}")
+        ]
+    ),
+    "drivers": PagedList(
+        title="Drivers",
+        empty="No drivers yet.",
+        model=Driver,
+        render=render_driver,
+        page_size=10
+    ),
+    "feedback": PagedList(
+        title="Feedback",
+        empty="No feedback yet.",
+        model=Feedback,
+        render=render_feedback,
+        newest_first=True
+    ),
+}
+
+# Main menu buttons that open a list
+LIST_BUTTONS = {"pending_apps": "apps", "manage_drivers": "drivers", "feedback": "feedback"}
+
+
+@with_db
+async def admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE, db: AsyncSession):
     """Admin bot start command"""
     chat_id = str(update.effective_chat.id)
     
-    # Check if user is admin
-    db = SessionLocal()
-    
-    # First, try to find user by telegram_chat_id
-    user = db.query(User).filter(
+    # Check if user is admin: first, try to find user by telegram_chat_id
+    user = await db.scalar(select(User).where(
         User.telegram_chat_id == chat_id,
         User.role.in_([UserRole.ADMIN, UserRole.SUPERADMIN])
-    ).first()
+    ))
     
     # If not found, ask for phone number to link account
     if not user:
         # Check if this is a registration attempt
         if context.args and len(context.args) > 0:
             phone = context.args[0]
-            user = db.query(User).filter(
+            user = await db.scalar(select(User).where(
                 User.telephone == phone,
                 User.role.in_([UserRole.ADMIN, UserRole.SUPERADMIN])
-            ).first()
+            ))
             
             if user:
                 user.telegram_chat_id = chat_id
-                db.commit()
-                db.close()
+                await db.commit()
                 await update.message.reply_text(
                     f"✅ Successfully linked your Telegram account!\n\n"
                     f"👤 Name: {user.name}\n"
@@ -64,7 +122,6 @@ async def admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 return
         
-        db.close()
         await update.message.reply_text(
             "⚠️ You are not authorized to use this bot.\n\n"
             "If you are an admin, link your account using:\n"
@@ -74,8 +131,6 @@ async def admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    db.close()
-    
     keyboard = [
         [InlineKeyboardButton("📋 Pending Applications", callback_data="pending_apps")],
         [InlineKeyboardButton("📊 View Statistics", callback_data="statistics")],
@@ -97,54 +152,33 @@ async def admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@with_db
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, db: AsyncSession):
     """Handle callback queries from inline keyboards"""
     query = update.callback_query
     await query.answer()
     
     data = query.data
-    db = SessionLocal()
     
-    if data == "pending_apps":
-        # Show pending driver applications
-        applications = db.query(DriverApplication).filter(
-            DriverApplication.status == ApplicationStatus.PENDING
-        ).all()
-        
-        if not applications:
-            await query.edit_message_text("No pending applications.")
-            db.close()
-            return
-        
-        text = "*Pending Driver Applications:*\n\n"
-        keyboard = []
-        
-        for app in applications:
-            text += f"ID: {app.id}\n"
-            text += f"Name: {app.full_name}\n"
-            text += f"Phone: {app.telephone}\n"
-            text += f"Car: {app.car_model} ({app.car_number})\n\n"
-            
-            keyboard.append([
-                InlineKeyboardButton(f"✅ Approve #{app.id}", callback_data=f"approve_{app.id}"),
-                InlineKeyboardButton(f"❌ Reject #{app.id}", callback_data=f"reject_{app.id}")
-            ])
-        
-        keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="back_to_menu")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+    if data in LIST_BUTTONS or data.startswith("page:"):
+        # First page of a list, or the page a Previous/Next button points at
+        if data in LIST_BUTTONS:
+            name, direction, cursor, page = LIST_BUTTONS[data], "n", None, 1
+        else:
+            name, direction, cursor, page = parse_page_callback(data)
+        text, reply_markup = await get_page(db, context.user_data, ADMIN_LISTS[name], name, direction, cursor, page)
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="HTML")
     
     elif data == "statistics":
         # Show statistics
-        total_users = db.query(func.count(User.id)).scalar()
-        total_drivers = db.query(func.count(Driver.id)).scalar()
-        pending_taxi = db.query(func.count(TaxiOrder.id)).filter(
+        total_users = await db.scalar(select(func.count(User.id)))
+        total_drivers = await db.scalar(select(func.count(Driver.id)))
+        pending_taxi = await db.scalar(select(func.count(TaxiOrder.id)).where(
             TaxiOrder.status == "pending"
-        ).scalar()
-        pending_delivery = db.query(func.count(DeliveryOrder.id)).filter(
+        ))
+        pending_delivery = await db.scalar(select(func.count(DeliveryOrder.id)).where(
             DeliveryOrder.status == "pending"
-        ).scalar()
+        ))
         
         text = f"""
 📊 *Statistics*
@@ -163,13 +197,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data.startswith("approve_"):
         # Approve driver application
         app_id = int(data.split("_")[1])
-        application = db.query(DriverApplication).filter(
-            DriverApplication.id == app_id
-        ).first()
+        application = await db.get(DriverApplication, app_id)
         
         if application and application.status == ApplicationStatus.PENDING:
             # Create driver profile
-            from app.models import Driver
             new_driver = Driver(
                 user_id=application.user_id,
                 full_name=application.full_name,
@@ -183,11 +214,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             application.status = ApplicationStatus.APPROVED
             
             # Update user role
-            user = db.query(User).filter(User.id == application.user_id).first()
+            user = await db.get(User, application.user_id)
             if user:
                 user.role = UserRole.DRIVER
             
-            db.commit()
+            await db.commit()
+            invalidate_pages(context.user_data, "apps")
             
             await query.edit_message_text(
                 f"✅ Application #{app_id} approved successfully!"
@@ -218,41 +250,46 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=reply_markup,
             parse_mode="Markdown"
         )
-    
-    db.close()
 
 
-async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@with_db
+async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE, db: AsyncSession):
     """Handle text messages (for rejection reasons, broadcast messages, etc.)"""
     if 'rejecting_app' in context.user_data:
         app_id = context.user_data['rejecting_app']
         reason = update.message.text
         
-        db = SessionLocal()
-        application = db.query(DriverApplication).filter(
-            DriverApplication.id == app_id
-        ).first()
+        application = await db.get(DriverApplication, app_id)
         
         if application:
             application.status = ApplicationStatus.REJECTED
             application.rejection_reason = reason
-            db.commit()
+            await db.commit()
+            invalidate_pages(context.user_data, "apps")
             
             await update.message.reply_text(
                 f"✅ Application #{app_id} rejected with reason: {reason}"
             )
         
-        db.close()
         del context.user_data['rejecting_app']
 
 
-def main():
-    """Run the admin bot"""
-    application = Application.builder().token(settings.ADMIN_BOT_TOKEN).build()
+def build_application(builder=None) -> Application:
+    """Admin bot application with its handlers"""
+    builder = builder or Application.builder().token(settings.ADMIN_BOT_TOKEN).base_url(settings.TELEGRAM_API_BASE_URL)
+    application = builder.concurrent_updates(
+        ChatSerialUpdateProcessor(settings.BOT_CONCURRENT_UPDATES)
+    ).build()
     
     application.add_handler(CommandHandler('start', admin_start))
     application.add_handler(CallbackQueryHandler(handle_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    return application
+
+
+def main():
+    """Run the admin bot"""
+    application = build_application()
     
     logger.info("Starting Admin Telegram bot...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
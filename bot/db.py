@@ -0,0 +1,44 @@
+"""
+Async database access for the Telegram bots
+Handlers run on the bot's event loop, so a blocking SessionLocal() query there
+stalls every chat the bot serves. The bots use their own async engine (asyncpg,
+or aiosqlite for SQLite) and each update gets its own session via `with_db`.
+"""
+import functools
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from app.config import settings
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_url(database_url: str) -> URL:
+    """DATABASE_URL with its driver swapped for an asyncio one"""
+    url = make_url(database_url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def _create_engine():
+    url = async_database_url(settings.DATABASE_URL)
+    if url.get_backend_name() == "sqlite":
+        return create_async_engine(url)
+    return create_async_engine(
+        url,
+        pool_size=settings.BOT_DB_POOL_SIZE,
+        max_overflow=settings.BOT_DB_POOL_SIZE,
+        pool_pre_ping=True
+    )
+
+
+engine = _create_engine()
+# expire_on_commit=False: handlers read attributes after committing, which would otherwise need a query
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def with_db(handler):
+    """Give a handler a session scoped to the update: handler(update, context, db)"""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        async with AsyncSessionLocal() as db:
+            return await handler(update, context, db)
+    return wrapper
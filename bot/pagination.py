@@ -0,0 +1,119 @@
+"""
+Paginated inline-keyboard lists for the bots
+Lists are paged with a keyset cursor on id: each tap runs one
+"WHERE id > :cursor ORDER BY id LIMIT n + 1" query (the extra row tells whether
+there is another page), however long the list. Rendered pages are kept in the
+chat's user_data for PAGE_CACHE_TTL seconds, so paging back and forth does not
+query again.
+
+Callback data: "page:<list>:<n|p>:<cursor id or ->:<page number>"
+(n = the page after the cursor, p = the page before it).
+"""
+from collections import OrderedDict
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+import time
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+PAGE_CACHE_TTL = 60  # seconds a rendered page is reused
+PAGE_CACHE_SIZE = 30  # pages kept per chat
+
+
+class PagedList(NamedTuple):
+    title: str
+    empty: str
+    model: Any
+    render: Callable[[Any], str]  # one item as HTML
+    criteria: Optional[Callable[[], Any]] = None  # WHERE clause
+    buttons: Optional[Callable[[Any], List[InlineKeyboardButton]]] = None  # one keyboard row per item
+    newest_first: bool = False
+    page_size: int = 5
+
+
+def page_callback(name: str, direction: str, cursor: Optional[int], page: int) -> str:
+    return f"page:{name}:{direction}:{'-' if cursor is None else cursor}:{page}"
+
+
+def parse_page_callback(data: str) -> Tuple[str, str, Optional[int], int]:
+    """(list name, direction, cursor, page number) from callback data made by page_callback()"""
+    _, name, direction, cursor, page = data.split(":")
+    return name, direction, None if cursor == "-" else int(cursor), int(page)
+
+
+async def fetch_page(db: AsyncSession, spec: PagedList, direction: str, cursor: Optional[int]) -> Tuple[list, bool]:
+    """One page of items in display order, and whether the list goes on in `direction`"""
+    model = spec.model
+    forward = direction == "n"
+    ascending = forward != spec.newest_first
+    query = select(model)
+    if spec.criteria is not None:
+        query = query.where(spec.criteria())
+    if cursor is not None:
+        query = query.where(model.id > cursor if ascending else model.id < cursor)
+    query = query.order_by(model.id.asc() if ascending else model.id.desc()).limit(spec.page_size + 1)
+
+    items = list((await db.scalars(query)).all())
+    more = len(items) > spec.page_size
+    items = items[:spec.page_size]
+    if not forward:
+        items.reverse()
+    return items, more
+
+
+def render_page(spec: PagedList, name: str, items: list, page: int, has_prev: bool, has_next: bool) -> Tuple[str, InlineKeyboardMarkup]:
+    text = f"<b>{spec.title}</b> (page {page})\n\n" + "\n\n".join(spec.render(item) for item in items)
+    keyboard = [spec.buttons(item) for item in items] if spec.buttons else []
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton("⬅️ Previous", callback_data=page_callback(name, "p", items[0].id, page - 1)))
+    if has_next:
+        navigation.append(InlineKeyboardButton("Next ➡️", callback_data=page_callback(name, "n", items[-1].id, page + 1)))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="back_to_menu")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def get_page(
+    db: AsyncSession,
+    user_data: dict,
+    spec: PagedList,
+    name: str,
+    direction: str = "n",
+    cursor: Optional[int] = None,
+    page: int = 1
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Rendered page (text, keyboard), from the chat's page cache when fresh"""
+    cache: OrderedDict = user_data.setdefault("page_cache", OrderedDict())
+    key = (name, direction, cursor)
+    cached = cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        cache.move_to_end(key)
+        return cached[1], cached[2]
+
+    items, more = await fetch_page(db, spec, direction, cursor)
+    if not items:
+        if cursor is None:
+            return spec.empty, InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="back_to_menu")]])
+        # The page emptied since it was linked (e.g. applications reviewed): start over
+        return await get_page(db, user_data, spec, name)
+
+    if direction == "n":
+        has_prev, has_next = cursor is not None and page > 1, more
+    else:
+        has_prev, has_next = more, True
+    text, markup = render_page(spec, name, items, page, has_prev, has_next)
+
+    cache[key] = (time.monotonic() + PAGE_CACHE_TTL, text, markup)
+    while len(cache) > PAGE_CACHE_SIZE:
+        cache.popitem(last=False)
+    return text, markup
+
+
+def invalidate_pages(user_data: dict, name: str):
+    """Drop cached pages of a list after changing what it shows"""
+    cache = user_data.get("page_cache")
+    if cache:
+        for key in [key for key in cache if key[0] == name]:
+            del cache[key]
@@ -0,0 +1,51 @@
+"""
+Update processing for the Telegram bots
+python-telegram-bot handles updates one at a time by default, so a single slow
+handler holds up every chat. The bots process up to BOT_CONCURRENT_UPDATES
+updates at once; updates from the same chat still run one after another, in
+order, so conversation state never races.
+"""
+import asyncio
+from typing import Any, Awaitable, Dict
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatSerialUpdateProcessor(BaseUpdateProcessor):
+    """Concurrent across chats, sequential within a chat"""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_pending: Dict[int, int] = {}
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        Overrides the base class, which takes a concurrency slot before calling
+        do_process_update: here the chat's lock comes first, so a burst from one
+        chat waits without holding the slots every other chat needs.
+        """
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lock = self._chat_locks.setdefault(chat.id, asyncio.Lock())
+        self._chat_pending[chat.id] = self._chat_pending.get(chat.id, 0) + 1
+        try:
+            # asyncio.Lock wakes waiters first come, first served
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._chat_pending[chat.id] -= 1
+            if not self._chat_pending[chat.id]:
+                del self._chat_pending[chat.id]
+                del self._chat_locks[chat.id]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -11,11 +11,13 @@ from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
     ConversationHandler, filters, ContextTypes
 )
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import User, Region, District, TaxiOrder, DeliveryOrder, Language, UserRole
 from app.config import settings
 from decimal import Decimal
+from bot.db import with_db
+from bot.updates import ChatSerialUpdateProcessor
 
 # Enable logging
 logging.basicConfig(
@@ -46,14 +48,6 @@ logger = logging.getLogger(__name__)
 ) = range(22, 34)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        return db
-    finally:
-        db.close()
-
-
 def get_main_keyboard(language: str = "uz_latin"):
     """Get main menu keyboard based on language"""
     keyboards = {
@@ -84,15 +78,14 @@ def get_language_keyboard():
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@with_db
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE, db: AsyncSession):
     """Start command handler"""
     user = update.effective_user
     chat_id = str(update.effective_chat.id)
     
-    db = SessionLocal()
-    
     # Check if user exists
-    db_user = db.query(User).filter(User.telegram_chat_id == chat_id).first()
+    db_user = await db.scalar(select(User).where(User.telegram_chat_id == chat_id))
     
     if not db_user:
         # New user - ask for language
@@ -100,7 +93,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "🌐 Tilni tanlang / Выберите язык:",
             reply_markup=get_language_keyboard()
         )
-        db.close()
         return LANGUAGE_SELECTION
     else:
         # Existing user
@@ -115,7 +107,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             welcome_messages.get(language, welcome_messages["uz_latin"]),
             reply_markup=get_main_keyboard(language)
         )
-        db.close()
         return MAIN_MENU
 
 
@@ -191,10 +182,12 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
-def main():
-    """Run the bot"""
-    # Create application
-    application = Application.builder().token(settings.USER_BOT_TOKEN).build()
+def build_application(builder=None) -> Application:
+    """User bot application with its handlers"""
+    builder = builder or Application.builder().token(settings.USER_BOT_TOKEN).base_url(settings.TELEGRAM_API_BASE_URL)
+    application = builder.concurrent_updates(
+        ChatSerialUpdateProcessor(settings.BOT_CONCURRENT_UPDATES)
+    ).build()
     
     # Add conversation handler
     conv_handler = ConversationHandler(
@@ -208,6 +201,12 @@ def main():
     )
     
     application.add_handler(conv_handler)
+    return application
+
+
+def main():
+    """Run the bot"""
+    application = build_application()
     
     # Run the bot
     logger.info("Starting Telegram bot...")
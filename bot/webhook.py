@@ -0,0 +1,154 @@
+"""
+Webhook mode for the Telegram bots
+With BOT_WEBHOOK_MODE the API process runs both bots instead of two polling
+processes. Telegram POSTs each update to /telegram/{bot}/webhook, the route
+puts it on the bot's update queue and returns at once, and the application
+handles it on the API's event loop with its ChatSerialUpdateProcessor. Both bots
+share one async database pool (bot.db).
+
+Webhook mode needs exactly one API worker: conversation state and
+context.user_data (the admin reject/broadcast flows, the list page cache) live
+in the process that handled a chat's previous update, so spreading one chat's
+updates over several workers would break them. A second worker on the host
+refuses to start (see claim_single_worker). The webhook is left in place on
+shutdown so restarts lose nothing.
+"""
+from pathlib import Path
+from typing import Dict, Optional, TextIO
+import asyncio
+import hashlib
+import hmac
+import os
+import tempfile
+from fastapi import APIRouter, HTTPException, Request, status
+from telegram import Update
+from telegram.ext import Application
+from app.config import settings
+from bot import admin_bot, user_bot
+from bot.db import engine
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+router = APIRouter(prefix="/telegram", tags=["Telegram"], include_in_schema=False)
+
+BOTS = {
+    "user": (user_bot.build_application, lambda: settings.USER_BOT_TOKEN),
+    "admin": (admin_bot.build_application, lambda: settings.ADMIN_BOT_TOKEN),
+}
+
+# Running applications by bot name (empty unless webhook mode is on)
+applications: Dict[str, Application] = {}
+
+# Seconds a starting worker waits for the lock, e.g. while the worker it replaces shuts down
+WORKER_LOCK_WAIT = 30
+
+# Open lock file held while this process runs the bots
+_worker_lock: Optional[TextIO] = None
+
+
+class MultipleWorkersError(RuntimeError):
+    """Webhook mode was started in more than one API worker"""
+
+
+def _lock_path() -> Path:
+    digest = hashlib.sha256(settings.BOT_WEBHOOK_URL.encode()).hexdigest()[:16]
+    return Path(tempfile.gettempdir()) / f"taxi-bot-webhook-{digest}.lock"
+
+
+async def claim_single_worker():
+    """
+    Make sure this is the only worker running the bots on this host.
+    Holds an exclusive lock on a file for as long as the bots run; a worker that
+    can't take it within WORKER_LOCK_WAIT seconds raises MultipleWorkersError,
+    which fails its startup (gunicorn then stops the whole server).
+    """
+    global _worker_lock
+    if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+        raise MultipleWorkersError("BOT_WEBHOOK_MODE needs a single API worker, but WEB_CONCURRENCY is above 1")
+    try:
+        import fcntl
+    except ImportError:
+        return  # no flock (Windows): only the WEB_CONCURRENCY check applies
+
+    lock_file = open(_lock_path(), "w")
+    deadline = asyncio.get_running_loop().time() + WORKER_LOCK_WAIT
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            if asyncio.get_running_loop().time() >= deadline:
+                lock_file.close()
+                raise MultipleWorkersError(
+                    "BOT_WEBHOOK_MODE needs a single API worker, but another worker is running the bots "
+                    "(run one worker, or run bot/user_bot.py and bot/admin_bot.py in polling mode)"
+                )
+            await asyncio.sleep(0.5)
+    _worker_lock = lock_file
+
+
+def _release_worker_lock():
+    global _worker_lock
+    if _worker_lock is not None:
+        _worker_lock.close()
+        _worker_lock = None
+
+
+def webhook_url(name: str) -> str:
+    return f"{settings.BOT_WEBHOOK_URL.rstrip('/')}/telegram/{name}/webhook"
+
+
+async def start_bots():
+    """Start both bots and point their webhooks at this API"""
+    if not settings.BOT_WEBHOOK_SECRET or not settings.BOT_WEBHOOK_URL:
+        # Without the secret anyone could post updates posing as an admin chat
+        print("⚠️ BOT_WEBHOOK_MODE needs BOT_WEBHOOK_URL and BOT_WEBHOOK_SECRET, bots not started")
+        return
+    await claim_single_worker()
+    for name, (build, token) in BOTS.items():
+        try:
+            builder = Application.builder().token(token()).base_url(settings.TELEGRAM_API_BASE_URL)
+            application = build(builder.updater(None))
+            await application.initialize()
+            await application.start()
+            applications[name] = application
+            await application.bot.set_webhook(
+                webhook_url(name),
+                secret_token=settings.BOT_WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=100
+            )
+            print(f"🤖 {name.capitalize()} bot receiving updates at {webhook_url(name)}")
+        except Exception as e:
+            print(f"⚠️ Could not start the {name} bot in webhook mode: {e}")
+
+
+async def stop_bots():
+    for name, application in list(applications.items()):
+        try:
+            await application.stop()
+            await application.shutdown()
+        except Exception as e:
+            print(f"⚠️ Error stopping the {name} bot: {e}")
+    applications.clear()
+    await engine.dispose()
+    _release_worker_lock()
+
+
+@router.post("/{name}/webhook")
+async def receive_update(name: str, request: Request):
+    """Telegram update for one of the bots; handled in the background"""
+    application = applications.get(name)
+    if application is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Bot not found"
+        )
+    if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), settings.BOT_WEBHOOK_SECRET):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid secret token"
+        )
+    update = Update.de_json(await request.json(), application.bot)
+    await application.update_queue.put(update)
+    return {"ok": True}
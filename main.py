@@ -1,12 +1,22 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from app.database import engine, Base, SessionLocal
 from app.routers import (
     auth, taxi_orders, delivery_orders, driver,
-    admin, ratings, regions, notifications, feedback, websocket
+    admin, ratings, regions, notifications, feedback, websocket, reports,
+    uploads, metrics
 )
 from app.config import settings
 from app.websocket import manager
+from app.matching import matcher
+from app.dispatch import dispatcher
+from app.scheduler import expiry_scheduler, release_queue
+from app.outbox import outbox_relay
+from app.serializers import ORJSONResponse
+from app.images import image_processor
+from app.telegram_queue import user_bot_queue, admin_bot_queue
+from app.metrics import MetricsMiddleware, metrics_sampler
+from app.models import Driver
 from contextlib import asynccontextmanager
 
 
@@ -16,10 +26,35 @@ async def lifespan(app: FastAPI):
     # Startup: Initialize Redis
     print("🚀 Starting up Taxi Service API...")
     await manager.init_redis()
+    manager.start_heartbeat()
+    db = SessionLocal()
+    try:
+        await matcher.load_blocked(d for (d,) in db.query(Driver.id).filter(Driver.is_blocked == True))
+    finally:
+        db.close()
+    outbox_relay.start()
+    await expiry_scheduler.start()
+    await release_queue.start()
+    await user_bot_queue.start()
+    await admin_bot_queue.start()
+    if settings.METRICS_ENABLED:
+        metrics_sampler.start()
+    if settings.BOT_WEBHOOK_MODE:
+        await bot_webhook.start_bots()
     yield
     # Shutdown: Cleanup Redis
     print("🛑 Shutting down Taxi Service API...")
+    if settings.BOT_WEBHOOK_MODE:
+        await bot_webhook.stop_bots()
+    await release_queue.shutdown()
+    await expiry_scheduler.shutdown()
+    await dispatcher.shutdown()
+    await outbox_relay.shutdown()
+    await user_bot_queue.shutdown()
+    await admin_bot_queue.shutdown()
+    image_processor.shutdown()
     await manager.cleanup()
+    await metrics_sampler.shutdown()
 
 
 # Create database tables
@@ -29,7 +64,8 @@ app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     description="Taxi Service API with comprehensive features for users, drivers, and admins",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -51,8 +87,19 @@ app.include_router(ratings.router)
 app.include_router(regions.router)
 app.include_router(notifications.router)
 app.include_router(feedback.router)
+app.include_router(reports.router)
+app.include_router(uploads.router)
 app.include_router(websocket.router)  # WebSocket router
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics.router)
+
+if settings.BOT_WEBHOOK_MODE:
+    # Both Telegram bots run in this process (see bot/webhook.py)
+    from bot import webhook as bot_webhook
+    app.include_router(bot_webhook.router)
+
 
 @app.get("/")
 def root():
@@ -36,10 +36,13 @@ async def test_websocket():
             print("📤 Sending ping...")
             await websocket.send(json.dumps({"type": "ping"}))
             
-            # 3. Receive pong
+            # 3. Receive pong (answering any server heartbeat that arrives first)
             print("⏳ Waiting for pong...")
-            response = await websocket.recv()
-            pong_data = json.loads(response)
+            while True:
+                pong_data = json.loads(await websocket.recv())
+                if pong_data.get("type") != "heartbeat":
+                    break
+                await websocket.send(json.dumps({"type": "pong"}))
             print(f"📩 Received: {json.dumps(pong_data, indent=2)}")
             print()
             
@@ -60,6 +63,8 @@ async def test_websocket():
                     message = await asyncio.wait_for(websocket.recv(), timeout=5.0)
                     msg_data = json.loads(message)
                     print(f"📩 Received: {json.dumps(msg_data, indent=2)}")
+                    if msg_data.get("type") == "heartbeat":
+                        await websocket.send(json.dumps({"type": "pong"}))
             except asyncio.TimeoutError:
                 print("⏱️  Timeout - no more messages")
             
@@ -0,0 +1,102 @@
+"""
+Test setup: the app runs against a throwaway SQLite file, with no Redis, no
+bots and Celery tasks run inline. Run with: python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{Path(tempfile.mkdtemp()) / 'test.db'}",
+    "REDIS_URL": "redis://localhost:1/0",
+    "CELERY_TASK_ALWAYS_EAGER": "true",
+    "USER_BOT_TOKEN": "", "ADMIN_BOT_TOKEN": "", "BOT_WEBHOOK_MODE": "false",
+})
+for key, value in {"SECRET_KEY": "test", "TELEGRAM_ADMIN_CHAT_ID": "0"}.items():
+    os.environ.setdefault(key, value)
+
+from app.database import Base, SessionLocal, engine
+from app.models import District, OrderStatus, Region, TaxiOrder, User
+
+T0 = datetime(2026, 1, 1, 9, tzinfo=timezone.utc)
+
+
+def add_order(db, status=OrderStatus.PENDING, **fields) -> TaxiOrder:
+    order = TaxiOrder(
+        user_id=1, username="Customer", telephone="+998900000001",
+        from_region_id=1, from_district_id=1, to_region_id=1, to_district_id=1,
+        passengers=1, date="01.01.2026", time_start="12:00", time_end="13:00",
+        price=Decimal("100000"), service_fee=Decimal("10000"), driver_earnings=Decimal("90000"),
+        status=status, **fields
+    )
+    db.add(order)
+    db.commit()
+    return order
+
+
+class FakeClock:
+    """time.time() stand-in that only moves when a test moves it"""
+
+    def __init__(self, start: datetime = T0):
+        self.now = start.timestamp()
+
+    def __call__(self) -> float:
+        return self.now
+
+    def set(self, moment: datetime):
+        self.now = moment.timestamp()
+
+
+class FakeDispatcher:
+    """Records what the order timers ask the dispatch engine to do"""
+
+    def __init__(self):
+        self.nearby = []  # drivers every first wave finds
+        self.started = []
+        self.closed = []
+
+    async def first_wave(self, pickup):
+        return list(self.nearby)
+
+    async def start(self, order_type, order_id, payload, pickup, created_at=None, first_wave=()):
+        self.started.append((order_type, order_id))
+
+    def close(self, order_type, order_id, accepted_by=None):
+        self.closed.append((order_type, order_id))
+
+
+@pytest.fixture
+def db():
+    """Fresh tables with one customer, region and district"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    session.add(Region(id=1, name_uz_latin="Toshkent", name_uz_cyrillic="Тошкент", name_russian="Ташкент"))
+    session.add(District(id=1, region_id=1, name_uz_latin="Center", name_uz_cyrillic="Center", name_russian="Center"))
+    session.add(User(id=1, telephone="+998900000001", name="Customer", hashed_password="x"))
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def dispatcher():
+    return FakeDispatcher()
+
+
+@pytest.fixture
+def run():
+    """Runs a coroutine on a fresh event loop"""
+    return asyncio.run
@@ -0,0 +1,20 @@
+"""Bucket arithmetic of the order analytics endpoint"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.analytics import BUCKETS, bucket_count, bucket_range
+
+START = datetime(2026, 3, 4, 17, 25, tzinfo=timezone.utc)  # a Wednesday
+
+
+@pytest.mark.parametrize("bucket", BUCKETS)
+@pytest.mark.parametrize("minutes", [1, 35, 60, 61, 1440, 1441, 10080, 20000, 50000])
+def test_bucket_count_matches_bucket_range(bucket, minutes):
+    end = START + timedelta(minutes=minutes)
+    assert bucket_count(START, end, bucket) == len(bucket_range(START, end, bucket))
+
+
+def test_bucket_count_of_a_huge_range_is_computed_without_building_it():
+    start = datetime(1, 1, 1, tzinfo=timezone.utc)
+    assert bucket_count(start, START, "hour") == (START - start) // timedelta(hours=1) + 1
@@ -0,0 +1,34 @@
+"""Per-chat ordering and cross-chat concurrency of the bots' update processor"""
+import asyncio
+from types import SimpleNamespace
+
+from bot.updates import ChatSerialUpdateProcessor
+
+
+def update(chat_id: int):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id))
+
+
+def test_a_burst_from_one_chat_does_not_stall_other_chats():
+    async def scenario():
+        processor = ChatSerialUpdateProcessor(max_concurrent_updates=2)
+        release = asyncio.Event()
+        done = []
+
+        async def handle(name, wait=False):
+            if wait:
+                await release.wait()
+            done.append(name)
+
+        burst = [asyncio.create_task(processor.process_update(update(1), handle(f"a{n}", wait=True))) for n in range(5)]
+        await asyncio.sleep(0)
+        # Only one of chat 1's updates holds a slot; chat 2 gets the other right away
+        await asyncio.wait_for(processor.process_update(update(2), handle("b")), timeout=1)
+        assert done == ["b"]
+
+        release.set()
+        await asyncio.gather(*burst)
+        assert done == ["b", "a0", "a1", "a2", "a3", "a4"]
+        assert processor._chat_locks == {} and processor._chat_pending == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+"""Webhook mode refuses to run the bots in more than one API worker"""
+import asyncio
+
+import pytest
+
+from bot import webhook
+
+
+@pytest.fixture
+def lock(monkeypatch, tmp_path):
+    monkeypatch.setattr(webhook, "_lock_path", lambda: tmp_path / "webhook.lock")
+    monkeypatch.setattr(webhook, "WORKER_LOCK_WAIT", 0)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    yield
+    webhook._release_worker_lock()
+
+
+def test_second_worker_is_refused(lock):
+    asyncio.run(webhook.claim_single_worker())
+    first = webhook._worker_lock
+    webhook._worker_lock = None  # as seen from another worker process
+
+    with pytest.raises(webhook.MultipleWorkersError):
+        asyncio.run(webhook.claim_single_worker())
+
+    first.close()
+    asyncio.run(webhook.claim_single_worker())  # free again once the first worker stops
+
+
+def test_web_concurrency_above_one_is_refused(lock, monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(webhook.MultipleWorkersError):
+        asyncio.run(webhook.claim_single_worker())
@@ -0,0 +1,90 @@
+"""Dispatch waves: who an order is offered to, and when it falls back to a broadcast"""
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from app.config import settings
+from app.dispatch import DispatchEngine
+from app.models import OutboxEvent
+from tests.conftest import add_order
+
+PICKUP = (41.311081, 69.240562)
+
+
+class FakeManager:
+    redis_pool = None
+
+    def __init__(self):
+        self.sent = []  # (driver_id or "all", message)
+
+    async def send_to_driver(self, driver_id, message):
+        self.sent.append((driver_id, message))
+
+    async def broadcast_to_all_drivers(self, message):
+        self.sent.append(("all", message))
+
+
+class FakeMatcher:
+    """Returns the given driver ids for each wave in turn (nobody once they run out)"""
+
+    def __init__(self, *waves):
+        self.waves = list(waves)
+        self.searches = 0
+
+    async def find_nearest(self, lat, lng, k=10, radius_km=None, exclude=()):
+        self.searches += 1
+        drivers = self.waves.pop(0) if self.waves else []
+        return [(driver_id, 1.0) for driver_id in drivers if driver_id not in exclude]
+
+
+async def dispatch(matcher, manager, settle: float = 0.05):
+    engine = DispatchEngine(manager, matcher)
+    first_wave = await engine.first_wave(PICKUP)
+    await engine.start("taxi", 1, {"id": 1, "type": "taxi"}, PICKUP, datetime.now(timezone.utc), first_wave)
+    await asyncio.sleep(settle)
+    return engine
+
+
+def test_pickup_with_no_drivers_nearby_is_announced_to_everyone(db):
+    order = add_order(db, released_at=datetime.now(timezone.utc), pickup_latitude=PICKUP[0], pickup_longitude=PICKUP[1])
+
+    async def scenario():
+        manager = FakeManager()
+        engine = DispatchEngine(manager, FakeMatcher())
+        first_wave = await engine.announce(db, "taxi", order)
+        db.commit()
+        assert first_wave == []
+        await engine.start("taxi", order.id, {"id": order.id, "type": "taxi"}, PICKUP, order.released_at, first_wave)
+        await asyncio.sleep(0.05)
+        # The broadcast went out through the outbox, not from memory
+        assert manager.sent == []
+        assert engine.active[("taxi", order.id)].broadcast
+        assert await engine.may_lock("taxi", order.id, driver_id=42)
+        assert await engine.lockable_orders(42, [("taxi", order.id)]) == {("taxi", order.id)}
+        await engine.shutdown()
+
+    asyncio.run(scenario())
+    (event,) = db.query(OutboxEvent).all()
+    assert event.stream == "drivers"
+    message = json.loads(event.payload)
+    assert (message["type"], message["wave"], message["order"]["id"]) == ("new_order", 0, order.id)
+
+
+def test_empty_wave_is_skipped_without_waiting(db, monkeypatch):
+    order = add_order(db, released_at=datetime.now(timezone.utc))
+    assert order.id == 1
+    monkeypatch.setattr(settings, "DISPATCH_WAVE_TIMEOUT", 0.2)
+
+    async def scenario():
+        manager = FakeManager()
+        matcher = FakeMatcher([1, 2], [], [3])
+        engine = await dispatch(matcher, manager, settle=0.3)
+        # Wave 1 (announced through the outbox) timed out, wave 2 found nobody new
+        # and wave 3 went out straight after it
+        assert [(to, message["wave"]) for to, message in manager.sent] == [(3, 3)]
+        assert matcher.searches == 3
+        assert engine.active[("taxi", 1)].offered == {1, 2, 3}
+        assert not await engine.may_lock("taxi", 1, driver_id=42)
+        await engine.shutdown()
+
+    asyncio.run(scenario())
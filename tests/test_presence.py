@@ -0,0 +1,52 @@
+"""Cross-node presence counts in Redis (fakeredis)"""
+import asyncio
+import time
+
+import fakeredis
+
+import app.websocket as websocket
+from app.config import settings
+from app.websocket import ConnectionManager
+
+
+def node(server) -> ConnectionManager:
+    manager = ConnectionManager()
+    manager.redis_pool = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    return manager
+
+
+def test_driver_stays_present_until_every_node_has_dropped_it(monkeypatch):
+    async def scenario():
+        server = fakeredis.FakeServer()
+        a, b = node(server), node(server)
+
+        monkeypatch.setattr(websocket, "NODE_ID", "a")
+        await a._mark_present("driver", 5)
+        await a._mark_present("driver", 6)
+        monkeypatch.setattr(websocket, "NODE_ID", "b")
+        await b._mark_present("driver", 5)
+        assert await a.get_active_driver_count() == 2
+
+        await b._mark_absent("driver", 5)  # still connected to node a
+        assert await a.get_active_driver_count() == 2
+        monkeypatch.setattr(websocket, "NODE_ID", "a")
+        await a._mark_absent("driver", 5)
+        assert await a.get_active_driver_count() == 1
+        assert await a.get_active_user_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_entries_older_than_the_ttl_are_not_counted_before_they_are_pruned():
+    async def scenario():
+        manager = node(fakeredis.FakeServer())
+        now = time.time()
+        # Left behind by a node that crashed two TTLs ago
+        await manager.redis_pool.zadd("presence:drivers", {"7": now - 2 * settings.WS_PRESENCE_TTL})
+        await manager._mark_present("driver", 8)
+        assert await manager.get_active_driver_count() == 1
+
+        await manager._refresh_presence()
+        assert await manager.redis_pool.zrange("presence:drivers", 0, -1) == ["8"]
+
+    asyncio.run(scenario())
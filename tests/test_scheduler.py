@@ -0,0 +1,96 @@
+"""Release and expiry timing of the order timers, driven by a fake clock"""
+from datetime import timedelta
+import json
+
+from app.config import settings
+from app.models import Notification, OrderStatus, OutboxEvent, TaxiOrder
+from app.scheduler import EXPIRY_REASON, OrderExpiryScheduler, OrderReleaseQueue, release_time
+from app.utils import ORDER_ACCEPT_WINDOW, as_utc
+from tests.conftest import T0, add_order
+
+SCHEDULED_FOR = T0 + timedelta(hours=3)
+
+
+def reload(db, order: TaxiOrder) -> TaxiOrder:
+    db.expire_all()
+    return db.get(TaxiOrder, order.id)
+
+
+def make_queues(clock, dispatcher):
+    expiry = OrderExpiryScheduler(dispatcher, clock=clock)
+    return expiry, OrderReleaseQueue(dispatcher, expiry, clock=clock)
+
+
+def test_scheduled_order_is_held_until_lead_time(db, clock, dispatcher, run):
+    order = add_order(db, scheduled_datetime=SCHEDULED_FOR)
+    expiry, queue = make_queues(clock, dispatcher)
+    release_at = SCHEDULED_FOR - timedelta(seconds=settings.SCHEDULED_ORDER_LEAD_TIME)
+    assert release_time(SCHEDULED_FOR) == release_at
+
+    run(queue.submit("taxi", order))
+    assert dispatcher.started == []
+    assert len(queue) == 1
+
+    # One second early: neither the heap nor the database sweep releases it
+    clock.set(release_at - timedelta(seconds=1))
+    run(queue.run_due())
+    assert dispatcher.started == []
+    assert reload(db, order).released_at is None
+
+
+def test_scheduled_order_is_released_exactly_once(db, clock, dispatcher, run):
+    order = add_order(db, scheduled_datetime=SCHEDULED_FOR)
+    expiry, queue = make_queues(clock, dispatcher)
+    release_at = SCHEDULED_FOR - timedelta(seconds=settings.SCHEDULED_ORDER_LEAD_TIME)
+    run(queue.submit("taxi", order))
+    dispatcher.nearby = [7, 8]
+
+    clock.set(release_at)
+    run(queue.run_due())
+    assert dispatcher.started == [("taxi", order.id)]
+    assert as_utc(reload(db, order).released_at) == release_at
+    assert len(expiry) == 1  # its acceptance window is now being timed
+    # The first wave's announcement was committed together with the release
+    events = db.query(OutboxEvent).order_by(OutboxEvent.id).all()
+    assert [event.stream for event in events] == ["driver:7", "driver:8"]
+    assert {(m["type"], m["wave"], m["order"]["id"]) for m in (json.loads(e.payload) for e in events)} == {("new_order", 1, order.id)}
+
+    # A duplicate heap entry (e.g. loaded again after a restart) and later sweeps must not release it again
+    queue._push(release_at, "taxi", order.id)
+    for minutes in (1, 5, 30):
+        clock.set(release_at + timedelta(minutes=minutes, seconds=settings.ORDER_TIMER_SWEEP_INTERVAL))
+        run(queue.run_due())
+    assert dispatcher.started.count(("taxi", order.id)) == 1
+    assert db.query(OutboxEvent).count() == 2
+
+
+def test_overdue_scheduled_order_is_found_by_the_sweep(db, clock, dispatcher, run):
+    # Created on another node (never submitted here) and already inside the lead time
+    order = add_order(db, scheduled_datetime=T0 + timedelta(minutes=30))
+    expiry, queue = make_queues(clock, dispatcher)
+
+    run(queue.run_due())
+    assert dispatcher.started == [("taxi", order.id)]
+    assert reload(db, order).released_at is not None
+
+
+def test_expiry_cancels_only_pending_orders(db, clock, dispatcher, run):
+    pending = add_order(db, released_at=T0)
+    accepted = add_order(db, released_at=T0, status=OrderStatus.ACCEPTED, accepted_at=T0 + timedelta(minutes=1))
+    expiry, _ = make_queues(clock, dispatcher)
+    for order in (pending, accepted):
+        expiry.schedule("taxi", order.id, order.released_at)
+
+    clock.set(T0 + ORDER_ACCEPT_WINDOW - timedelta(seconds=1))
+    run(expiry.run_due())
+    assert reload(db, pending).status == OrderStatus.PENDING
+    assert dispatcher.closed == []
+
+    clock.set(T0 + ORDER_ACCEPT_WINDOW)
+    run(expiry.run_due())
+    expired = reload(db, pending)
+    assert expired.status == OrderStatus.CANCELLED
+    assert expired.cancellation_reason == EXPIRY_REASON
+    assert reload(db, accepted).status == OrderStatus.ACCEPTED
+    assert dispatcher.closed == [("taxi", pending.id)]
+    assert db.query(Notification).filter(Notification.notification_type == "order_expired").count() == 1
@@ -0,0 +1,34 @@
+"""Range header handling for uploaded files"""
+import pytest
+from fastapi import HTTPException
+
+from app.routers.uploads import _parse_range
+
+SIZE = 100
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=99-99", (99, 99)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert _parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "items=0-9", "bytes=", "bytes=-", "bytes=5-3", "bytes=a-b", "bytes=1-2,4-5", "bytes=+1-2", "bytes=0-٩",
+])
+def test_invalid_ranges_are_ignored(header):
+    assert _parse_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header, size", [("bytes=100-", SIZE), ("bytes=500-600", SIZE), ("bytes=-0", SIZE), ("bytes=0-", 0)])
+def test_unsatisfiable_ranges_get_416(header, size):
+    with pytest.raises(HTTPException) as error:
+        _parse_range(header, size)
+    assert error.value.status_code == 416
+    assert error.value.headers["content-range"] == f"bytes */{size}"